@@ -0,0 +1,105 @@
+import datetime
+from typing import Dict, Iterable, Iterator, Optional
+
+
+class TransactionEntry:
+    __slots__ = ("transaction_id", "status", "first_lsn", "last_lsn", "start_time")
+
+    def __init__(
+        self,
+        transaction_id: int,
+        status: str = "ACTIVE",
+        first_lsn: Optional[int] = None,
+        last_lsn: Optional[int] = None,
+        start_time: Optional[datetime.datetime] = None,
+    ):
+        self.transaction_id = transaction_id
+        self.status = status
+        self.first_lsn = first_lsn
+        self.last_lsn = last_lsn
+        self.start_time = start_time
+
+    def __repr__(self):
+        return (
+            f"TransactionEntry({self.transaction_id}, {self.status}, "
+            f"first_lsn={self.first_lsn}, last_lsn={self.last_lsn}, start_time={self.start_time})"
+        )
+
+
+class ActiveTransactionTable:
+    """
+    Transactions that have written log records but not committed yet, keyed by transaction id.
+    Membership, insert and remove are O(1), so write_log does constant work per record.
+
+    Serialized form (used in CHECKPOINT records, no eval needed to read it back):
+        ATT=<id>:<status>:<first_lsn>:<last_lsn>:<start epoch seconds>;...
+    Unknown fields are left empty.
+    """
+
+    PREFIX = "ATT="
+
+    def __init__(self, transaction_ids: Optional[Iterable[int]] = None):
+        self.entries: Dict[int, TransactionEntry] = {}
+        for transaction_id in transaction_ids or []:
+            self.entries[transaction_id] = TransactionEntry(transaction_id)
+
+    def __contains__(self, transaction_id) -> bool:
+        return transaction_id in self.entries
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, transaction_id: int) -> Optional[TransactionEntry]:
+        return self.entries.get(transaction_id)
+
+    def touch(
+        self,
+        transaction_id: int,
+        lsn: Optional[int] = None,
+        timestamp: Optional[datetime.datetime] = None,
+        status: Optional[str] = None,
+    ) -> TransactionEntry:
+        """Register a log record of a transaction, adding the transaction on its first record."""
+        entry = self.entries.get(transaction_id)
+        if entry is None:
+            entry = TransactionEntry(transaction_id, first_lsn=lsn, last_lsn=lsn, start_time=timestamp)
+            self.entries[transaction_id] = entry
+        elif lsn is not None:
+            entry.last_lsn = lsn
+        if status is not None:
+            entry.status = status
+        return entry
+
+    def remove(self, transaction_id: int) -> Optional[TransactionEntry]:
+        return self.entries.pop(transaction_id, None)
+
+    def serialize(self) -> str:
+        return self.PREFIX + ";".join(
+            f"{entry.transaction_id}:{entry.status}:"
+            f"{'' if entry.first_lsn is None else entry.first_lsn}:"
+            f"{'' if entry.last_lsn is None else entry.last_lsn}:"
+            f"{'' if entry.start_time is None else entry.start_time.timestamp()}"
+            for entry in self.entries.values()
+        )
+
+    @classmethod
+    def deserialize(cls, text: str) -> "ActiveTransactionTable":
+        table = cls()
+        body = text.strip()
+        if body.startswith(cls.PREFIX):
+            body = body[len(cls.PREFIX):]
+        if not body:
+            return table
+        for item in body.split(";"):
+            transaction_id, status, first_lsn, last_lsn, start_time = item.split(":")
+            table.entries[int(transaction_id)] = TransactionEntry(
+                int(transaction_id),
+                status,
+                int(first_lsn) if first_lsn else None,
+                int(last_lsn) if last_lsn else None,
+                datetime.datetime.fromtimestamp(float(start_time)) if start_time else None,
+            )
+        return table
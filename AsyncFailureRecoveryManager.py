@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from FailureRecoveryManager import ExecutionResult, FailureRecoveryManager
+from RecoverCriteria import RecoverCriteria
+
+
+class AsyncFailureRecoveryManager:
+    """
+    asyncio front-end of a FailureRecoveryManager.
+
+    `await write_log(...)` only queues the record in the event loop. Queued records are handed to the
+    manager in batches (write_log_batch) on a single-thread executor, one batch at a time, so the loop
+    never blocks on the lock or the disk and the log keeps the order records were written in.
+    `await commit(...)` resolves once the batch holding the COMMIT is flushed, and raises if that
+    flush failed; every COMMIT queued while a batch is being written goes into the next one (group commit).
+    Other calls first flush the queue, then run on the same executor.
+    """
+
+    def __init__(self, manager: Optional[FailureRecoveryManager] = None, **kwargs):
+        self.manager = manager if manager is not None else FailureRecoveryManager(**kwargs)
+        self.group_flushes = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wal")
+        self._pending: List[ExecutionResult] = []
+        self._waiters: List[asyncio.Future] = []
+        self._in_flight: Optional[asyncio.Future] = None
+        self._scheduled = False
+
+    async def write_log(self, info: ExecutionResult) -> None:
+        self._pending.append(info)
+        if info.type == "COMMIT":
+            await self._wait_for_flush()
+        elif len(self._pending) >= self.manager.wal_size:
+            self._schedule()
+
+    async def commit(self, transaction_id: int, timestamp: Optional[datetime.datetime] = None) -> None:
+        """Log the COMMIT of a transaction; returns once it is durable."""
+        await self.write_log(ExecutionResult(
+            transaction_id=transaction_id, timestamp=timestamp or datetime.datetime.now(), type="COMMIT",
+            status="", query=None, previous_data=None, new_data=None,
+        ))
+
+    async def flush(self) -> None:
+        """Wait until every record written so far has been handed to the manager."""
+        if self._pending or self._in_flight is not None:
+            await self._wait_for_flush()
+
+    async def save_checkpoint(self) -> None:
+        await self._run(self.manager.save_checkpoint)
+
+    async def recover(self, criteria: RecoverCriteria, structured: bool = False):
+        return await self._run(self.manager.recover, criteria, structured)
+
+    async def abort_transactions(self, transaction_ids: List[int], structured: bool = False):
+        return await self._run(self.manager.abort_transactions, transaction_ids, structured)
+
+    async def recoverSystem(self, structured: bool = False):
+        return await self._run(self.manager.recoverSystem, structured)
+
+    async def close(self) -> None:
+        await self._run(self.manager.close)
+        self._executor.shutdown()
+
+    async def _run(self, function, *args):
+        await self.flush()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _wait_for_flush(self) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._schedule()
+        await waiter
+
+    def _schedule(self) -> None:
+        # Submit on the next loop iteration, so records written in this one join the same batch
+        if self._in_flight is None and not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_soon(self._submit)
+
+    def _submit(self) -> None:
+        self._scheduled = False
+        if self._in_flight is not None or not (self._pending or self._waiters):
+            return
+        batch, waiters = self._pending, self._waiters
+        self._pending, self._waiters = [], []
+        loop = asyncio.get_running_loop()
+        # A failed flush raises, rejecting every commit waiting on this batch
+        write_batch = functools.partial(self.manager.write_log_batch, batch, raise_errors=True)
+        self._in_flight = loop.run_in_executor(self._executor, write_batch)
+        self._in_flight.add_done_callback(lambda future: self._flushed(future, waiters))
+        self.group_flushes += 1
+
+    def _flushed(self, future: asyncio.Future, waiters: List[asyncio.Future]) -> None:
+        self._in_flight = None
+        error = future.exception()
+        for waiter in waiters:
+            if not waiter.done():
+                if error is not None:
+                    waiter.set_exception(error)
+                else:
+                    waiter.set_result(None)
+        if self._waiters or len(self._pending) >= self.manager.wal_size:
+            self._schedule()
@@ -0,0 +1,128 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from CheckpointScheduler import CheckpointScheduler
+from FailureRecoveryManager import FailureRecoveryManager
+from TableSnapshot import STORAGE_DIR, copy_file
+
+
+class BaseBackup:
+    """
+    A hot backup of the table files (<storage_dir>/*.bin), taken while writes go on.
+
+    take() checkpoints, copies the table files concurrently (fuzzy: they change while being
+    copied), then stores the WAL range that makes the copy consistent in <backup_dir>/wal.log:
+    from the first record of the transactions active at the checkpoint (so they can be undone)
+    to the end of the flushed log once the copy is done. backup_label records the range:
+        START_LSN=<first record kept>
+        CHECKPOINT_LSN=<the checkpoint REDO starts after>
+        END_LSN=<first record not kept>
+        FILES=<file>:<copy method>;...
+    restore() copies the files back and runs recoverSystem over that WAL: REDO from the
+    checkpoint, then UNDO of the transactions still active at END_LSN.
+    from_snapshot() makes the same backup out of the latest TableSnapshot, without copying.
+    """
+
+    LABEL = "backup_label"
+
+    def __init__(self, backup_dir: str):
+        self.backup_dir = backup_dir
+        self.log_file = os.path.join(backup_dir, "wal.log")
+        with open(os.path.join(backup_dir, self.LABEL), "r") as label:
+            fields = dict(line.rstrip("\n").split("=", 1) for line in label if "=" in line)
+        self.start_lsn = int(fields["START_LSN"])
+        self.checkpoint_lsn = int(fields["CHECKPOINT_LSN"])
+        self.end_lsn = int(fields["END_LSN"])
+        self.files: Dict[str, str] = dict(
+            entry.split(":", 1) for entry in fields["FILES"].split(";") if entry
+        )
+
+    @classmethod
+    def take(cls, manager: FailureRecoveryManager, backup_dir: str, storage_dir: str = STORAGE_DIR,
+             workers: int = 4) -> "BaseBackup":
+        os.makedirs(backup_dir, exist_ok=True)
+        manager.save_checkpoint()
+        with manager.lock:
+            manager._drain_wal()
+            checkpoint_lsn = manager._checkpoint_lsn - 1
+            start_lsn = manager._needed_from_lsn()
+
+        # Writers keep going while the files are copied
+        names = sorted(name for name in os.listdir(storage_dir) if name.endswith(".bin"))
+        with ThreadPoolExecutor(workers) as pool:
+            methods = list(pool.map(
+                lambda name: copy_file(os.path.join(storage_dir, name), os.path.join(backup_dir, name)), names
+            ))
+
+        return cls._finish(manager, backup_dir, start_lsn, checkpoint_lsn, dict(zip(names, methods)))
+
+    @classmethod
+    def from_snapshot(cls, manager: FailureRecoveryManager, backup_dir: str) -> "BaseBackup":
+        """A backup of the latest snapshot of the manager (snapshot_dir), its images hard-linked."""
+        snapshots = manager.snapshots
+        snapshots.wait()
+        if snapshots.checkpoint_lsn is None:
+            raise ValueError("no snapshot to back up")
+        os.makedirs(backup_dir, exist_ok=True)
+        for name in snapshots.tables:
+            destination = os.path.join(backup_dir, name)
+            if os.path.exists(destination):
+                os.remove(destination)
+            os.link(os.path.join(snapshots.path, name), destination)
+        files = dict.fromkeys(snapshots.tables, "link")
+        return cls._finish(manager, backup_dir, snapshots.start_lsn, snapshots.checkpoint_lsn, files)
+
+    @classmethod
+    def _finish(cls, manager: FailureRecoveryManager, backup_dir: str, start_lsn: int, checkpoint_lsn: int,
+                files: Dict[str, str]) -> "BaseBackup":
+        """Keep the WAL from start_lsn to the flushed end of the log, then write the label."""
+        with manager.lock:
+            manager._drain_wal()
+            end_lsn = manager.next_lsn - len(manager.memory_wal)  # unflushed records cannot be in the files
+            lines = cls._log_lines(manager, start_lsn, end_lsn, checkpoint_lsn)
+        with open(os.path.join(backup_dir, "wal.log"), "w") as backup_log:
+            backup_log.writelines(lines)
+            backup_log.flush()
+            os.fsync(backup_log.fileno())
+        temporary_label = os.path.join(backup_dir, cls.LABEL + ".tmp")
+        with open(temporary_label, "w") as label:
+            label.write(
+                f"START_LSN={start_lsn}\nCHECKPOINT_LSN={checkpoint_lsn}\nEND_LSN={end_lsn}\n"
+                f"FILES={';'.join(f'{name}:{method}' for name, method in files.items())}\n"
+            )
+            label.flush()
+            os.fsync(label.fileno())
+        os.replace(temporary_label, os.path.join(backup_dir, cls.LABEL))  # the label marks the backup complete
+        return cls(backup_dir)
+
+    @staticmethod
+    def _log_lines(manager: FailureRecoveryManager, start_lsn: int, end_lsn: int, checkpoint_lsn: int) -> List[str]:
+        """Log lines [start_lsn, end_lsn), from the segments and the active log, keeping one CHECKPOINT."""
+        lines = []
+
+        def keep(lsn: int, line: str) -> None:
+            if start_lsn <= lsn < end_lsn and (lsn == checkpoint_lsn or not line.startswith("CHECKPOINT")):
+                lines.append(line)
+
+        for segment in manager.segments:
+            if segment.end_lsn > start_lsn:
+                for lsn, line in segment.lines(start_lsn):
+                    keep(lsn, line)
+        with open(manager.log_file, "r") as log_file:
+            for lsn, line in enumerate(log_file, manager._segment_base):
+                if lsn >= end_lsn:
+                    break
+                keep(lsn, line)
+        return lines
+
+    def restore(self, apply, storage_dir: str = STORAGE_DIR, structured: bool = False):
+        """Copy the table files back into storage_dir, then REDO and UNDO the backed-up WAL through apply()."""
+        os.makedirs(storage_dir, exist_ok=True)
+        for name in self.files:
+            copy_file(os.path.join(self.backup_dir, name), os.path.join(storage_dir, name))
+        manager = FailureRecoveryManager(log_file=self.log_file, checkpoint_scheduler=CheckpointScheduler())
+        try:
+            return manager.recoverSystem(structured, apply=apply)
+        finally:
+            manager.close()
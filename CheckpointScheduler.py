@@ -0,0 +1,97 @@
+import datetime
+import threading
+import time
+import weakref
+from typing import List, Optional
+
+
+class CheckpointScheduler:
+    """
+    Checkpoints any number of FailureRecoveryManager instances from one background thread.
+
+    A manager is due when its checkpoint_pressure() reaches 1: its checkpoint_interval has elapsed,
+    it has logged checkpoint_wal_bytes bytes, or its estimated restart time nears target_recovery_time
+    (for the latter two the manager wake()s the scheduler rather than waiting for the next poll).
+    Due managers are checkpointed most overdue first and at least min_gap seconds apart, so instances
+    that fall due together are spread out instead of hitting the disk at once (and stay spread out).
+    Managers are held weakly; stop() ends the thread.
+    """
+
+    _default: Optional["CheckpointScheduler"] = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, poll_interval: float = 1.0, min_gap: float = 1.0):
+        self.poll_interval = poll_interval
+        self.min_gap = min_gap
+        self._managers = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_allowed = 0.0  # monotonic time the next checkpoint may start at
+
+    @classmethod
+    def default(cls) -> "CheckpointScheduler":
+        """The shared scheduler managers register with unless given their own, started on first use."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+                cls._default.start()
+            return cls._default
+
+    def register(self, manager) -> None:
+        with self._lock:
+            self._managers.add(manager)
+
+    def unregister(self, manager) -> None:
+        with self._lock:
+            self._managers.discard(manager)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def wake(self) -> None:
+        """Check the managers now instead of at the next poll."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Error in checkpoint scheduler: {e}")
+
+    def run_pending(self, now: Optional[datetime.datetime] = None) -> List:
+        """Checkpoint the due managers the stagger gap allows right now; returns them."""
+        now = now or datetime.datetime.now()
+        with self._lock:
+            managers = list(self._managers)
+        due = sorted(
+            (pressure, index, manager)
+            for index, manager in enumerate(managers)
+            if (pressure := manager.checkpoint_pressure(now)) >= 1
+        )
+        checkpointed = []
+        while due and time.monotonic() >= self._next_allowed:
+            _, _, manager = due.pop()
+            try:
+                manager.save_checkpoint()
+            except Exception as e:
+                print(f"Error during checkpointing for {manager}: {e}")
+            checkpointed.append(manager)
+            self._next_allowed = time.monotonic() + self.min_gap
+        return checkpointed
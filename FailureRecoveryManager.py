@@ -1,24 +1,110 @@
 import sys
 sys.path.append('./Storage_Manager')
 
+import ast
+import bisect
+import collections
+import contextlib
 import datetime
+import io
+import mmap
+import multiprocessing
 import os
 import re
 import threading
+from concurrent.futures import ProcessPoolExecutor
 from typing import Generic, Optional, TypeVar, List, Dict, Union
 from dataclasses import dataclass
 from Buffer import Buffer
+from ActiveTransactionTable import ActiveTransactionTable
+from UndoOperation import UndoOperation
+from WALSegment import WALSegment
+from WALReader import WALReader, split_checksum, with_checksum
+from LogBuffer import LogBuffer
+from FlushPolicy import FlushPolicy
+from CheckpointScheduler import CheckpointScheduler
+from LockedAppend import LockedAppend, shared_lock
+from RecoveryProgress import RecoveryProgress
+from OnlineUndo import OnlineUndo
+from TableSnapshot import STORAGE_DIR, TableSnapshot
 import time 
 T = TypeVar('T')
 
-@dataclass
+_COLUMN_NAMES: Dict[tuple, tuple] = {}  # shared column-name tuples, one per distinct row layout
+
+TABLE_NAME_PATTERN = re.compile(r"FROM\s+(\w+)|INTO\s+(\w+)|UPDATE\s+(\w+)", re.IGNORECASE)
+
 class Rows(Generic[T]):
-    data: List[T]
-    rows_count: int
-    schema: Optional[List[str]] = None
-    columns: Optional[Dict[str, str]] = None
+    """
+    Rows touched by one operation. Dict rows that share their columns are stored compactly:
+    the column names once (column_names) and every row as a tuple of values (values).
+    `data` rebuilds the list of dicts when read; any other rows are kept as given.
+    """
+    __slots__ = ("column_names", "values", "rows_count", "schema", "columns")
+
+    def __init__(
+        self,
+        data: List[T],
+        rows_count: int,
+        schema: Optional[List[str]] = None,
+        columns: Optional[Dict[str, str]] = None,
+    ):
+        self.data = data
+        self.rows_count = rows_count
+        self.schema = schema
+        self.columns = columns
+
+    @property
+    def data(self) -> List[T]:
+        if self.column_names is None:
+            return list(self.values)
+        column_names = self.column_names
+        return [dict(zip(column_names, row)) for row in self.values]
+
+    @data.setter
+    def data(self, data: List[T]) -> None:
+        if data and isinstance(data[0], dict):
+            column_names = tuple(data[0])
+            if all(isinstance(row, dict) and tuple(row) == column_names for row in data):
+                self.column_names = _COLUMN_NAMES.setdefault(column_names, column_names)
+                self.values = [tuple(row.values()) for row in data]
+                return
+        self.column_names = None
+        self.values = list(data) if data else []
+
+    def has_columns(self, columns: List[str]) -> bool:
+        if self.column_names is not None:
+            return all(column in self.column_names for column in columns)
+        return all(isinstance(row, dict) and column in row for row in self.values for column in columns)
+
+    def column_values(self, columns: List[str]) -> List[tuple]:
+        """The values of `columns` for every row, e.g. the primary key of each row."""
+        if self.column_names is not None:
+            positions = [self.column_names.index(column) for column in columns]
+            return [tuple(row[position] for position in positions) for row in self.values]
+        return [tuple(row[column] for column in columns) for row in self.values]
 
-@dataclass
+    def __eq__(self, other):
+        if not isinstance(other, Rows):
+            return NotImplemented
+        return (self.data, self.rows_count, self.schema, self.columns) == (other.data, other.rows_count, other.schema, other.columns)
+
+    def __repr__(self):
+        return f"Rows(data={self.data!r}, rows_count={self.rows_count!r}, schema={self.schema!r}, columns={self.columns!r})"
+
+    def __reduce__(self):
+        # Pickled as its compact state (parallel parsing sends parsed records between processes)
+        return Rows._from_state, (self.column_names, self.values, self.rows_count, self.schema, self.columns)
+
+    @classmethod
+    def _from_state(cls, column_names, values, rows_count, schema, columns) -> "Rows":
+        rows = cls.__new__(cls)
+        if column_names is not None:
+            column_names = _COLUMN_NAMES.setdefault(column_names, column_names)
+        rows.column_names, rows.values, rows.rows_count, rows.schema, rows.columns = column_names, values, rows_count, schema, columns
+        return rows
+
+@dataclass(slots=True)
 class ExecutionResult:
     transaction_id: int
     timestamp: datetime
@@ -27,118 +113,537 @@ class ExecutionResult:
     query: str
     previous_data: Union[Rows,int, None]
     new_data: Union[Rows,int, None]
+    lsn: Optional[int] = None
+    table: Optional[str] = None
+
+    def __reduce__(self):
+        return ExecutionResult, (self.transaction_id, self.timestamp, self.type, self.status, self.query,
+                                 self.previous_data, self.new_data, self.lsn, self.table)
         
 from RecoverCriteria import RecoverCriteria
 
+def _parse_log_chunk(file_path: str, start: int, end: int, start_lsn: int):
+    """
+    Worker of parse_log_file with parse_workers: parses bytes [start, end) of a log (whole lines)
+    whose first line has LSN start_lsn. Returns the records, the transaction table of the chunk's
+    last CHECKPOINT (None without one) and the table keys learned.
+    """
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    parser = FailureRecoveryManager.__new__(FailureRecoveryManager)  # _parse_lines only needs these two
+    parser.table_names, parser.table_keys = {}, {}
+    records, transaction_table = parser._parse_lines(enumerate(io.TextIOWrapper(io.BytesIO(data)), start_lsn))
+    has_checkpoint = any(record.type == "CHECKPOINT" for record in records)
+    return records, transaction_table if has_checkpoint else None, parser.table_keys
+
 class FailureRecoveryManager:
-    # Class-level attributes
-    _checkpoint_thread_started = False
-    _checkpoint_lock = threading.Lock()
-    _checkpoint_thread = None
-    _leader_instance = None 
+    # Checkpoint once the estimated restart time reaches this share of target_recovery_time,
+    # leaving the rest for the records logged while the checkpoint runs
+    RECOVERY_TIME_HEADROOM = 0.8
 
-    def __init__(self, log_file='wal.log', log_size=50):
+    def __init__(
+        self,
+        log_file='wal.log',
+        log_size=50,
+        segment_compression='none',
+        log_buffer_size=None,
+        wal_buffers=1,
+        flush_policy=None,
+        checkpoint_wal_bytes=None,
+        checkpoint_scheduler=None,
+        target_recovery_time=None,
+        multiprocess=False,
+        parse_workers=None,
+        checksums=False,
+        snapshot_dir=None,
+        storage_dir=STORAGE_DIR,
+    ):
         self.memory_wal: List[ExecutionResult] = []
-        self.undo_list = []
+        self.transaction_table = ActiveTransactionTable()
         self.log_file = log_file
         self.buffer = Buffer(100)
         self.wal_size = log_size
+        self.table_keys: Dict[str, List[str]] = {}  # table name -> primary key columns
+        self.table_names: Dict[str, str] = {}  # interned table names, one string object per table
+        self.undo_batch_size = 1000  # rows per bulk undo statement
         self.last_checkpoint_time = datetime.datetime.now()
         self.checkpoint_interval = datetime.timedelta(minutes=5)
+        self.checkpoint_wal_bytes = checkpoint_wal_bytes  # also checkpoint after this many logged bytes
+        self.bytes_logged = 0  # bytes written to the log by this instance
+        self._checkpoint_bytes_logged = 0  # bytes_logged at the last checkpoint
+        self.records_logged = 0  # LSNs taken by this instance
+        self._checkpoint_records_logged = 0  # records_logged at the last checkpoint
+        # Restart time target in seconds: the redo tail since the last checkpoint is estimated from its
+        # bytes and records at the replay rates measured on the REDO of recoverSystem(apply=...) (initial guesses here)
+        self.target_recovery_time = target_recovery_time
+        self.replay_records_per_second = 50_000.0
+        self.replay_bytes_per_second = 10_000_000.0
         self.lock = threading.RLock()
+        # Several processes append to the same log file: every flush takes an fcntl lock, first
+        # catches up with the records the others appended (LSNs, index), then writes with O_APPEND
+        if multiprocess and log_buffer_size:
+            raise ValueError("multiprocess is not supported with log_buffer_size")
+        self.multiprocess = multiprocess
+        # A multiprocess checkpoint lists the active transactions of every process: the table of the
+        # shared log up to _shared_table_offset, brought up to date from there under the file lock
+        self._shared_table = ActiveTransactionTable()
+        self._shared_table_offset = 0
+        self._shared_table_lsn: Optional[int] = None
+        # Logs of at least parallel_parse_min_bytes are parsed by parse_workers processes, in
+        # record-aligned chunks merged back in LSN order
+        self.parse_workers = parse_workers
+        self.parallel_parse_min_bytes = 8 * 1024 * 1024
+        self._parse_pool = None
+        # Every record ends with a CRC32 of itself; on open a torn tail is cut off after the last
+        # valid record, and a mismatch anywhere else is reported as corruption when the log is read
+        self.checksums = checksums
+        self.repaired_bytes = 0  # bytes of torn tail truncated on open
+        self.online_undo: Optional[OnlineUndo] = None  # rollback of the losers of the last recoverSystem(online=True)
+        # With a snapshot_dir every checkpoint also images the tables dirtied since the previous one,
+        # from a thread (see TableSnapshot); truncate_wal() then drops the WAL the images replace
+        self.snapshots = TableSnapshot(snapshot_dir, storage_dir) if snapshot_dir else None
+        self.archivers: list = []  # WALArchivers of this log: truncate_wal() keeps what they have not shipped
+        self._dirty_tables: set = set()  # tables logged to since the last snapshot
+
+        # LSN = position of a record in the log. The timestamp index maps the
+        # running-max timestamp of flushed records to their LSN and byte offset,
+        # so point-in-time recovery can bisect into the log instead of scanning it.
+        self.next_lsn = 0
+        self.lsn_counter = None  # shared LSN source of a partitioned log, LSNs are then written in each record
+        self.log_bytes = 0
+        self._ts_index_keys: List[datetime.datetime] = []
+        self._ts_index_lsns: List[int] = []
+        self._ts_index_offsets: List[int] = []
+        self._ts_index_ready = False
+
+        # Sealed (read-only, optionally compressed) segments of the log, oldest first.
+        # The active log holds the records from LSN _segment_base on.
+        self.segment_dir = f"{log_file}.segments"
+        self.segment_compression = segment_compression
+        self.segments: List[WALSegment] = []
+        self._segment_base = 0
+        self._segment_ts_keys: List[datetime.datetime] = []  # running-max timestamp at the end of each block
+        self._segment_ts_blocks: List[tuple] = []  # (segment, block index) for each key
+        self._load_segments()
 
         if not os.path.exists(self.log_file):
             with open(self.log_file, 'w') as f:
                 pass
-        with FailureRecoveryManager._checkpoint_lock:
-            if FailureRecoveryManager._leader_instance is None:
-                FailureRecoveryManager._leader_instance = self
+        else:
+            if checksums:
+                if multiprocess:
+                    with LockedAppend(self.log_file, lambda size: self._repair_tail()):
+                        pass
+                else:
+                    self._repair_tail()
+            with open(self.log_file, 'r') as f:
+                self.next_lsn = self._segment_base + sum(1 for _ in f)
+            self.log_bytes = os.path.getsize(self.log_file)
+        self.next_lsn = max(self.next_lsn, self._segment_base)
+        self._checkpoint_lsn = self.next_lsn  # LSN following the last checkpoint
 
-        # Start the checkpointing thread if not already started
-        self._start_checkpointing_thread()
+        # Optional byte ring (log_buffer_size bytes): write_log only holds _reserve_lock to take
+        # an LSN and a byte range, copies its record outside it, and a flusher thread does the I/O.
+        # File offset of a ring position = position + _ring_delta.
+        self.log_buffer = LogBuffer(self.log_file, log_buffer_size) if log_buffer_size else None
+        self._reserve_lock = threading.RLock()
+        self._ring_delta = self.log_bytes
+        self._unindexed: List[tuple] = []  # (timestamp, lsn, start, end) of records not yet indexed
 
-    @classmethod
-    def _start_checkpointing_thread(cls):
-        """Start the checkpointing thread if it hasn't been started already."""
-        with cls._checkpoint_lock:  # Ensure thread-safe initialization
-            if not cls._checkpoint_thread_started:
-                threading.Thread(target=cls._checkpoint_loop, daemon=True).start()
-                cls._checkpoint_thread_started = True
-                
+        # With wal_buffers > 1 a full memory_wal is swapped for a fresh list and queued for the WAL
+        # writer thread, so appenders never wait for a flush unless every buffer is in use
+        # (wal_backpressure is set while they wait).
+        self.wal_buffers = wal_buffers
+        self._sealed_wal: collections.deque = collections.deque()  # full buffers, oldest first
+        self._wal_condition = threading.Condition(threading.Lock())
+        self._wal_io_lock = threading.Lock()  # one writer at a time keeps the log in LSN order
+        self.wal_backpressure = threading.Event()
+        self.backpressure_count = 0
+        self._wal_writer_stop = False
+        self._wal_writer = None
+        if wal_buffers > 1:
+            self._wal_writer = threading.Thread(target=self._wal_writer_loop, daemon=True)
+            self._wal_writer.start()
 
-    @classmethod
-    def _checkpoint_loop(cls):
-        """Thread loop for checkpointing."""
+        # Optional FlushPolicy: memory_wal is flushed on a byte size, record count or age that
+        # tune themselves, instead of at wal_size records. Age is checked by a timer thread too.
+        self.flush_policy: Optional[FlushPolicy] = flush_policy
+        self._memory_wal_since = time.monotonic()  # when the oldest record of memory_wal arrived
+        self._closed = threading.Event()
+        if flush_policy is not None:
+            threading.Thread(target=self._flush_timer_loop, daemon=True).start()
+
+        # Periodic checkpoints, on time or on WAL bytes (see CheckpointScheduler)
+        self.checkpoint_scheduler = checkpoint_scheduler or CheckpointScheduler.default()
+        self.checkpoint_scheduler.register(self)
+
+    @property
+    def undo_list(self) -> List[int]:
+        """Ids of the active (uncommitted) transactions, a snapshot of transaction_table."""
+        return list(self.transaction_table)
+
+    @undo_list.setter
+    def undo_list(self, transaction_ids) -> None:
+        if isinstance(transaction_ids, ActiveTransactionTable):
+            self.transaction_table = transaction_ids
+        else:
+            self.transaction_table = ActiveTransactionTable(transaction_ids)
+
+    def estimated_recovery_time(self) -> float:
+        """Seconds a restart would spend replaying the log written since the last checkpoint."""
+        return max(
+            self.wal_bytes_since_checkpoint() / self.replay_bytes_per_second,
+            self._records_since_checkpoint() / self.replay_records_per_second,
+        )
+
+    def _records_since_checkpoint(self) -> int:
+        if self.lsn_counter is not None:
+            # LSNs of a partition are global, most of them went to the other partitions
+            return self.records_logged - self._checkpoint_records_logged
+        return self.next_lsn - self._checkpoint_lsn
+
+    def checkpoint_pressure(self, now: Optional[datetime.datetime] = None) -> float:
+        """How far this manager is towards its next checkpoint; >= 1 means one is due (time, WAL bytes or recovery time)."""
+        now = now or datetime.datetime.now()
+        pressure = (now - self.last_checkpoint_time) / self.checkpoint_interval
+        if self.checkpoint_wal_bytes:
+            pressure = max(pressure, self.wal_bytes_since_checkpoint() / self.checkpoint_wal_bytes)
+        if self.target_recovery_time:
+            pressure = max(pressure, self.estimated_recovery_time() / (self.target_recovery_time * self.RECOVERY_TIME_HEADROOM))
+        return pressure
+
+    def _observe_replay(self, records: int, size: int, seconds: float) -> None:
+        """Fold the throughput of a REDO pass (records applied, their bytes, seconds) into the replay rates."""
+        if records < 100 or seconds <= 0:
+            return  # too small to say anything about throughput
+        self.replay_records_per_second += 0.2 * (records / seconds - self.replay_records_per_second)
+        if size:
+            self.replay_bytes_per_second += 0.2 * (size / seconds - self.replay_bytes_per_second)
+
+    def _take_lsn(self) -> int:
+        if self.lsn_counter is None:
+            lsn = self.next_lsn
+        else:
+            lsn = next(self.lsn_counter)
+        self.next_lsn = lsn + 1
+        self.records_logged += 1
+        return lsn
+
+    def _last_logged_lsn(self) -> int:
+        """LSN of the last record in the log (read from its last lines when LSNs are written), or -1."""
+        lines = []
+        if os.path.exists(self.log_file) and os.path.getsize(self.log_file):
+            with open(self.log_file, 'rb') as log_file:
+                _, data = self._read_tail(log_file, os.path.getsize(self.log_file))
+            lines = data.decode(errors="replace").splitlines()
+        elif self.segments and self.segments[-1].blocks:
+            lines = self.segments[-1].read_block(len(self.segments[-1].blocks) - 1)
+        for line in reversed(lines):
+            match = re.search(r",LSN: (\d+),", line)
+            if match:
+                return int(match.group(1))
+        return self.next_lsn - 1
+
+    @staticmethod
+    def _read_tail(log_file, size: int):
+        """(offset, bytes) of the end of a log of `size` bytes, from the start of its last line on."""
+        window = 64 * 1024
         while True:
-            try:
-                time.sleep(300)  # Corrected to use time.sleep
-                # Iterate over instances and save checkpoint
-                with cls._checkpoint_lock:
-                    if cls._leader_instance:
-                        try:
-                            cls._leader_instance.save_checkpoint()
-                        except Exception as e:
-                            print(f"Error during checkpointing for leader {cls._leader_instance}: {e}")
-            except Exception as e:
-                print(f"Error in checkpoint loop: {e}")
-    
-         
-    def parse_log_file(self, file_path: str) -> List[ExecutionResult]:
-        execution_results = []
-        last_undo_list = []
+            base = max(0, size - window)
+            log_file.seek(base)
+            data = log_file.read(size - base)
+            if base == 0 or data.rfind(b"\n", 0, len(data) - 1) >= 0:
+                return base, data
+            window *= 2  # the tail is one long record
+
+    def _repair_tail(self) -> None:
+        """
+        Cut a torn write off the end of the log: everything after the last complete record whose
+        checksum matches (or that has none). Only the tail is read, not the whole log.
+        """
+        size = os.path.getsize(self.log_file)
+        with open(self.log_file, 'rb') as log_file:
+            base, data = self._read_tail(log_file, size)
+        end = data.rfind(b"\n") + 1  # a last line without newline is torn
+        while end > 0:
+            start = data.rfind(b"\n", 0, end - 1) + 1
+            if start == 0 and base > 0:
+                break  # partial line at the window edge, keep it
+            _, valid = split_checksum(data[start:end - 1])
+            if valid is not False:
+                break
+            end = start
+        if base + end < size:
+            self.repaired_bytes = size - (base + end)
+            os.truncate(self.log_file, base + end)
+            print(f"Truncated {self.repaired_bytes} bytes of torn log tail in {self.log_file}")
+
+    def _line(self, record: str) -> str:
+        """A record as a log line: with its checksum when checksums are on, then a newline."""
+        return with_checksum(record) if self.checksums else record + "\n"
+
+    @contextlib.contextmanager
+    def _open_log(self, entries: List[ExecutionResult] = (), release_lsns: bool = True):
+        """
+        The log file opened for appending (locked and shared with other processes if multiprocess),
+        to write entries to. If the append fails, the byte counts and timestamp index it advanced are
+        put back, and with release_lsns (no appender can take an LSN meanwhile) the LSNs taken in it
+        too: entries that had none get none, nor do their transactions in the transaction table.
+        """
+        log_bytes, bytes_logged, indexed = self.log_bytes, self.bytes_logged, len(self._ts_index_keys)
+        next_lsn, records_logged = self.next_lsn, self.records_logged
+        unnumbered = [entry for entry in entries if entry.lsn is None]
+        positions = [
+            (active, active.first_lsn, active.last_lsn)
+            for active in (self.transaction_table.get(entry.transaction_id) for entry in unnumbered)
+            if active is not None
+        ]
+        try:
+            if self.multiprocess:
+                log_file = LockedAppend(self.log_file, self._sync_with_file)
+            else:
+                log_file = open(self.log_file, 'a')
+            with log_file:
+                yield log_file
+        except BaseException:
+            self.log_bytes, self.bytes_logged = log_bytes, bytes_logged
+            del self._ts_index_keys[indexed:], self._ts_index_lsns[indexed:], self._ts_index_offsets[indexed:]
+            if release_lsns:
+                self.next_lsn, self.records_logged = next_lsn, records_logged
+                for entry in unnumbered:
+                    entry.lsn = None
+                for active, first_lsn, last_lsn in reversed(positions):
+                    active.first_lsn, active.last_lsn = first_lsn, last_lsn
+            raise
+
+    def _sync_with_file(self, size: int) -> None:
+        """Account for the records other processes appended since our last write (file lock held)."""
+        if size < self.log_bytes:
+            # Sealed or truncated by another process: rebuild the index on next use
+            self._ts_index_ready = False
+            self.log_bytes = size
+            return
+        if size == self.log_bytes:
+            return
+        with open(self.log_file, 'rb') as log_file:
+            log_file.seek(self.log_bytes)
+            data = log_file.read(size - self.log_bytes)
+        offset = self.log_bytes
+        for line in data.splitlines(keepends=True):
+            lsn = self.next_lsn  # not _take_lsn(): records_logged only counts this instance's records
+            self.next_lsn = lsn + 1
+            timestamp = self._line_timestamp(line.decode(errors="replace"))
+            if timestamp is not None:
+                self._index_record(timestamp, lsn, offset)
+            offset += len(line)
+        self.log_bytes = offset
+
+    def _shared_transaction_table(self) -> ActiveTransactionTable:
+        """
+        Active transactions of the shared log, whichever process logged them (file lock held, caught up):
+        those of its last CHECKPOINT and the ones started after it and not ended, plus this instance's.
+        Only the type and transaction id of the records appended since the last call are read.
+        """
+        if self._shared_table_lsn is None or self.log_bytes < self._shared_table_offset:
+            # First call, or the log was sealed or truncated: go on from the start of the active log
+            self._shared_table_offset, self._shared_table_lsn = 0, self._segment_base
+        with open(self.log_file, 'rb') as log_file:
+            log_file.seek(self._shared_table_offset)
+            data = log_file.read(self.log_bytes - self._shared_table_offset)
+        table = self._shared_table
+        lines = data.decode(errors="replace").splitlines()
+        for lsn, line in enumerate(lines, self._shared_table_lsn):
+            if "\tCRC:" in line[-16:]:
+                line, _ = split_checksum(line)
+            if line.startswith("CHECKPOINT"):
+                match = re.match(r"CHECKPOINT,[^,]+,(?:LSN: \d+,)?(.*)", line)
+                if match:
+                    table = self._checkpoint_table(match.group(1))
+                continue
+            fields = line.split(",", 3)
+            if len(fields) < 4 or not fields[1].isdigit():
+                continue
+            if fields[0] in ("COMMIT", "ABORT"):
+                table.remove(int(fields[1]))
+            else:
+                table.touch(int(fields[1]), lsn, self._line_timestamp(line))
+        self._shared_table = table
+        self._shared_table_offset += len(data)
+        self._shared_table_lsn += len(lines)
+        merged = ActiveTransactionTable()
+        merged.entries = dict(table.entries)
+        for transaction_id, entry in self.transaction_table.entries.items():
+            merged.entries.setdefault(transaction_id, entry)  # records still in memory_wal
+        return merged
+
+    def wal_bytes_since_checkpoint(self) -> int:
+        """Bytes logged since the last checkpoint, including records still in the byte ring."""
+        logged = self.bytes_logged + (self.log_buffer.reserved if self.log_buffer is not None else 0)
+        return logged - self._checkpoint_bytes_logged
+
+    def parse_log_file(self, file_path: str, start_offset: int = 0, start_lsn: Optional[int] = None, lazy: bool = False) -> List[ExecutionResult]:
+        """
+        Records of a log file and the transaction table of its last CHECKPOINT. With lazy=True the file
+        is memory-mapped and records are WALRecords, whose query, timestamp and images are only decoded
+        when read; they must be used before the log is sealed.
+        """
+        if start_lsn is None:
+            # Records of the active log follow the sealed segments
+            start_lsn = self._segment_base if file_path == self.log_file else 0
         try:
             with self.lock:  # Protecting any modifications
-                with open(file_path, 'r') as file:
-                    for line in file:
-                        if line.startswith('CHECKPOINT'):
-                            match = re.match(r"CHECKPOINT,([\d\-T:\.]+),(\[.*\])", line)
-                            if match:
-                                timestamp = datetime.datetime.fromisoformat(match.group(1))
-                                try:
-                                    undo_list = eval(match.group(2)) 
-                                    last_undo_list = undo_list  
-                                    execution_result = ExecutionResult(
-                                        transaction_id=None, 
-                                        timestamp=timestamp,
-                                        type='CHECKPOINT',
-                                        query=None, 
-                                        previous_data=None,
-                                        new_data=None,
-                                        status=None
-                                    )
-                                    execution_results.append(execution_result)
-                                except Exception as e:
-                                    print(f"Error parsing CHECKPOINT line: {e}")
-                        else:
-                            match = re.match(r"(\w+),(\d+),([\d\-T:\.]+),(.+?),Before: (.*?),After: (.*)", line)
-                            if match:
-                                type = match.group(1)
-                                transaction_id = int(match.group(2))
-                                timestamp = datetime.datetime.fromisoformat(match.group(3))
-                                query = None if match.group(4) == "None"  else match.group(4)
-                                try:
-                                    before_data = eval(match.group(5))  
-                                    after_data = eval(match.group(6))   
-
-                                    before_rows = Rows(data=before_data, rows_count=len(before_data))
-                                    after_rows = Rows(data=after_data, rows_count=len(after_data))
-
-                                    execution_result = ExecutionResult(
-                                        transaction_id=transaction_id,
-                                        timestamp=timestamp,
-                                        status="",
-                                        query=query,  
-                                        previous_data=before_rows,
-                                        new_data=after_rows,
-                                        type=type
-                                    )
-                                    execution_results.append(execution_result)
-                                except Exception as e:
-                                    print(f"Error parsing log entry: {e}")
-                return execution_results, last_undo_list
+                parallel = (not lazy and self.parse_workers
+                            and os.path.getsize(file_path) - start_offset >= self.parallel_parse_min_bytes)
+                with open(file_path, 'rb' if lazy or parallel else 'r') as file:
+                    if self.multiprocess:
+                        shared_lock(file)
+                    if lazy:
+                        parsed = self._parse_mapped(file, start_offset, start_lsn)
+                    elif parallel:
+                        parsed = self._parse_parallel(file, start_offset, start_lsn)
+                    else:
+                        if start_offset:
+                            file.seek(start_offset)
+                        parsed = self._parse_lines(enumerate(file, start_lsn))
+                return parsed
         except Exception as e:
             print(f"Error reading log file {file_path}: {e}")
-            return [], []
+            return [], ActiveTransactionTable()
+
+    def _parse_lines(self, lines, last_transaction_table: Optional[ActiveTransactionTable] = None):
+        """Parse (lsn, line) pairs into log records and the transaction table of the last CHECKPOINT."""
+        execution_results = []
+        if last_transaction_table is None:
+            last_transaction_table = ActiveTransactionTable()
+        for lsn, line in lines:
+            if "\tCRC:" in line[-16:]:
+                line, valid = split_checksum(line.rstrip("\n"))
+                if valid is False:
+                    print(f"Error: checksum mismatch in log record {lsn}, the log is corrupt")
+                    continue
+            if line.startswith('CHECKPOINT'):
+                match = re.match(r"CHECKPOINT,([\d\-T:\.]+),(?:LSN: (\d+),)?(.*)", line)
+                if match:
+                    timestamp = datetime.datetime.fromisoformat(match.group(1))
+                    if match.group(2):
+                        lsn = int(match.group(2))  # partitioned log: global LSN
+                    try:
+                        last_transaction_table = self._checkpoint_table(match.group(3))
+                        execution_result = ExecutionResult(
+                            transaction_id=None, 
+                            timestamp=timestamp,
+                            type='CHECKPOINT',
+                            query=None, 
+                            previous_data=None,
+                            new_data=None,
+                            status=None,
+                            lsn=lsn
+                        )
+                        execution_results.append(execution_result)
+                    except Exception as e:
+                        print(f"Error parsing CHECKPOINT line: {e}")
+            else:
+                match = re.match(r"(\w+),(\d+),([\d\-T:\.]+),(.+?),(?:LSN: (\d+),)?(?:Table: (\w+),)?(?:Key: ([\w|]+),)?Before: (.*?),After: (.*)", line)
+                if match:
+                    type = match.group(1)
+                    transaction_id = int(match.group(2))
+                    timestamp = datetime.datetime.fromisoformat(match.group(3))
+                    query = None if match.group(4) == "None"  else match.group(4)
+                    if match.group(5):
+                        lsn = int(match.group(5))  # partitioned log: global LSN
+                    table = self._intern_table(match.group(6)) if match.group(6) else None
+                    if match.group(7):
+                        # Delta-encoded UPDATE: images hold only the key and changed columns
+                        self.table_keys.setdefault(table, match.group(7).split("|"))
+                    try:
+                        before_data = eval(match.group(8))  
+                        after_data = eval(match.group(9))   
+
+                        before_rows = Rows(data=before_data, rows_count=len(before_data))
+                        after_rows = Rows(data=after_data, rows_count=len(after_data))
+
+                        execution_result = ExecutionResult(
+                            transaction_id=transaction_id,
+                            timestamp=timestamp,
+                            status="",
+                            query=query,  
+                            previous_data=before_rows,
+                            new_data=after_rows,
+                            type=type,
+                            lsn=lsn,
+                            table=table
+                        )
+                        execution_results.append(execution_result)
+                    except Exception as e:
+                        print(f"Error parsing log entry: {e}")
+        return execution_results, last_transaction_table
+
+    def _checkpoint_table(self, state: str) -> ActiveTransactionTable:
+        state = state.strip()
+        if state.startswith("["):
+            # Checkpoints written before the transaction table existed
+            return ActiveTransactionTable(ast.literal_eval(state))
+        return ActiveTransactionTable.deserialize(state)
+
+    def _decode_rows(self, image: str) -> Rows:
+        data = eval(image)
+        return Rows(data=data, rows_count=len(data))
+
+    def _mapped_table(self, table_name: str, key_columns: Optional[List[str]]) -> str:
+        if key_columns:
+            # Delta-encoded UPDATE: images hold only the key and changed columns
+            self.table_keys.setdefault(table_name, key_columns)
+        return self._intern_table(table_name)
+
+    def _parse_mapped(self, file, start_offset: int, start_lsn: int):
+        """_parse_lines over a memory-mapped file: records are WALRecords decoded on first use."""
+        if os.fstat(file.fileno()).st_size <= start_offset:
+            return [], ActiveTransactionTable()  # nothing to map
+        reader = WALReader(file, self._decode_rows, self._mapped_table)
+        records, last_transaction_table = [], ActiveTransactionTable()
+        for record in reader.records(start_offset, start_lsn):
+            if record.type == "CHECKPOINT":
+                try:
+                    last_transaction_table = self._checkpoint_table(reader.checkpoint_state(record))
+                except Exception as e:
+                    print(f"Error parsing CHECKPOINT line: {e}")
+                    continue
+            records.append(record)
+        for lsn in reader.corrupt_lsns:
+            print(f"Error: checksum mismatch in log record {lsn}, the log is corrupt")
+        return records, last_transaction_table
+
+    def _parse_parallel(self, file, start_offset: int, start_lsn: int):
+        """_parse_lines over record-aligned chunks of the file, parsed by parse_workers processes."""
+        if self._parse_pool is None:
+            # spawn: forking a process that runs writer and scheduler threads is not safe
+            self._parse_pool = ProcessPoolExecutor(self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        chunks = []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            size = len(mapping)
+            chunk_size = max(1, (size - start_offset) // (self.parse_workers * 4))
+            position, lsn = start_offset, start_lsn
+            while position < size:
+                # Cut after the first newline past chunk_size bytes, so no record is split
+                end = mapping.find(b"\n", min(position + chunk_size, size) - 1)
+                end = size if end < 0 else end + 1
+                chunks.append((position, end, lsn))
+                lsn += mapping[position:end].count(b"\n")
+                position = end
+        futures = [self._parse_pool.submit(_parse_log_chunk, file.name, *chunk) for chunk in chunks]
+        records, last_transaction_table = [], ActiveTransactionTable()
+        for future in futures:
+            chunk_records, transaction_table, table_keys = future.result()
+            for table_name, key_columns in table_keys.items():
+                self.table_keys.setdefault(self._intern_table(table_name), key_columns)
+            for record in chunk_records:
+                if record.table:
+                    record.table = self._intern_table(record.table)
+            records.extend(chunk_records)
+            if transaction_table is not None:
+                last_transaction_table = transaction_table
+        return records, last_transaction_table
 
     def get_buffer(self):
         return self.buffer
@@ -147,72 +652,411 @@ class FailureRecoveryManager:
         self.buffer = buffer
 
 
+    def _format_log_entry(self, entry: ExecutionResult) -> str:
+        query_value = entry.query if entry.query else "None"
+        table = f"Table: {entry.table}," if entry.table else ""
+        if self.lsn_counter is not None:
+            table = f"LSN: {entry.lsn}," + table
+        delta = self._update_delta(entry) if entry.type == "UPDATE" else None
+        if delta:
+            key_columns, previous_data, new_data = delta
+            table += f"Key: {'|'.join(key_columns)},"
+        else:
+            previous_data = entry.previous_data.data if entry.previous_data else []
+            new_data = entry.new_data.data if entry.new_data else []
+        return self._line(f"{entry.type},{entry.transaction_id},{entry.timestamp.isoformat()},{query_value},{table}Before: {previous_data},After: {new_data}")
+
+    def _update_delta(self, entry: ExecutionResult):
+        """
+        Delta images of an UPDATE on a keyed table: each row keeps its key columns plus the
+        columns that changed. Undo only needs those (keyed UPDATE) and redo replays the query,
+        so full rows are never rebuilt. Returns (key_columns, before_rows, after_rows) or None.
+        """
+        key_columns = self.table_keys.get(entry.table)
+        before, after = entry.previous_data, entry.new_data
+        if not key_columns or not isinstance(before, Rows) or not isinstance(after, Rows):
+            return None
+        if len(before.values) != len(after.values) or not (before.has_columns(key_columns) and after.has_columns(key_columns)):
+            return None
+        before_rows, after_rows = [], []
+        if before.column_names is not None and before.column_names == after.column_names:
+            column_names = before.column_names
+            key_positions = {column_names.index(column) for column in key_columns}
+            for before_row, after_row in zip(before.values, after.values):
+                kept = [i for i in range(len(column_names)) if i in key_positions or before_row[i] != after_row[i]]
+                before_rows.append({column_names[i]: before_row[i] for i in kept})
+                after_rows.append({column_names[i]: after_row[i] for i in kept})
+        else:
+            for before_row, after_row in zip(before.data, after.data):
+                kept = [
+                    column for column in before_row
+                    if column in key_columns or column not in after_row or after_row[column] != before_row[column]
+                ]
+                kept += [column for column in after_row if column not in before_row]
+                before_rows.append({column: before_row[column] for column in kept if column in before_row})
+                after_rows.append({column: after_row[column] for column in kept if column in after_row})
+        return key_columns, before_rows, after_rows
+
+    def _write_entries(self, log_file, entries: List[ExecutionResult]) -> None:
+        """Append entries to an open log file, keeping LSNs and the timestamp index in step."""
+        written = 0
+        for entry in entries:
+            if entry.lsn is None:
+                entry.lsn = self._take_lsn()
+                active = self.transaction_table.get(entry.transaction_id)
+                if active is not None:
+                    # multiprocess: the LSN is only known now, once the log is locked
+                    if active.first_lsn is None:
+                        active.first_lsn = entry.lsn
+                    active.last_lsn = entry.lsn
+            log_entry = self._format_log_entry(entry)
+            log_file.write(log_entry)
+            self._index_record(entry.timestamp, entry.lsn, self.log_bytes)
+            written += len(log_entry.encode())
+            self.log_bytes += len(log_entry.encode())
+        self.bytes_logged += written
+        if (self.target_recovery_time or self.checkpoint_wal_bytes) and self.checkpoint_pressure() >= 1:
+            self.checkpoint_scheduler.wake()
+        if self.flush_policy is not None:
+            self.flush_policy.observe_flush(len(entries), written, time.monotonic())
+
+    @property
+    def flush_settings(self) -> Dict[str, float]:
+        """Thresholds memory_wal is flushed at (the tuned FlushPolicy settings, or the fixed wal_size)."""
+        if self.flush_policy is None:
+            return {"max_records": self.wal_size}
+        return self.flush_policy.settings()
+
+    def _wal_full(self) -> bool:
+        if self.flush_policy is None:
+            return len(self.memory_wal) >= self.wal_size
+        return self.flush_policy.should_flush(len(self.memory_wal), time.monotonic() - self._memory_wal_since)
+
+    def _flush_memory_wal(self) -> None:
+        """Write out (or with wal_buffers > 1, queue) memory_wal now (self.lock held)."""
+        if self.wal_buffers > 1:
+            self._seal_memory_wal()
+            return
+        with self._open_log(self.memory_wal) as log_file:
+            self._write_entries(log_file, self.memory_wal)
+        self.memory_wal.clear()
+
+    def _flush_timer_loop(self) -> None:
+        """Flush records that have waited max_age in memory_wal although no new record arrived."""
+        while not self._closed.wait(self.flush_policy.max_age / 2):
+            try:
+                with self.lock:
+                    if self.memory_wal and self._wal_full():
+                        self._flush_memory_wal()
+            except Exception as e:
+                print(f"Error flushing aged WAL records: {e}")
+
     def write_log(self, info: ExecutionResult) -> None:
+        if self.log_buffer is not None:
+            return self._write_log_buffered(info)
+        if self.wal_buffers > 1:
+            return self._write_log_double_buffered(info)
+        started = time.monotonic()
         try:
             with self.lock:
+                if info.lsn is None and not self.multiprocess:
+                    info.lsn = self._take_lsn()
+                if info.type in ("INSERT", "UPDATE", "DELETE"):
+                    self._resolve_table(info)
+                if not self.memory_wal:
+                    self._memory_wal_since = started
                 self.memory_wal.append(info)
+                if info.type != "COMMIT":
+                    # Before any flush: in multiprocess mode the LSN is taken by the flush, which then
+                    # records it as the transaction's first/last LSN
+                    self.transaction_table.touch(info.transaction_id, info.lsn, info.timestamp)
 
                 if info.type == "COMMIT":
                     try:
-                        with open(self.log_file, 'a') as log_file:
-                            for entry in self.memory_wal:
-                                query_value = entry.query if entry.query else "None"  
-                                previous_data = entry.previous_data.data if entry.previous_data else []
-                                new_data = entry.new_data.data if entry.new_data else []
-                                log_entry = f"{entry.type},{entry.transaction_id},{entry.timestamp.isoformat()},{query_value},Before: {previous_data},After: {new_data}"
-                                log_file.write(log_entry + '\n')
+                        with self._open_log(self.memory_wal) as log_file:
+                            self._write_entries(log_file, self.memory_wal)
 
                         self.memory_wal.clear()
 
-                        if info.transaction_id in self.undo_list:
-                            self.undo_list.remove(info.transaction_id)
+                        self.transaction_table.remove(info.transaction_id)
+                        if self.flush_policy is not None:
+                            self.flush_policy.observe_commit(time.monotonic() - started)
                     except Exception as e:
                         print(f"Error writing COMMIT log: {e}")
 
-                if len(self.memory_wal) >= self.wal_size and info.type != "COMMIT":
+                if info.type != "COMMIT" and self._wal_full():
                     try:
-                        with open(self.log_file, 'a') as log_file:
-                            for entry in self.memory_wal:
-                                query_value = entry.query if entry.query else "None"  
-                                previous_data = entry.previous_data.data if entry.previous_data else []
-                                new_data = entry.new_data.data if entry.new_data else []
-                                log_entry = f"{entry.type},{entry.transaction_id},{entry.timestamp.isoformat()},{query_value},Before: {previous_data},After: {new_data}"
-                                log_file.write(log_entry + '\n')
+                        with self._open_log(self.memory_wal) as log_file:
+                            self._write_entries(log_file, self.memory_wal)
 
                         self.memory_wal.clear()
                     except Exception as e:
                         print(f"Error writing WAL log: {e}")
+        except Exception as e:
+            print(f"Error in write_log: {e}")
 
-                if info.type != "COMMIT": 
-                    if info.transaction_id not in self.undo_list:
-                        self.undo_list.append(info.transaction_id)
+
+    def write_log_batch(self, entries: List[ExecutionResult], raise_errors: bool = False) -> None:
+        """
+        Logs many records under one lock acquisition and at most one flush (group commit):
+        every COMMIT in the batch is durable when this returns.
+        With raise_errors a failed flush is raised after being reported, so the caller knows
+        the COMMITs of the batch are not durable. They are then taken back out of the unwritten
+        log and their transactions stay active, to be retried or aborted.
+        """
+        try:
+            if self.log_buffer is not None:
+                end = None
+                for info in entries:
+                    if info.type in ("INSERT", "UPDATE", "DELETE"):
+                        self._resolve_table(info)
+                    position = self._append_to_log_buffer(self._format_log_entry(info).encode(), info.timestamp, info)
+                    if info.type == "COMMIT":
+                        end = position
+                if end is not None:
+                    self.log_buffer.wait_flushed(end)
+                return
+            started = time.monotonic()
+            committed = []
+            with self.lock:
+                for info in entries:
+                    if info.lsn is None and not self.multiprocess:
+                        info.lsn = self._take_lsn()
+                    if info.type in ("INSERT", "UPDATE", "DELETE"):
+                        self._resolve_table(info)
+                    if not self.memory_wal:
+                        self._memory_wal_since = started
+                    self.memory_wal.append(info)
+                    if info.type == "COMMIT":
+                        committed.append(info)
+                    else:
+                        self.transaction_table.touch(info.transaction_id, info.lsn, info.timestamp)
+                if self.memory_wal and (committed or self._wal_full()):
+                    try:
+                        self._flush_memory_wal()
+                    except Exception:
+                        self._withdraw_unwritten(committed)
+                        raise
+            if self.wal_buffers > 1 and committed and not self._write_sealed_wal():
+                with self.lock:
+                    # The WAL writer may have written them since: then they are durable after all
+                    if self._withdraw_unwritten(committed):
+                        raise OSError("queued WAL buffers could not be written")
+            # Only durable COMMITs end their transaction
+            with self.lock:
+                for info in committed:
+                    self.transaction_table.remove(info.transaction_id)
+            if committed and self.flush_policy is not None:
+                self.flush_policy.observe_commit(time.monotonic() - started)
+        except Exception as e:
+            print(f"Error in write_log_batch: {e}")
+            if raise_errors:
+                raise
+
+    def _withdraw_unwritten(self, records: List[ExecutionResult]) -> bool:
+        """
+        Take records out of the unwritten log (memory_wal and the queued buffers, self.lock held),
+        renumbering the records after them so LSNs stay log positions. Returns whether any was found.
+        """
+        withdrawn = {id(record) for record in records}
+        found = 0
+        renumbered: Dict[int, int] = {}
+        next_lsn = None
+        with self._wal_io_lock, self._wal_condition:
+            for buffer in list(self._sealed_wal) + [self.memory_wal]:
+                kept = []
+                for entry in buffer:
+                    if id(entry) in withdrawn:
+                        found += 1
+                        if next_lsn is None:
+                            next_lsn = entry.lsn
+                        continue
+                    if next_lsn is not None and entry.lsn is not None and self.lsn_counter is None:
+                        renumbered[entry.lsn] = next_lsn
+                        entry.lsn = next_lsn
+                        next_lsn += 1
+                    kept.append(entry)
+                buffer[:] = kept
+        if next_lsn is not None and self.lsn_counter is None:
+            # LSNs are only taken before the flush when not multiprocess, and then every withdrawn record has one
+            self.next_lsn = next_lsn
+            self.records_logged -= found
+        for active in self.transaction_table.entries.values():
+            active.first_lsn = renumbered.get(active.first_lsn, active.first_lsn)
+            active.last_lsn = renumbered.get(active.last_lsn, active.last_lsn)
+        return found > 0
+
+    def _append_to_log_buffer(self, data: bytes, timestamp: datetime.datetime, info: Optional[ExecutionResult] = None) -> int:
+        """Reserve an LSN and a ring range for one record (the only serialized step), then copy it in."""
+        with self._reserve_lock:
+            lsn = self._take_lsn()
+            start = self.log_buffer.reserve(len(data))
+            self._unindexed.append((timestamp, lsn, start, start + len(data)))
+            if info is not None:
+                info.lsn = lsn
+                if info.type == "COMMIT":
+                    self.transaction_table.remove(info.transaction_id)
+                else:
+                    self.transaction_table.touch(info.transaction_id, lsn, info.timestamp)
+        return self.log_buffer.write(start, data)
+
+    def _write_log_buffered(self, info: ExecutionResult) -> None:
+        try:
+            if info.type in ("INSERT", "UPDATE", "DELETE"):
+                self._resolve_table(info)
+            end = self._append_to_log_buffer(self._format_log_entry(info).encode(), info.timestamp, info)
+            if info.type == "COMMIT":
+                # Durable before returning, later records keep flowing into the ring meanwhile
+                self.log_buffer.wait_flushed(end)
         except Exception as e:
             print(f"Error in write_log: {e}")
 
+    def _write_log_double_buffered(self, info: ExecutionResult) -> None:
+        started = time.monotonic()
+        try:
+            with self.lock:
+                if info.lsn is None and not self.multiprocess:
+                    info.lsn = self._take_lsn()
+                if info.type in ("INSERT", "UPDATE", "DELETE"):
+                    self._resolve_table(info)
+                if not self.memory_wal:
+                    self._memory_wal_since = started
+                self.memory_wal.append(info)
+                if info.type == "COMMIT":
+                    self.transaction_table.remove(info.transaction_id)
+                    self._seal_memory_wal()
+                else:
+                    self.transaction_table.touch(info.transaction_id, info.lsn, info.timestamp)
+                    if self._wal_full():
+                        self._seal_memory_wal()
+            if info.type == "COMMIT":
+                # Outside self.lock: appenders keep filling the fresh buffer meanwhile
+                self._write_sealed_wal()
+                if self.flush_policy is not None:
+                    self.flush_policy.observe_commit(time.monotonic() - started)
+        except Exception as e:
+            print(f"Error in write_log: {e}")
+
+    def _seal_memory_wal(self) -> None:
+        """Queue memory_wal for the WAL writer and start a fresh buffer (self.lock held)."""
+        with self._wal_condition:
+            if len(self._sealed_wal) >= self.wal_buffers - 1:
+                # Every buffer is waiting for the disk: hold the appenders until one is written
+                self.wal_backpressure.set()
+                self.backpressure_count += 1
+                self._wal_condition.wait_for(lambda: len(self._sealed_wal) < self.wal_buffers - 1)
+                self.wal_backpressure.clear()
+            self._sealed_wal.append(self.memory_wal)
+            self._wal_condition.notify_all()
+        self.memory_wal = []
+
+    def _write_sealed_wal(self) -> bool:
+        """Write the queued buffers oldest first. A buffer leaves the queue only once it is in the file."""
+        with self._wal_io_lock:
+            while True:
+                with self._wal_condition:
+                    if not self._sealed_wal:
+                        return True
+                    entries = self._sealed_wal[0]
+                try:
+                    with self._open_log(entries, release_lsns=self.multiprocess) as log_file:
+                        self._write_entries(log_file, entries)
+                except Exception as e:
+                    print(f"Error writing WAL buffer: {e}")
+                    return False
+                with self._wal_condition:
+                    self._sealed_wal.popleft()
+                    self._wal_condition.notify_all()
+
+    def _wal_writer_loop(self) -> None:
+        while True:
+            with self._wal_condition:
+                self._wal_condition.wait_for(lambda: self._sealed_wal or self._wal_writer_stop)
+                if not self._sealed_wal:
+                    return
+            if not self._write_sealed_wal():
+                time.sleep(1)
+
+    def _drain_wal(self) -> None:
+        """Wait until every queued buffer or reserved ring record is in the log file, and index it."""
+        if self._sealed_wal:
+            self._write_sealed_wal()
+        if self.log_buffer is None:
+            return
+        with self._reserve_lock:
+            pending, self._unindexed = self._unindexed, []
+            position = self.log_buffer.reserved
+        self.log_buffer.wait_flushed(position)
+        for timestamp, lsn, start, _ in pending:
+            self._index_record(timestamp, lsn, start + self._ring_delta)
+        if pending:
+            self.log_bytes = pending[-1][3] + self._ring_delta
+
+    def close(self) -> None:
+        """Flush queued WAL buffers, finish the table images and stop the background writer, flusher and timer threads."""
+        self._closed.set()
+        self.checkpoint_scheduler.unregister(self)
+        with self.lock:
+            self._drain_wal()
+            if self.log_buffer is not None:
+                self.log_buffer.close()
+            if self._wal_writer is not None:
+                with self._wal_condition:
+                    self._wal_writer_stop = True
+                    self._wal_condition.notify_all()
+                self._wal_writer.join()
+                self._wal_writer = None
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown()
+            self._parse_pool = None
+        if self.snapshots is not None:
+            self.snapshots.wait()
 
     def save_checkpoint(self) -> None:
+        if self.log_buffer is not None:
+            try:
+                with self.lock:
+                    with self._reserve_lock:
+                        checkpoint_time = datetime.datetime.now()
+                        checkpoint_entry = self._line(f"CHECKPOINT,{checkpoint_time.isoformat()},{self.transaction_table.serialize()}")
+                        self._append_to_log_buffer(checkpoint_entry.encode(), checkpoint_time)
+                    self._drain_wal()
+                    self.last_checkpoint_time = checkpoint_time
+                    self._checkpoint_bytes_logged = self.bytes_logged + self.log_buffer.reserved
+                    self._checkpoint_lsn = self.next_lsn
+                    self._checkpoint_records_logged = self.records_logged
+                    self._flush_buffer()
+            except Exception as e:
+                print(f"Error in save_checkpoint: {e}")
+            return
         try:
             with self.lock:
+                self._drain_wal()
                 if self.memory_wal:
                     try:
-                        with open(self.log_file, "a") as log_file:
-                            for entry in self.memory_wal:
-                                query_value = entry.query if entry.query else "None"
-                                # Handle None for previous_data and new_data
-                                previous_data = entry.previous_data.data if entry.previous_data else []
-                                new_data = entry.new_data.data if entry.new_data else []
-                                log_entry = f"{entry.type},{entry.transaction_id},{entry.timestamp.isoformat()},{query_value},Before: {previous_data},After: {new_data}"
-                                log_file.write(log_entry + '\n')
+                        with self._open_log(self.memory_wal) as log_file:
+                            self._write_entries(log_file, self.memory_wal)
                     except Exception as e:
                         print(f"Error writing WAL during checkpoint: {e}")
                 try:        
-                    with open(self.log_file, "a") as log_file:
-                        checkpoint_entry = f"CHECKPOINT,{datetime.datetime.now().isoformat()},{self.undo_list}"
-                        log_file.write(checkpoint_entry + '\n')
+                    with self._open_log() as log_file:
+                        checkpoint_time = datetime.datetime.now()
+                        checkpoint_lsn = self._take_lsn()
+                        lsn_field = f"LSN: {checkpoint_lsn}," if self.lsn_counter is not None else ""
+                        transaction_table = self._shared_transaction_table() if self.multiprocess else self.transaction_table
+                        checkpoint_entry = self._line(f"CHECKPOINT,{checkpoint_time.isoformat()},{lsn_field}{transaction_table.serialize()}")
+                        log_file.write(checkpoint_entry)
+                        self._index_record(checkpoint_time, checkpoint_lsn, self.log_bytes)
+                        self.log_bytes += len(checkpoint_entry.encode())
+                        self.bytes_logged += len(checkpoint_entry.encode())
+                    self.last_checkpoint_time = checkpoint_time
+                    self._checkpoint_bytes_logged = self.bytes_logged
+                    self._checkpoint_lsn = self.next_lsn
+                    self._checkpoint_records_logged = self.records_logged
                 except Exception as e:
                     print(f"Error writing CHECKPOINT log: {e}")
                 try:
-                    self.buffer.flush()
+                    self._flush_buffer()
                 except Exception as e:
                     print(f"Error writing buffer to storage manager: {e}")
 
@@ -220,82 +1064,598 @@ class FailureRecoveryManager:
         except Exception as e:
             print(f"Error in save_checkpoint: {e}")
 
+    def _needed_from_lsn(self) -> int:
+        """First record the table files of the last checkpoint need: the checkpoint or an active transaction's first."""
+        # A first_lsn of None (multiprocess) means no record is flushed yet: they will all come later
+        return min([self._checkpoint_lsn - 1] + [
+            entry.first_lsn for entry in self.transaction_table.entries.values() if entry.first_lsn is not None
+        ])
+
+    def _flush_buffer(self) -> None:
+        """Write the buffered blocks to storage at a checkpoint, then start the snapshot of that checkpoint."""
+        if self.snapshots is None:
+            self.buffer.flush()
+            return
+        self.snapshots.wait()  # the previous images are read from the files this flush changes
+        dirty = self._dirty_tables | {table for table, _ in self.buffer.cache}
+        self.buffer.flush()
+        self._dirty_tables = set()
+        self.snapshots.take(self._checkpoint_lsn - 1, self._needed_from_lsn(), dirty)
+
+    def truncate_wal(self) -> int:
+        """
+        Drops the records older than the START_LSN of the latest table snapshot: the images
+        replace them. Records a WALArchiver of this log has not shipped yet are kept too.
+        The active log is sealed first; segments before that point are deleted and the one
+        holding it is written again from there on. Returns how many records were dropped.
+        Without a snapshot nothing is dropped.
+        """
+        if self.snapshots is None:
+            return 0
+        self.snapshots.wait()
+        start_lsn = self.snapshots.start_lsn
+        if start_lsn is None:
+            return 0
+        with self.lock, self._reserve_lock:
+            start_lsn = min([start_lsn] + [archiver.shipped_lsn for archiver in self.archivers])
+            self.seal_segment()
+            dropped = 0
+            kept = []
+            for segment in self.segments:
+                if segment.first_lsn >= start_lsn:
+                    kept.append(segment)
+                    continue
+                if segment.end_lsn > start_lsn:
+                    lines = [line for lsn, line in segment.lines(start_lsn) if lsn >= start_lsn]
+                    kept.append(WALSegment.write(
+                        os.path.join(self.segment_dir, f"{start_lsn:020d}.seg"), lines, start_lsn,
+                        self.segment_compression, timestamp_of=self._line_timestamp,
+                    ))
+                dropped += min(segment.end_lsn, start_lsn) - segment.first_lsn
+                os.remove(segment.path)
+                os.remove(segment.index_path)
+            self.segments, self._segment_ts_keys, self._segment_ts_blocks = [], [], []
+            for segment in kept:
+                self._register_segment(segment)
+            return dropped
+
+    # Sealed WAL segments
+    def _load_segments(self) -> None:
+        if not os.path.isdir(self.segment_dir):
+            return
+        names = sorted(os.listdir(self.segment_dir))
+        pending = [name for name in names if name.endswith(".pending")]
+        segments = [
+            WALSegment(os.path.join(self.segment_dir, name)) for name in names
+            if (name.endswith(".seg") and os.path.exists(os.path.join(self.segment_dir, name + ".idx"))
+                and name[:-len(".seg")] + ".pending" not in pending)
+        ]
+        for segment, following in zip(segments, segments[1:] + [None]):
+            if following is not None and following.first_lsn < segment.end_lsn:
+                # Left by an interrupted truncate_wal: the following segment holds the records kept
+                os.remove(segment.path)
+                os.remove(segment.index_path)
+                continue
+            self._register_segment(segment)
+        for name in pending:
+            # Interrupted seal: the records are all in the pending file, write the segment again
+            self._write_segment(os.path.join(self.segment_dir, name), self.segment_compression)
+
+    def _register_segment(self, segment: WALSegment) -> None:
+        self.segments.append(segment)
+        self._segment_base = segment.end_lsn
+        for index, block in enumerate(segment.blocks):
+            if block.max_timestamp is not None and (
+                not self._segment_ts_keys or block.max_timestamp > self._segment_ts_keys[-1]
+            ):
+                self._segment_ts_keys.append(block.max_timestamp)
+                self._segment_ts_blocks.append((segment, index))
+
+    def _write_segment(self, pending_path: str, compression: str) -> WALSegment:
+        first_lsn = int(os.path.basename(pending_path).split(".")[0])
+        with open(pending_path, 'r') as pending_file:
+            lines = pending_file.readlines()
+        segment = WALSegment.write(
+            os.path.join(self.segment_dir, f"{first_lsn:020d}.seg"), lines, first_lsn,
+            compression, timestamp_of=self._line_timestamp,
+        )
+        os.remove(pending_path)
+        self._register_segment(segment)
+        return segment
+
+    def seal_segment(self, compression: Optional[str] = None) -> Optional[WALSegment]:
+        """
+        Moves the flushed log into a read-only segment and starts an empty active log.
+        - compression is "none", "zlib" or "lzma" (default segment_compression), applied per block
+          so a segment stays seekable by LSN and by timestamp through its index
+        - Unflushed records stay in memory_wal and go to the new active log
+        Returns the new segment, or None when the active log is empty.
+        """
+        with self.lock, self._reserve_lock:
+            self._drain_wal()
+            if not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0:
+                return None
+            os.makedirs(self.segment_dir, exist_ok=True)
+            pending_path = os.path.join(self.segment_dir, f"{self._segment_base:020d}.pending")
+            os.replace(self.log_file, pending_path)
+            with open(self.log_file, 'w'):
+                pass
+            segment = self._write_segment(pending_path, compression or self.segment_compression)
+            self.log_bytes = 0
+            self._ts_index_keys, self._ts_index_lsns, self._ts_index_offsets = [], [], []
+            self._ts_index_ready = True
+            if self.log_buffer is not None:
+                self.log_buffer.reopen()
+                self._ring_delta = -self.log_buffer.reserved
+            return segment
+
+    def _segment_records(self, from_lsn: int = 0, transaction_table: Optional[ActiveTransactionTable] = None):
+        """Records of the sealed segments with LSN >= from_lsn (whole blocks), and the last checkpoint state."""
+        records = []
+        for segment in self.segments:
+            if segment.end_lsn <= from_lsn:
+                continue
+            logs, transaction_table = self._parse_lines(segment.lines(from_lsn), transaction_table)
+            records.extend(logs)
+        return records, transaction_table or ActiveTransactionTable()
+
+    def read_log(self, lazy: bool = False):
+        """All log records, sealed segments first, with the transaction table of the last CHECKPOINT."""
+        if not self.segments:
+            return self.parse_log_file(self.log_file, lazy=lazy)
+        records, transaction_table = self._segment_records()
+        logs, active_table = self.parse_log_file(self.log_file, lazy=lazy)
+        if any(log.type == "CHECKPOINT" for log in logs):
+            transaction_table = active_table
+        return records + logs, transaction_table
+
+    def _reversed_log(self):
+        """Log records newest first: the active log, then the segments one block at a time."""
+        logs, _ = self.parse_log_file(self.log_file)
+        yield from reversed(logs)
+        for segment in reversed(self.segments):
+            for first_lsn, lines in segment.blocks_reversed():
+                records, _ = self._parse_lines(enumerate(lines, first_lsn))
+                yield from reversed(records)
+
+    # Timestamp -> LSN index for point-in-time recovery
+    def _index_record(self, timestamp: datetime.datetime, lsn: int, offset: int) -> None:
+        """Record a flushed entry if it advances the running-max timestamp (keeps keys sorted)."""
+        if not self._ts_index_ready:
+            return
+        if self._ts_index_keys:
+            high = self._ts_index_keys[-1]
+        else:
+            high = self._segment_ts_keys[-1] if self._segment_ts_keys else None
+        if high is None or timestamp > high:
+            self._ts_index_keys.append(timestamp)
+            self._ts_index_lsns.append(lsn)
+            self._ts_index_offsets.append(offset)
+
+    def _line_timestamp(self, line: str) -> Optional[datetime.datetime]:
+        try:
+            if line.startswith('CHECKPOINT'):
+                return datetime.datetime.fromisoformat(line.split(',', 2)[1])
+            return datetime.datetime.fromisoformat(line.split(',', 3)[2])
+        except (IndexError, ValueError):
+            return None
+
+    def _ensure_timestamp_index(self) -> None:
+        """Build the timestamp index from the log file once; later flushes keep it current."""
+        if self._ts_index_ready:
+            return
+        self._ts_index_keys, self._ts_index_lsns, self._ts_index_offsets = [], [], []
+        self._ts_index_ready = True
+        offset = 0
+        lsn = self._segment_base
+        with open(self.log_file, 'r') as file:
+            for lsn, line in enumerate(file, self._segment_base + 1):
+                timestamp = self._line_timestamp(line)
+                if timestamp is not None:
+                    self._index_record(timestamp, lsn - 1, offset)
+                offset += len(line.encode())
+        self.log_bytes = offset
+        self.next_lsn = max(self.next_lsn, lsn)
+
+    def _lsn_at(self, timestamp: datetime.datetime) -> int:
+        """First LSN whose record lies after `timestamp`; records before it form the state at `timestamp`."""
+        if self._segment_ts_keys and timestamp < self._segment_ts_keys[-1]:
+            # Inside the sealed segments: bisect the block index, then scan a single block
+            j = bisect.bisect_right(self._segment_ts_keys, timestamp)
+            segment, index = self._segment_ts_blocks[j]
+            high = self._segment_ts_keys[j - 1] if j else None
+            for lsn, line in enumerate(segment.read_block(index), segment.blocks[index].first_lsn):
+                line_timestamp = self._line_timestamp(line)
+                if line_timestamp is not None and (high is None or line_timestamp > high):
+                    high = line_timestamp
+                if high is not None and high > timestamp:
+                    return lsn
+        i = bisect.bisect_right(self._ts_index_keys, timestamp)
+        if i < len(self._ts_index_keys):
+            return self._ts_index_lsns[i]
+        # Not in the flushed log, look at the (small) unflushed tail
+        high = self._ts_index_keys[-1] if self._ts_index_keys else None
+        for entry in self.memory_wal:
+            if high is None or entry.timestamp > high:
+                high = entry.timestamp
+            if high > timestamp and entry.lsn is not None:
+                return entry.lsn
+        return self.next_lsn
+
+    def _records_from(self, lsn: int) -> List[ExecutionResult]:
+        """Records with LSN >= `lsn`, read from the nearest indexed offset plus the unflushed tail."""
+        i = bisect.bisect_right(self._ts_index_lsns, lsn) - 1
+        if lsn < self._segment_base:
+            logs, _ = self._segment_records(lsn)
+            logs.extend(self.parse_log_file(self.log_file)[0])
+        elif i >= 0:
+            logs, _ = self.parse_log_file(self.log_file, self._ts_index_offsets[i], self._ts_index_lsns[i])
+        else:
+            logs, _ = self.parse_log_file(self.log_file)
+        records = [log for log in logs if log.lsn is not None and log.lsn >= lsn]
+        records.extend(entry for entry in self.memory_wal if entry.lsn is None or entry.lsn >= lsn)
+        return records
+
+    def recover_point_in_time(self, target: datetime.datetime, current: Optional[datetime.datetime] = None):
+        """
+        Computes the operations that move the database to its committed state as of `target`.
+        - `current` is the point the database reflects now, default is the end of the log
+        - Bisect the timestamp index for both cut points, read the log only from the earlier one
+        - Transactions that committed between the two points are the only ones affected:
+          undo them (newest first) when rolling back, redo them (oldest first) when rolling forward
+        - Their records before the earlier cut are fetched only if their START lies before it
+        Returns (redo_queries, undo_queries) as lists of [transaction_id, query]; one of them is empty.
+        """
+        with self.lock:
+            self._drain_wal()
+            self._ensure_timestamp_index()
+            target_lsn = self._lsn_at(target)
+            current_lsn = self.next_lsn if current is None else self._lsn_at(current)
+            if target_lsn == current_lsn:
+                return [], []
+            rolling_back = target_lsn < current_lsn
+            low, high = min(target_lsn, current_lsn), max(target_lsn, current_lsn)
+
+            records = self._records_from(low)
+            affected = {
+                log.transaction_id for log in records
+                if log.type == "COMMIT" and (log.lsn is None or log.lsn < high)
+            }
+            if not affected:
+                return [], []
+            started = {log.transaction_id for log in records if log.type == "START"}
+            if not affected <= started:
+                records = self._records_from(0)
+
+            changes = [
+                log for log in records
+                if log.transaction_id in affected
+                and log.type in ("INSERT", "UPDATE", "DELETE")
+                and (log.lsn is None or log.lsn < high)
+            ]
+            if rolling_back:
+                undo_queries = []
+                for log in reversed(changes):
+                    for query in self._build_undo_queries(log):
+                        undo_queries.append([log.transaction_id, query])
+                return [], undo_queries
+            return [[log.transaction_id, log.query] for log in changes], []
+
     # Get the table name from the query
     def get_table_name(self, query: str) -> str:
-        match = re.search(r"FROM\s+(\w+)|INTO\s+(\w+)|UPDATE\s+(\w+)", query, re.IGNORECASE)
+        match = TABLE_NAME_PATTERN.search(query) if query else None
         if match:
             return match.group(1) or match.group(2) or match.group(3)
         return ""
+
+    def _intern_table(self, table_name: str) -> str:
+        return self.table_names.setdefault(table_name, table_name)
+
+    # Table of a logged operation: stored in the record, the SQL text is only a fallback for old logs
+    def _entry_table(self, entry: ExecutionResult) -> str:
+        if entry.table is None:
+            entry.table = self._intern_table(self.get_table_name(entry.query))
+        return entry.table
     
-    # Build an UPDATE query to undo to the 'before' state
-    def build_update_query(self, table_name: str, before: Rows, after: Rows) -> List[str]:
-        queries = []
-        for before_row, after_row in zip(before.data, after.data):
-            # Format SET clause
-            set_clause = ", ".join(
-                f"{k}={repr(v) if isinstance(v, str) else v}" for k, v in before_row.items()
+    # Primary keys are registered explicitly or read from Rows.columns / Rows.schema,
+    # e.g. columns={'id': 'INTEGER PRIMARY KEY'} or schema=['id INTEGER PRIMARY KEY', 'name TEXT']
+    def register_table_keys(self, table_name: str, key_columns: List[str]) -> None:
+        self.table_keys[table_name] = list(key_columns)
+
+    def _rows_key_columns(self, rows) -> List[str]:
+        if not isinstance(rows, Rows):
+            return []
+        if rows.columns:
+            keys = [column for column, definition in rows.columns.items() if "PRIMARY" in str(definition).upper()]
+            if keys:
+                return keys
+        if rows.schema:
+            return [str(column).split()[0] for column in rows.schema if "PRIMARY" in str(column).upper()]
+        return []
+
+    def _resolve_table(self, info: ExecutionResult) -> None:
+        """Resolve the table of a data record once, so recovery never has to scan the SQL text."""
+        info.table = self._intern_table(info.table or self.get_table_name(info.query))
+        self._learn_table_keys(info)
+        if self.snapshots is not None:
+            self._dirty_tables.add(info.table)
+
+    def _learn_table_keys(self, entry: ExecutionResult) -> None:
+        keys = self._rows_key_columns(entry.previous_data) or self._rows_key_columns(entry.new_data)
+        if keys:
+            self.table_keys.setdefault(self._entry_table(entry), keys)
+
+    def get_key_columns(self, table_name: str, *rows) -> List[str]:
+        keys = self.table_keys.get(table_name)
+        if keys:
+            return keys
+        for data in rows:
+            keys = self._rows_key_columns(data)
+            if keys:
+                self.table_keys[table_name] = keys
+                return keys
+        return []
+
+    def _format_value(self, value) -> str:
+        return repr(value) if isinstance(value, str) else str(value)
+
+    def _key_condition(self, key_columns: List[str], keys: List[tuple]) -> str:
+        """WHERE condition matching rows by key: `id=1`, `id IN (1, 2)` or `(a, b) IN ((1, 2), (3, 4))`."""
+        if len(keys) == 1:
+            return " AND ".join(f"{column}={self._format_value(value)}" for column, value in zip(key_columns, keys[0]))
+        if len(key_columns) == 1:
+            return f"{key_columns[0]} IN ({', '.join(self._format_value(key[0]) for key in keys)})"
+        key_list = ", ".join("(" + ", ".join(self._format_value(value) for value in key) + ")" for key in keys)
+        return f"({', '.join(key_columns)}) IN ({key_list})"
+
+    def _case_expression(self, key_columns: List[str], column: str, values: Dict[tuple, object], row_count: int) -> str:
+        distinct = {self._format_value(value) for value in values.values()}
+        if len(values) == row_count and len(distinct) == 1:
+            return distinct.pop()  # every row gets the same value, no CASE needed
+        if len(key_columns) == 1:
+            branches = " ".join(
+                f"WHEN {self._format_value(key[0])} THEN {self._format_value(value)}" for key, value in values.items()
             )
-            # Format WHERE clause
-            condition = " AND ".join(
-                f"{k}={repr(v) if isinstance(v, str) else v}" for k, v in after_row.items()
+            expression = f"CASE {key_columns[0]} {branches}"
+        else:
+            branches = " ".join(
+                f"WHEN {self._key_condition(key_columns, [key])} THEN {self._format_value(value)}"
+                for key, value in values.items()
             )
-            query = f"UPDATE {table_name} SET {set_clause} WHERE {condition};"
-            queries.append(query)
+            expression = f"CASE {branches}"
+        if len(values) < row_count:
+            expression += f" ELSE {column}"
+        return expression + " END"
+
+    # Undo is produced as structured UndoOperations (one per row); SQL is only an adapter over them
+    def update_undo_operations(self, transaction_id: Optional[int], table_name: str, before: Rows, after: Rows) -> List[UndoOperation]:
+        key_columns = self.get_key_columns(table_name, before, after)
+        operations = []
+        if key_columns and after.has_columns(key_columns) and before.column_names is not None \
+                and before.column_names == after.column_names:
+            # Same row layout on both sides: compare the value tuples position by position
+            column_names = before.column_names
+            positions = range(len(column_names))
+            keys = after.column_values(key_columns)
+            for before_row, after_row, key in zip(before.values, after.values, keys):
+                if before_row == after_row:
+                    continue
+                changed = {column_names[i]: before_row[i] for i in positions if before_row[i] != after_row[i]}
+                operations.append(UndoOperation(transaction_id, table_name, "UPDATE", dict(zip(key_columns, key)), changed))
+        elif key_columns and after.has_columns(key_columns):
+            for before_row, after_row in zip(before.data, after.data):
+                changed = {
+                    column: value for column, value in before_row.items()
+                    if column not in after_row or after_row[column] != value
+                }
+                if changed:
+                    key = {column: after_row[column] for column in key_columns}
+                    operations.append(UndoOperation(transaction_id, table_name, "UPDATE", key, changed))
+        else:
+            for before_row, after_row in zip(before.data, after.data):
+                operations.append(UndoOperation(transaction_id, table_name, "UPDATE", dict(after_row), dict(before_row)))
+        return operations
+
+    def delete_undo_operations(self, transaction_id: Optional[int], table_name: str, after: Rows) -> List[UndoOperation]:
+        key_columns = self.get_key_columns(table_name, after)
+        if key_columns and after.has_columns(key_columns):
+            keys = dict.fromkeys(after.column_values(key_columns))
+            return [UndoOperation(transaction_id, table_name, "DELETE", dict(zip(key_columns, key)), None) for key in keys]
+        return [UndoOperation(transaction_id, table_name, "DELETE", dict(row), None) for row in after.data]
+
+    def insert_undo_operations(self, transaction_id: Optional[int], table_name: str, before: Rows, after: Rows) -> List[UndoOperation]:
+        if not before.values:
+            return []
+        after_set = {tuple(row.items()) for row in after.data} if after and after.values else set()
+        key_columns = self.get_key_columns(table_name, before)
+        return [
+            UndoOperation(
+                transaction_id, table_name, "INSERT",
+                {column: row[column] for column in key_columns if column in row} or None, dict(row)
+            )
+            for row in before.data if tuple(row.items()) not in after_set
+        ]
+
+    def build_undo_operations(self, entry: ExecutionResult) -> List[UndoOperation]:
+        """Structured undo of a single logged data operation, in the order it must be applied."""
+        if entry.type == "UPDATE":
+            table_name = self._entry_table(entry)
+            return self.update_undo_operations(entry.transaction_id, table_name, entry.previous_data, entry.new_data)
+        elif entry.type == "INSERT":
+            table_name = self._entry_table(entry)
+            return self.delete_undo_operations(entry.transaction_id, table_name, entry.new_data)
+        elif entry.type == "DELETE":
+            table_name = self._entry_table(entry)
+            return self.insert_undo_operations(entry.transaction_id, table_name, entry.previous_data, entry.new_data)
+        return []
+
+    def render_undo_sql(self, operations: List[UndoOperation]) -> List[str]:
+        """
+        SQL adapter over UndoOperations: consecutive operations on the same table and kind
+        become one statement per batch (keyed) or the legacy per-row / per-record statements.
+        """
+        queries = []
+        group = []
+        for operation in operations:
+            if group and (operation.table, operation.kind) != (group[0].table, group[0].kind):
+                queries.extend(self._render_undo_group(group))
+                group = []
+            group.append(operation)
+        if group:
+            queries.extend(self._render_undo_group(group))
         return queries
 
-    # Build a DELETE query to undo an INSERT operation
-    def build_delete_query(self, table_name: str, after: Rows) -> List[str]:
+    def _is_keyed(self, operations: List[UndoOperation]) -> bool:
+        key_columns = self.table_keys.get(operations[0].table)
+        return bool(key_columns) and all(
+            operation.key is not None and list(operation.key) == key_columns for operation in operations
+        )
+
+    def _render_undo_group(self, operations: List[UndoOperation]) -> List[str]:
+        table_name, kind = operations[0].table, operations[0].kind
+        if kind == "UPDATE":
+            if not self._is_keyed(operations):
+                return [self._render_row_update(operation) for operation in operations]
+            key_columns = self.table_keys[table_name]
+            if any(column in operation.before_image for operation in operations for column in key_columns):
+                # A key is being restored, rows cannot be matched by one key set; keep them sequential
+                return [self._render_row_update(operation) for operation in operations]
+            return self._render_keyed_update(table_name, key_columns, operations)
+        elif kind == "DELETE":
+            if self._is_keyed(operations):
+                key_columns = self.table_keys[table_name]
+                keys = list(dict.fromkeys(tuple(operation.key.values()) for operation in operations))
+                return [
+                    f"DELETE FROM {table_name} WHERE {self._key_condition(key_columns, keys[start:start + self.undo_batch_size])};"
+                    for start in range(0, len(keys), self.undo_batch_size)
+                ]
+            row_conditions = [
+                " AND ".join(f"{k}={repr(v) if isinstance(v, str) else v}" for k, v in operation.key.items())
+                for operation in operations
+            ]
+            if len(row_conditions) == 1:
+                condition = row_conditions[0]
+            else:
+                condition = " OR ".join(f"({row_condition})" for row_condition in row_conditions)
+            return [f"DELETE FROM {table_name} WHERE {condition};"]
+        elif kind == "INSERT":
+            # Rows merged from several records can have different columns or column orders: one
+            # statement per column set, every row's values in that statement's column order
+            column_sets: Dict[frozenset, List[dict]] = {}
+            for operation in operations:
+                column_sets.setdefault(frozenset(operation.before_image), []).append(operation.before_image)
+            queries = []
+            for rows in column_sets.values():
+                columns = list(rows[0])
+                values_list = [
+                    "(" + ", ".join(repr(row[column]) if isinstance(row[column], str) else str(row[column]) for column in columns) + ")"
+                    for row in rows
+                ]
+                queries.extend(
+                    f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES {', '.join(values_list[start:start + self.undo_batch_size])};"
+                    for start in range(0, len(values_list), self.undo_batch_size)
+                )
+            return queries
+        return []
+
+    def _render_row_update(self, operation: UndoOperation) -> str:
+        # Format SET clause
+        set_clause = ", ".join(
+            f"{k}={repr(v) if isinstance(v, str) else v}" for k, v in operation.before_image.items()
+        )
+        # Format WHERE clause
         condition = " AND ".join(
-            f"{k}={repr(v) if isinstance(v, str) else v}" for row in after.data for k, v in row.items()
+            f"{k}={repr(v) if isinstance(v, str) else v}" for k, v in operation.key.items()
         )
-        return [f"DELETE FROM {table_name} WHERE {condition};"]
+        return f"UPDATE {operation.table} SET {set_clause} WHERE {condition};"
+
+    def _render_keyed_update(self, table_name: str, key_columns: List[str], operations: List[UndoOperation]) -> List[str]:
+        """
+        Set-based undo of UPDATEs: rows are matched by primary key and only the changed columns
+        are restored, one multi-row UPDATE per batch:
+        UPDATE t SET name=CASE id WHEN 1 THEN 'a' WHEN 2 THEN 'b' END WHERE id IN (1, 2);
+        If a key occurs twice the later operation wins, as it would when applied in order.
+        """
+        changes: Dict[str, Dict[tuple, object]] = {}
+        row_keys: Dict[tuple, None] = {}
+        for operation in operations:
+            key = tuple(operation.key.values())
+            row_keys[key] = None
+            for column, value in operation.before_image.items():
+                changes.setdefault(column, {})[key] = value
+
+        queries = []
+        keys = list(row_keys)
+        for start in range(0, len(keys), self.undo_batch_size):
+            batch = keys[start:start + self.undo_batch_size]
+            if len(batch) == 1:
+                set_clause = ", ".join(
+                    f"{column}={self._format_value(values[batch[0]])}"
+                    for column, values in changes.items() if batch[0] in values
+                )
+            else:
+                batch_keys = set(batch)
+                assignments = []
+                for column, values in changes.items():
+                    batch_values = {key: value for key, value in values.items() if key in batch_keys}
+                    if batch_values:
+                        assignments.append(
+                            f"{column}={self._case_expression(key_columns, column, batch_values, len(batch))}"
+                        )
+                set_clause = ", ".join(assignments)
+            queries.append(f"UPDATE {table_name} SET {set_clause} WHERE {self._key_condition(key_columns, batch)};")
+        return queries
+
+    # Build an UPDATE query to undo to the 'before' state
+    def build_update_query(self, table_name: str, before: Rows, after: Rows) -> List[str]:
+        return self.render_undo_sql(self.update_undo_operations(None, table_name, before, after))
+
+    # Build a DELETE query to undo an INSERT operation
+    def build_delete_query(self, table_name: str, after: Rows) -> List[str]:
+        return self.render_undo_sql(self.delete_undo_operations(None, table_name, after))
 
-    
     # Build an INSERT query to undo a DELETE operation
     def build_insert_query(self, table_name: str, before: Rows, after: Rows) -> List[str]:
-        if not before.data:
-            return []
-        after_set = {tuple(row.items()) for row in after.data} if after and after.data else set()
-        filtered_before = [row for row in before.data if tuple(row.items()) not in after_set]
+        return self.render_undo_sql(self.insert_undo_operations(None, table_name, before, after))
 
-        if not filtered_before:
-            return []
+    # Build the queries that undo a single logged data operation
+    def _build_undo_queries(self, entry: ExecutionResult) -> List[str]:
+        return self.render_undo_sql(self.build_undo_operations(entry))
 
-        # Format columns and values
-        columns = ", ".join(filtered_before[0].keys())
-        values_list = [
-            "(" + ", ".join(repr(v) if isinstance(v, str) else str(v) for v in row.values()) + ")"
-            for row in filtered_before
-        ]
-        return [f"INSERT INTO {table_name} ({columns}) VALUES {', '.join(values_list)};"]
-    
-    
-    def recover(self, criteria:RecoverCriteria):
+    def recover(self, criteria:RecoverCriteria, structured: bool = False, apply=None):
         """
         Recovers the database state to meet the criteria (timestamp or transaction id).
+        Returns [transaction_id, query] pairs, or UndoOperations with structured=True.
+        With apply, the undo of the transactions is passed to apply(item) and their ABORT logged.
         For abort normal case:
-        - Get undolist from RecoverCriteria transaction id, timestamp is not used
-        - Scan memory_wal
-        - Abort (undo) and write on the log
-        - IF UNDO LIST NOT EMPTY-Scan backwards from wal.log from last query
-        For abort normal case:
-        - Get undolist from RecoverCriteria transaction id, timestamp is not used
+        - Get undolist from RecoverCriteria transaction id
         - Scan memory_wal
         - Abort (undo) and write on the log
         - IF UNDO LIST NOT EMPTY-Scan backwards from wal.log from last query
         - Abort (undo) and write on the log
         - Redo dilakukan di concurrency!
+        For point-in-time case (only timestamp given):
+        - Rolls back from the end of the log to the timestamp: returns only the undo queries of
+          recover_point_in_time (passed to apply too, no ABORT is logged as they committed)
+        - Roll forward from an earlier point goes through recover_point_in_time(target, current)
         """
         try:
             if not criteria.transaction_id:
+                if criteria.timestamp is not None:
+                    _, undo_queries = self.recover_point_in_time(criteria.timestamp)
+                    if apply is not None:
+                        for item in undo_queries:
+                            apply(item)
+                    return undo_queries
                 return []
             with self.lock:
-                valid_transaction_ids = [tid for tid in criteria.transaction_id if tid in self.undo_list]
+                self._drain_wal()
+                undo_list = {tid for tid in criteria.transaction_id if tid in self.transaction_table}
 
-                if not valid_transaction_ids:
+                if not undo_list:
                     return []
+                aborted = set(undo_list)
 
-                undo_list = valid_transaction_ids
                 undo_queries = []  # List of undo queries to return
                 # Scan memory_wal
                 # If the transaction id that we want to undo is now empty then stop
@@ -309,19 +1669,12 @@ class FailureRecoveryManager:
                     if (checkcurr_transaction_id in undo_list):
                         if exec_result.type == "START":
                             undo_list.remove(checkcurr_transaction_id)
-                            self.undo_list.remove(checkcurr_transaction_id)
+                            self.transaction_table.remove(checkcurr_transaction_id)
                             undo_query= []
-                        elif exec_result.type == "UPDATE":
-                            table_name = self.get_table_name(exec_result.query)
-                            undo_query = self.build_update_query(table_name, exec_result.previous_data, exec_result.new_data)
-                        elif exec_result.type == "INSERT":
-                            table_name = self.get_table_name(exec_result.query)
-                            undo_query = self.build_delete_query(table_name, exec_result.new_data)
-                        elif exec_result.type == "DELETE":
-                            table_name = self.get_table_name(exec_result.query)
-                            undo_query = self.build_insert_query(table_name, exec_result.previous_data, exec_result.new_data)
+                        elif structured:
+                            undo_queries.extend(self.build_undo_operations(exec_result))
                         else:
-                            continue
+                            undo_query = self._build_undo_queries(exec_result)
                         for query in undo_query: 
                             undo_queries.append([checkcurr_transaction_id, query]) 
 
@@ -333,8 +1686,7 @@ class FailureRecoveryManager:
                 if (done_undo==False):
                     if not os.path.exists(self.log_file):
                         raise Exception("No log file. Abort")
-                    logs, last_undo_list = self.parse_log_file(self.log_file)
-                    for log_entry in reversed(logs):
+                    for log_entry in self._reversed_log():
                         undo_query = []
                         checkcurr_transaction_id = log_entry.transaction_id
                         if (len(undo_list)==0):
@@ -342,93 +1694,227 @@ class FailureRecoveryManager:
                             break
                         if log_entry.type == "START" and checkcurr_transaction_id in undo_list:
                             undo_list.remove(checkcurr_transaction_id)
-                            self.undo_list.remove(checkcurr_transaction_id)
+                            self.transaction_table.remove(checkcurr_transaction_id)
                         else:
                             if (checkcurr_transaction_id in undo_list):
-                                if log_entry.type == "UPDATE":
-                                    table_name = self.get_table_name(log_entry.query)
-                                    undo_query = self.build_update_query(table_name, log_entry.previous_data, log_entry.new_data)
-                                elif log_entry.type == "INSERT":
-                                    table_name = self.get_table_name(log_entry.query)
-                                    undo_query = self.build_delete_query(table_name, log_entry.new_data)
-                                elif log_entry.type == "DELETE":
-                                    table_name = self.get_table_name(log_entry.query)
-                                    undo_query = self.build_insert_query(table_name, log_entry.previous_data, log_entry.new_data)
-                                else:
+                                if structured:
+                                    undo_queries.extend(self.build_undo_operations(log_entry))
                                     continue
+                                undo_query = self._build_undo_queries(log_entry)
                                 for query in undo_query:
                                     undo_queries.append([checkcurr_transaction_id, query])
-                return undo_queries
         except Exception as e:
             print(f"Error during recovery: {e}")
             return []
-        # Write ABORT log
-        # abort_log = ExecutionResult(
-        #     transaction_id=checkcurr_transaction_id,
-        #     timestamp=datetime.datetime.now(),
-        #     status="ABORT",
-        #     before=Rows(data=[], rows_count=0),
-        #     after=Rows(data=[], rows_count=0),
-        #     query="None",
-        # )
-        # self.write_log(abort_log)
+        # Write ABORT log, once the undo is applied
+        if apply is not None:
+            self._apply_aborts(undo_queries, aborted - undo_list, apply)
+        return undo_queries
         
-    def recoverSystem(self):
+    def abort_transactions(self, transaction_ids: List[int], structured: bool = False, apply=None) -> List[list]:
+        """
+        Batched abort for many transactions at once (e.g. deadlock victims).
+        - One reverse pass over memory_wal, then wal.log, shared by every transaction
+        - Set-based bookkeeping, so each record costs O(1) whatever the batch size
+        - Stops as soon as the START of every transaction has been seen
+        - Undo operations are grouped by table into bulk statements (build_bulk_undo_queries)
+        Returns a list of [transaction_ids, query], transaction_ids being the sorted ids the statement covers.
+        With structured=True returns the UndoOperations in the order they must be applied instead.
+        With apply, each item is passed to apply(item), then the ABORT of the transactions is logged.
+        """
+        try:
+            with self.lock:
+                self._drain_wal()
+                pending = {tid for tid in transaction_ids if tid in self.transaction_table}
+                if not pending:
+                    return []
+                aborted = set(pending)
+
+                changes = []
+                self._collect_abort_changes(reversed(self.memory_wal), pending, changes)
+                if pending:
+                    if not os.path.exists(self.log_file):
+                        raise Exception("No log file. Abort")
+                    self._collect_abort_changes(self._reversed_log(), pending, changes)
+
+                for tid in aborted - pending:
+                    self.transaction_table.remove(tid)
+                if structured:
+                    undo_queries = [operation for entry in changes for operation in self.build_undo_operations(entry)]
+                else:
+                    undo_queries = self.build_bulk_undo_queries(changes)
+        except Exception as e:
+            print(f"Error during batch abort: {e}")
+            return []
+        if apply is not None:
+            self._apply_aborts(undo_queries, aborted - pending, apply)
+        return undo_queries
+
+    def _apply_aborts(self, undo_queries: list, transaction_ids: set, apply) -> None:
+        """Apply the undo of rolled back transactions, then log their ABORT (a standby undoes them on it)."""
+        for item in undo_queries:
+            apply(item)
+        for transaction_id in sorted(transaction_ids):
+            self.log_abort(transaction_id)
+
+    def _collect_abort_changes(self, entries, pending: set, changes: List[ExecutionResult]) -> None:
+        """Walk entries newest first, collecting data operations of pending transactions until their START."""
+        for entry in entries:
+            if not pending:
+                return
+            if entry.transaction_id not in pending:
+                continue
+            if entry.type == "START":
+                pending.discard(entry.transaction_id)
+            elif entry.type in ("INSERT", "UPDATE", "DELETE"):
+                changes.append(entry)
+
+    def build_bulk_undo_queries(self, entries: List[ExecutionResult]) -> List[list]:
+        """
+        Groups undo operations (given newest first) into one bulk statement per table and kind.
+        Transactions being aborted together hold disjoint write sets (strict 2PL), so operations of
+        different transactions commute; an operation only joins an existing group if that does not
+        move it ahead of an earlier-undone operation of its own transaction.
+        """
+        groups = []  # [(table_name, type), entries]
+        latest_group = {}  # (table_name, type) -> index of the newest group with that key
+        transaction_group = {}  # transaction_id -> index of the last group holding one of its operations
+        for entry in entries:
+            key = (self._entry_table(entry), entry.type)
+            index = latest_group.get(key)
+            if index is None or transaction_group.get(entry.transaction_id, -1) > index:
+                index = len(groups)
+                groups.append((key, []))
+                latest_group[key] = index
+            groups[index][1].append(entry)
+            transaction_group[entry.transaction_id] = index
+
+        undo_queries = []
+        for _, members in groups:
+            transaction_ids = sorted({entry.transaction_id for entry in members})
+            operations = [operation for entry in members for operation in self.build_undo_operations(entry)]
+            for query in self.render_undo_sql(operations):
+                undo_queries.append([transaction_ids, query])
+        return undo_queries
+
+    def recoverSystem(self, structured: bool = False, apply=None, progress=None, progress_interval: int = 1000, online: bool = False,
+                      sync=None):
         # Parse the log file to retrieve all logs
+        # With structured=True the undo part is a list of UndoOperations instead of [transaction_id, query]
+        # With apply, every REDO and UNDO item is passed to apply(item) in order and progress is saved
+        # in <log_file>.recovery every progress_interval records, so a rerun after a crash resumes
+        # (records after the last save are applied again). Before each save sync() makes the applied
+        # items durable; by default the buffer is flushed to storage. progress(RecoveryProgress) is
+        # called at each save with the rate and ETA.
+        # With online=True (needs apply) only REDO runs here: the losers are rolled back by an OnlineUndo
+        # thread, returned in place of the undo queries, while new transactions are already accepted.
+        if online and apply is None:
+            raise ValueError("online undo needs apply")
+        redo_query, undo_queries = [], []
         try:
             with self.lock:
-                logs, undo_list = self.parse_log_file(self.log_file)
+                self._drain_wal()
+                # Memory-mapped: only the images of the records to undo get decoded
+                logs, transaction_table = self.read_log(lazy=True)
                 if not logs:
                     return
 
-                self.undo_list = undo_list
-                # REDO Phase
-                last_checkpoint = None
-                for log in reversed(logs):
-                    if log.type == "CHECKPOINT":
-                        last_checkpoint = log 
-                redo_start_index = logs.index(last_checkpoint) + 1 if last_checkpoint else 0
-
-                redo_query = []
-                # Perform REDO
-                for log in logs[redo_start_index:]:
-                    if log.type in ("COMMIT", "ABORT"):
-                        if log.transaction_id in self.undo_list:
-                            self.undo_list.remove(log.transaction_id)
-                    elif log.type == "START":
-                        if log.transaction_id not in self.undo_list:
-                            self.undo_list.append(log.transaction_id)
-                    elif log.type == "INSERT" or log.type == "UPDATE" or log.type == "DELETE":  
-                        redo_query.append([log.transaction_id, log.query])
-
-                # UNDO Phase
-
-                undo_queries = []
-                for log in reversed(logs):
-                    undo_query = []
-                    if not self.undo_list:
-                        break
-
-                    if log.transaction_id in self.undo_list:
-                        if log.status == "START":
-                            self.undo_list.remove(log.transaction_id)
-                        else:
-                            if log.type == "UPDATE":
-                                table_name = self.get_table_name(log.query)
-                                undo_query = self.build_update_query(table_name, log.previous_data, log.new_data)
-                            elif log.type == "INSERT":
-                                table_name = self.get_table_name(log.query)
-                                undo_query = self.build_delete_query(table_name, log.new_data)
-                            elif log.type == "DELETE":
-                                table_name = self.get_table_name(log.query)
-                                undo_query = self.build_insert_query(table_name, log.previous_data, log.new_data)
-                            else:
-                                continue
-                            for query in undo_query:
-                                    undo_queries.append([log.transaction_id, query])
+                redo_logs, undo_logs = self._recovery_plan(logs, transaction_table)
+                if apply is not None or progress is not None:
+                    return self._run_recovery(redo_logs, undo_logs, structured, apply, progress, progress_interval, online, sync)
+                redo_query = [[log.transaction_id, log.query] for log in redo_logs]
+                undo_queries = self._undo_queries_for(undo_logs, structured)
 
             return redo_query, undo_queries
         except Exception as e:
             print(f"Error during system recovery: {e}")
-            return redo_query, undo_query
+            return redo_query, undo_queries
+
+    def _run_recovery(self, redo_logs, undo_logs, structured: bool, apply, callback, interval: int, online: bool = False,
+                      sync=None):
+        """REDO then UNDO of a recovery plan, record by record, resuming from and saving progress markers."""
+        marker = f"{self.log_file}.recovery" if apply is not None else None  # nothing applied, nothing to resume
+        progress = RecoveryProgress(marker, self.next_lsn, len(redo_logs) + len(undo_logs), callback, interval,
+                                    sync or self.buffer.flush)
+        pending_redo = [log for log in redo_logs if not progress.skip_redo(log.lsn)]
+        pending_undo = [log for log in undo_logs if not progress.skip_undo(log.lsn)]
+        progress.skipped(progress.total - len(pending_redo) - len(pending_undo))
+        redo_query, undo_queries = [], []
+        started = time.perf_counter()
+        for log in pending_redo:
+            item = [log.transaction_id, log.query]
+            if apply is not None:
+                apply(item)
+            redo_query.append(item)
+            progress.advance(log.lsn)
+        if apply is not None:
+            # Replay throughput for estimated_recovery_time, measured on the REDO actually applied;
+            # the bytes are estimated from the mean record size of the active log
+            active_records = self.next_lsn - self._segment_base
+            mean_record_bytes = self.log_bytes / active_records if active_records > 0 else 0
+            self._observe_replay(len(pending_redo), int(len(pending_redo) * mean_record_bytes), time.perf_counter() - started)
+        progress.start_undo()
+        if online:
+            self.online_undo = OnlineUndo(self, list(self.transaction_table), pending_undo, structured, apply, progress).start()
+            return redo_query, self.online_undo
+        for log in pending_undo:
+            items = self._undo_queries_for([log], structured)
+            if apply is not None:
+                for item in items:
+                    apply(item)
+            undo_queries.extend(items)
+            progress.advance(log.lsn)
+        progress.finish()
+        return redo_query, undo_queries
+
+    def log_abort(self, transaction_id: int) -> None:
+        """Durably log the ABORT of a rolled back transaction and drop it from the transaction table."""
+        self.write_log(ExecutionResult(
+            transaction_id=transaction_id, timestamp=datetime.datetime.now(), type="ABORT", status="",
+            query=None, previous_data=None, new_data=None,
+        ))
+        with self.lock:
+            self.transaction_table.remove(transaction_id)
+            if self.memory_wal:
+                self._flush_memory_wal()
+            self._drain_wal()
+
+    def _recovery_plan(self, logs: List[ExecutionResult], transaction_table):
+        """
+        Records to REDO (after the last checkpoint, oldest first) and to UNDO (of the transactions
+        still active at the end of the log, newest first); rebuilds transaction_table on the way.
+        """
+        self.undo_list = transaction_table
+        # REDO Phase
+        last_checkpoint = None
+        for log in reversed(logs):
+            if log.type == "CHECKPOINT":
+                last_checkpoint = log 
+        redo_start_index = logs.index(last_checkpoint) + 1 if last_checkpoint else 0
+
+        redo_logs = []
+        for log in logs[redo_start_index:]:
+            if log.type in ("COMMIT", "ABORT"):
+                self.transaction_table.remove(log.transaction_id)
+            elif log.type == "START":
+                self.transaction_table.touch(log.transaction_id, log.lsn, log.timestamp)
+            elif log.type == "INSERT" or log.type == "UPDATE" or log.type == "DELETE":  
+                redo_logs.append(log)
+
+        # UNDO Phase
+        undo_logs = []
+        for log in reversed(logs):
+            if not self.transaction_table:
+                break
+            if log.transaction_id in self.transaction_table:
+                if log.status == "START":
+                    self.transaction_table.remove(log.transaction_id)
+                else:
+                    undo_logs.append(log)
+        return redo_logs, undo_logs
+
+    def _undo_queries_for(self, logs: List[ExecutionResult], structured: bool = False) -> list:
+        if structured:
+            return [operation for log in logs for operation in self.build_undo_operations(log)]
+        return [[log.transaction_id, query] for log in logs for query in self._build_undo_queries(log)]
 
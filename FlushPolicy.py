@@ -0,0 +1,80 @@
+import threading
+from typing import Dict
+
+
+class FlushPolicy:
+    """
+    Decides when memory_wal is written out: on whichever comes first of a record count, a byte
+    size or the age of its oldest record. The thresholds tune themselves from what write_log sees:
+    - max_bytes follows commit latency (AIMD): halved while the average COMMIT takes longer than
+      target_commit_latency (less to write per commit), grown by min_bytes while it is below it
+    - max_records follows throughput: the records expected to arrive within max_age
+    - buffered bytes are estimated from the average size of flushed records, no formatting needed
+    """
+
+    ALPHA = 0.2  # weight of a new sample in the moving averages
+
+    def __init__(
+        self,
+        max_records: int = 50,
+        max_bytes: int = 64 * 1024,
+        max_age: float = 1.0,
+        target_commit_latency: float = 0.002,
+        min_records: int = 8,
+        max_records_limit: int = 10_000,
+        min_bytes: int = 4 * 1024,
+        max_bytes_limit: int = 8 * 1024 * 1024,
+    ):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.target_commit_latency = target_commit_latency
+        self.min_records = min_records
+        self.max_records_limit = max_records_limit
+        self.min_bytes = min_bytes
+        self.max_bytes_limit = max_bytes_limit
+        self.record_bytes = 0.0  # average bytes per flushed record
+        self.commit_latency = 0.0  # average seconds per COMMIT
+        self.throughput = 0.0  # average records per second
+        self._last_flush_at = None
+        self._lock = threading.Lock()
+
+    def should_flush(self, records: int, age: float) -> bool:
+        return (
+            records >= self.max_records
+            or records * self.record_bytes >= self.max_bytes
+            or (records > 0 and age >= self.max_age)
+        )
+
+    def _average(self, current: float, sample: float) -> float:
+        return sample if not current else current + self.ALPHA * (sample - current)
+
+    def observe_flush(self, records: int, size: int, now: float) -> None:
+        """A flush of `records` records taking `size` bytes ended at monotonic time `now`."""
+        if not records:
+            return
+        with self._lock:
+            self.record_bytes = self._average(self.record_bytes, size / records)
+            if self._last_flush_at is not None and now > self._last_flush_at:
+                self.throughput = self._average(self.throughput, records / (now - self._last_flush_at))
+                self.max_records = int(min(max(self.throughput * self.max_age, self.min_records), self.max_records_limit))
+            self._last_flush_at = now
+
+    def observe_commit(self, seconds: float) -> None:
+        with self._lock:
+            self.commit_latency = self._average(self.commit_latency, seconds)
+            if self.commit_latency > self.target_commit_latency:
+                self.max_bytes = max(self.min_bytes, self.max_bytes // 2)
+            else:
+                self.max_bytes = min(self.max_bytes_limit, self.max_bytes + self.min_bytes)
+
+    def settings(self) -> Dict[str, float]:
+        """Current thresholds and the measurements they were tuned from."""
+        return {
+            "max_records": self.max_records,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "record_bytes": self.record_bytes,
+            "commit_latency": self.commit_latency,
+            "throughput": self.throughput,
+        }
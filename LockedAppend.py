@@ -0,0 +1,58 @@
+import os
+from typing import Callable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: no multiprocess mode
+    fcntl = None
+
+
+class LockedAppend:
+    """
+    Appends text to a file shared by several processes, as a drop-in for open(path, 'a').
+
+    Entering takes an exclusive fcntl lock on the file and calls on_locked(size) with its current
+    size, so the caller can catch up with what other processes appended. Everything written inside
+    the block is sent with a single O_APPEND write when the block exits, then the lock is released:
+    records of different processes never interleave. A block that raises appends nothing.
+    """
+
+    def __init__(self, path: str, on_locked: Optional[Callable[[int], None]] = None):
+        if fcntl is None:
+            raise OSError("multiprocess WAL appends need fcntl (POSIX)")
+        self.path = path
+        self.on_locked = on_locked
+        self._parts: List[str] = []
+        self._fd = None
+
+    def __enter__(self) -> "LockedAppend":
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            if self.on_locked is not None:
+                self.on_locked(os.fstat(self._fd).st_size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        return self
+
+    def write(self, text: str) -> int:
+        self._parts.append(text)
+        return len(text)
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        try:
+            if exc_type is not None:
+                return  # the block failed: append nothing rather than part of it
+            data = memoryview("".join(self._parts).encode())
+            while data:
+                data = data[os.write(self._fd, data):]
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+
+
+def shared_lock(file) -> None:
+    """Block writers of other processes while `file` (an open file object) is being read."""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_SH)
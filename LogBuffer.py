@@ -0,0 +1,138 @@
+import threading
+from typing import Optional
+
+
+class LogBuffer:
+    """
+    Preallocated byte ring between log producers and the log file.
+
+    Producers only serialize the reservation of a byte range (reserve), copy their record into
+    the ring outside any lock (write), and the fully copied prefix is appended to the file by the
+    flusher thread, or by a committer waiting for its bytes when no flush is running (group commit).
+    Positions are absolute byte counts since the buffer was created:
+        flushed <= copied <= reserved, and reserved - flushed <= capacity
+    A producer that finds the ring full waits for a flush (backpressure).
+    """
+
+    def __init__(self, path: str, capacity: int = 1 << 20):
+        self.path = path
+        self.capacity = capacity
+        self.ring = bytearray(capacity)
+        self.view = memoryview(self.ring)
+        self.reserved = 0
+        self.copied = 0
+        self.flushed = 0
+        self.error: Optional[Exception] = None
+        self._completed = {}  # start -> end of ranges copied ahead of `copied`
+        lock = threading.Lock()
+        self._condition = threading.Condition(lock)  # producers: space freed, bytes flushed
+        self._copied_condition = threading.Condition(lock)  # flusher: bytes ready to write
+        self._flushing = False
+        self._closing = False
+        self._log_file = None
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def reserve(self, size: int) -> int:
+        """Reserve `size` bytes; returns the start position. Blocks while the ring is full."""
+        with self._condition:
+            if size > self.capacity:
+                # Grow once the ring is empty, nothing in it is mapped to the old capacity then
+                self._condition.wait_for(lambda: self.flushed == self.reserved)
+                self.capacity = 1 << (size - 1).bit_length()
+                self.ring = bytearray(self.capacity)
+                self.view = memoryview(self.ring)
+            self._condition.wait_for(lambda: self.reserved + size - self.flushed <= self.capacity)
+            start = self.reserved
+            self.reserved += size
+            return start
+
+    def write(self, start: int, data: bytes) -> int:
+        """Copy `data` into its reserved range and publish it for flushing; returns its end position."""
+        position = start % self.capacity
+        first = min(len(data), self.capacity - position)
+        self.view[position:position + first] = data[:first]
+        if first < len(data):
+            self.view[:len(data) - first] = data[first:]
+        end = start + len(data)
+        with self._condition:
+            if start == self.copied:
+                self.copied = end
+                while self.copied in self._completed:
+                    self.copied = self._completed.pop(self.copied)
+            else:
+                self._completed[start] = end
+            self._copied_condition.notify()
+        return end
+
+    def wait_flushed(self, position: Optional[int] = None) -> None:
+        """Block until every byte before `position` (default: everything reserved) is in the file."""
+        while True:
+            with self._condition:
+                if position is None:
+                    position = self.reserved
+                while self.flushed < position and self.error is None and (self._flushing or self.copied == self.flushed):
+                    self._condition.wait()
+                if self.error is not None and self.flushed < position:
+                    raise IOError(f"WAL flush failed: {self.error}")
+                if self.flushed >= position:
+                    return
+                # Nobody is flushing and bytes are ready: write them ourselves
+                claimed = self._claim()
+            self._flush(*claimed)
+
+    def reopen(self) -> None:
+        """Append to a fresh file at `path` from now on (call once the ring is flushed)."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._flushing)
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+    def close(self) -> None:
+        self.wait_flushed()
+        with self._condition:
+            self._closing = True
+            self._copied_condition.notify()
+        self._flusher.join()
+        self.reopen()
+
+    def _claim(self):
+        """Take the copied, unflushed range for writing (lock held)."""
+        self._flushing = True
+        return self.flushed, self.copied
+
+    def _flush(self, start: int, end: int) -> None:
+        try:
+            if self._log_file is None:
+                self._log_file = open(self.path, "ab", buffering=0)
+            position = start % self.capacity
+            first = min(end - start, self.capacity - position)
+            self._log_file.write(self.view[position:position + first])
+            if first < end - start:
+                self._log_file.write(self.view[:end - start - first])
+        except Exception as e:
+            print(f"Error flushing WAL buffer: {e}")
+            with self._condition:
+                self.error = e
+                self._flushing = False
+                self._condition.notify_all()
+            return
+        with self._condition:
+            self.flushed = end
+            self._flushing = False
+            self._condition.notify_all()
+            self._copied_condition.notify()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._condition:
+                self._copied_condition.wait_for(
+                    lambda: (self.copied > self.flushed and not self._flushing) or self._closing or self.error is not None
+                )
+                if self.error is not None or (self._closing and self.copied == self.flushed):
+                    return
+                if self._flushing or self.copied == self.flushed:
+                    continue
+                claimed = self._claim()
+            self._flush(*claimed)
@@ -0,0 +1,111 @@
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class OnlineUndo:
+    """
+    Rolls back the loser transactions of a recovery in a background thread while new
+    transactions run (recoverSystem(online=True)).
+
+    Every row a loser touched is locked until that loser is fully undone: the rows of its before
+    and after images, keyed by primary key (the whole row for tables without a known key).
+    The locks are advisory: write_log only sees a change once it has been executed, so nothing
+    checks them for the caller. Callers must call wait_for_rows() (or row_locked()) before
+    executing a change to a row while losers are rolled back. Once all undo
+    items of a loser are applied, an ABORT record is logged for it (a later restart no longer
+    treats it as a loser) and its rows are released. Items go to apply() newest first, as in
+    recoverSystem.
+    """
+
+    def __init__(self, manager, losers: List[int], undo_logs, structured: bool, apply, progress=None):
+        self.manager = manager
+        self.undo_logs = undo_logs
+        self.structured = structured
+        self.apply = apply
+        self.progress = progress
+        self.undo_queries: list = []
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+        self._condition = threading.Condition()
+        self._row_locks: Dict[Tuple[str, tuple], Set[int]] = {}  # row -> losers holding it
+        self._loser_rows: Dict[int, Set[Tuple[str, tuple]]] = {}  # loser -> rows it holds
+        self._remaining: Dict[int, int] = dict.fromkeys(losers, 0)  # loser -> undo records left
+        for log in undo_logs:
+            self._remaining[log.transaction_id] = self._remaining.get(log.transaction_id, 0) + 1
+            for row in self._rows_of(log):
+                self._row_locks.setdefault(row, set()).add(log.transaction_id)
+                self._loser_rows.setdefault(log.transaction_id, set()).add(row)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def losers(self) -> List[int]:
+        """Transactions not rolled back yet."""
+        with self._condition:
+            return list(self._remaining)
+
+    def _row_key(self, table: str, row: dict) -> Tuple[str, tuple]:
+        key_columns = [column for column in self.manager.get_key_columns(table) if column in row]
+        if key_columns:
+            return table, tuple(row[column] for column in key_columns)
+        return table, tuple(sorted(row.items()))
+
+    def _rows_of(self, log) -> List[Tuple[str, tuple]]:
+        table = self.manager._entry_table(log)
+        self.manager.get_key_columns(table, log.previous_data, log.new_data)  # learn the key from the images
+        return [
+            self._row_key(table, row)
+            for image in (log.previous_data, log.new_data) if image
+            for row in image.data if isinstance(row, dict)
+        ]
+
+    def row_locked(self, table: str, row: dict) -> bool:
+        with self._condition:
+            return self._row_key(table, row) in self._row_locks
+
+    def wait_for_rows(self, table: str, rows: List[dict], timeout: Optional[float] = None) -> bool:
+        """Block until no loser holds any of `rows` of `table`; False on timeout."""
+        keys = [self._row_key(table, row) for row in rows]
+        with self._condition:
+            return self._condition.wait_for(lambda: not any(key in self._row_locks for key in keys), timeout)
+
+    def start(self) -> "OnlineUndo":
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the rollback to finish; False on timeout."""
+        return self.done.wait(timeout)
+
+    def _run(self) -> None:
+        try:
+            for transaction_id in [loser for loser, count in self._remaining.items() if not count]:
+                self._finish_loser(transaction_id)  # nothing to undo
+            for log in self.undo_logs:
+                items = self.manager._undo_queries_for([log], self.structured)
+                for item in items:
+                    self.apply(item)
+                self.undo_queries.extend(items)
+                if self.progress is not None:
+                    self.progress.advance(log.lsn)
+                with self._condition:
+                    self._remaining[log.transaction_id] -= 1
+                    finished = not self._remaining[log.transaction_id]
+                if finished:
+                    self._finish_loser(log.transaction_id)
+            if self.progress is not None:
+                self.progress.finish()
+        except Exception as e:
+            self.error = e
+            print(f"Error during online undo: {e}")
+        finally:
+            self.done.set()
+
+    def _finish_loser(self, transaction_id: int) -> None:
+        self.manager.log_abort(transaction_id)
+        with self._condition:
+            del self._remaining[transaction_id]
+            for row in self._loser_rows.pop(transaction_id, ()):
+                self._row_locks[row].discard(transaction_id)
+                if not self._row_locks[row]:
+                    del self._row_locks[row]
+            self._condition.notify_all()
@@ -0,0 +1,124 @@
+import heapq
+import itertools
+from typing import Dict, List
+
+from FailureRecoveryManager import ExecutionResult, FailureRecoveryManager
+from RecoverCriteria import RecoverCriteria
+from RecoveryProgress import RecoveryProgress
+
+
+class PartitionedFailureRecoveryManager:
+    """
+    A WAL split into N partitions (<log_file>.p0 ... .pN-1) so N writers can log at the same time.
+
+    Each transaction is hashed by id to one partition, a FailureRecoveryManager with its own lock,
+    memory_wal, file and (with wal_buffers / flush_policy) its own writer. Every record carries a
+    global LSN taken from one shared counter, written into the record, so the partitions can be
+    merged back into log order:
+    - recover / abort_transactions only touch the partitions of the given transactions
+    - recoverSystem merges the REDO records of every partition by LSN and the UNDO records
+      newest LSN first
+    """
+
+    def __init__(self, log_file: str = 'wal.log', partitions: int = 4, **kwargs):
+        if kwargs.get("log_buffer_size"):
+            raise ValueError("log_buffer_size is not supported for a partitioned log, use wal_buffers")
+        self.partitions: List[FailureRecoveryManager] = [
+            FailureRecoveryManager(log_file=f"{log_file}.p{index}", **kwargs) for index in range(partitions)
+        ]
+        last_lsns = [partition._last_logged_lsn() for partition in self.partitions]
+        self.lsn_counter = itertools.count(max(last_lsns) + 1)
+        for partition, last_lsn in zip(self.partitions, last_lsns):
+            partition.lsn_counter = self.lsn_counter
+            partition.next_lsn = partition._checkpoint_lsn = last_lsn + 1
+
+    def partition_of(self, transaction_id: int) -> FailureRecoveryManager:
+        return self.partitions[hash(transaction_id) % len(self.partitions)]
+
+    def _by_partition(self, transaction_ids: List[int]) -> Dict[FailureRecoveryManager, List[int]]:
+        groups: Dict[FailureRecoveryManager, List[int]] = {}
+        for transaction_id in transaction_ids:
+            groups.setdefault(self.partition_of(transaction_id), []).append(transaction_id)
+        return groups
+
+    @property
+    def undo_list(self) -> List[int]:
+        return [transaction_id for partition in self.partitions for transaction_id in partition.undo_list]
+
+    def write_log(self, info: ExecutionResult) -> None:
+        self.partition_of(info.transaction_id).write_log(info)
+
+    def save_checkpoint(self) -> None:
+        for partition in self.partitions:
+            partition.save_checkpoint()
+
+    def recover(self, criteria: RecoverCriteria, structured: bool = False, apply=None):
+        """Undo of the given transactions, each in its own partition (their write sets are disjoint)."""
+        if not criteria.transaction_id:
+            # Point-in-time recovery needs the merged history, only supported per partition
+            print("Error during recovery: point-in-time recovery is not supported on a partitioned log")
+            return []
+        undo_queries = []
+        for partition, transaction_ids in self._by_partition(criteria.transaction_id).items():
+            undo_queries.extend(partition.recover(RecoverCriteria(transaction_id=transaction_ids), structured, apply))
+        return undo_queries
+
+    def abort_transactions(self, transaction_ids: List[int], structured: bool = False, apply=None) -> List[list]:
+        undo_queries = []
+        for partition, group in self._by_partition(transaction_ids).items():
+            undo_queries.extend(partition.abort_transactions(group, structured, apply))
+        return undo_queries
+
+    def recoverSystem(self, structured: bool = False, apply=None, progress=None, progress_interval: int = 1000,
+                      online: bool = False):
+        """
+        REDO and UNDO of every partition, merged back into global LSN order.
+        apply(item) gets every item in that order and progress(RecoveryProgress) the rate and ETA, as
+        for FailureRecoveryManager.recoverSystem, but no progress marker is saved: an interrupted run
+        starts over. online=True is not supported.
+        """
+        if online:
+            raise TypeError("online undo is not supported on a partitioned log")
+        redo_streams, undo_streams = [], []
+        try:
+            for partition in self.partitions:
+                with partition.lock:
+                    partition._drain_wal()
+                    logs, transaction_table = partition.read_log(lazy=True)
+                    redo_logs, undo_logs = partition._recovery_plan(logs, transaction_table)
+                redo_streams.append(redo_logs)
+                undo_streams.append([(partition, log) for log in undo_logs])
+        except Exception as e:
+            print(f"Error during system recovery: {e}")
+            return [], []
+        tracker = None
+        if apply is not None or progress is not None:
+            total = sum(len(stream) for stream in redo_streams) + sum(len(stream) for stream in undo_streams)
+            tracker = RecoveryProgress(None, max(partition.next_lsn for partition in self.partitions), total,
+                                       progress, progress_interval)
+        redo_query = []
+        for log in heapq.merge(*redo_streams, key=lambda log: log.lsn):
+            item = [log.transaction_id, log.query]
+            if apply is not None:
+                apply(item)
+            redo_query.append(item)
+            if tracker is not None:
+                tracker.advance(log.lsn)
+        if tracker is not None:
+            tracker.start_undo()
+        undo_queries = []
+        for partition, log in heapq.merge(*undo_streams, key=lambda item: -item[1].lsn):
+            items = partition._undo_queries_for([log], structured)
+            if apply is not None:
+                for item in items:
+                    apply(item)
+            undo_queries.extend(items)
+            if tracker is not None:
+                tracker.advance(log.lsn)
+        if tracker is not None:
+            tracker.finish()
+        return redo_query, undo_queries
+
+    def close(self) -> None:
+        for partition in self.partitions:
+            partition.close()
@@ -0,0 +1,119 @@
+import os
+import time
+from typing import Callable, Optional
+
+
+class RecoveryProgress:
+    """
+    Progress of a recoverSystem run that applies its statements, saved as a marker file so a
+    recovery interrupted by another crash resumes where it stopped instead of starting over.
+
+    Marker (<log_file>.recovery): LOG=<end LSN of the log>,REDO=<last redone LSN>,UNDO=<last undone LSN>
+    REDO runs in LSN order and UNDO newest first, so a resumed run skips REDO records up to REDO
+    and UNDO records of the original log (before LOG) from UNDO on. Records appended since, such as
+    the ABORTs and new transactions of an online recovery, are never skipped; a marker of a log
+    that got shorter is ignored. Every `interval` records the marker is saved and
+    `callback(progress)` is called, with records_per_second and eta_seconds measured over this run.
+    Without a path nothing is saved.
+
+    sync() runs before every save and must make the items applied so far durable (the marker then
+    never gets ahead of them). Items applied after the last save are applied again on resume, so
+    apply() must not make them durable by itself unless they are idempotent.
+    """
+
+    def __init__(self, path: Optional[str], log_end: int, total: int,
+                 callback: Optional[Callable[["RecoveryProgress"], None]] = None, interval: int = 1000,
+                 sync: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.log_end = log_end
+        self.sync = sync
+        self.total = total
+        self.callback = callback
+        self.interval = interval
+        self.phase = "REDO"
+        self.done = 0
+        self.redo_lsn = -1
+        self.undo_lsn: Optional[int] = None
+        self.resumed = self._load()
+        self._started = time.monotonic()
+        self._done_at_start = 0
+
+    def _load(self) -> bool:
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r") as marker_file:
+                fields = dict(field.split("=", 1) for field in marker_file.read().strip().split(","))
+            if int(fields["LOG"]) > self.log_end:
+                return False  # written for a longer log: not this one
+            self.log_end = int(fields["LOG"])  # keep telling the original records from the appended ones
+            self.redo_lsn = int(fields["REDO"])
+            self.undo_lsn = int(fields["UNDO"]) if fields["UNDO"] else None
+            return True
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error reading recovery marker {self.path}: {e}")
+            return False
+
+    def skip_redo(self, lsn: int) -> bool:
+        return lsn <= self.redo_lsn
+
+    def skip_undo(self, lsn: int) -> bool:
+        return self.undo_lsn is not None and self.undo_lsn <= lsn < self.log_end
+
+    def skipped(self, count: int) -> None:
+        """Records done by an earlier run: counted as done, but not in this run's rate."""
+        self.done += count
+        self._done_at_start += count
+
+    @property
+    def records_per_second(self) -> float:
+        elapsed = time.monotonic() - self._started
+        return (self.done - self._done_at_start) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.records_per_second
+        return (self.total - self.done) / rate if rate else None
+
+    def advance(self, lsn: int) -> None:
+        """One record of the current phase is applied."""
+        if self.phase == "REDO":
+            self.redo_lsn = lsn
+        else:
+            self.undo_lsn = lsn
+        self.done += 1
+        if self.done % self.interval == 0:
+            self.save()
+            self.report()
+
+    def start_undo(self) -> None:
+        self.phase = "UNDO"
+        self.save()
+        self.report()
+
+    def report(self) -> None:
+        if self.callback is not None:
+            self.callback(self)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        if self.sync is not None:
+            self.sync()  # the applied work first, then the marker that says it is done
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as marker_file:
+            undo = "" if self.undo_lsn is None else self.undo_lsn
+            marker_file.write(f"LOG={self.log_end},REDO={self.redo_lsn},UNDO={undo}\n")
+            marker_file.flush()
+            os.fsync(marker_file.fileno())
+        os.replace(temporary, self.path)
+
+    def finish(self) -> None:
+        """Recovery is complete: report it and drop the marker."""
+        self.phase = "DONE"
+        self.report()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __repr__(self):
+        return f"RecoveryProgress({self.phase}, {self.done}/{self.total}, {self.records_per_second:.0f} records/s)"
@@ -0,0 +1,143 @@
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: no reflinks
+    fcntl = None
+
+FICLONE = 0x40049409  # ioctl cloning a whole file (btrfs, XFS, ...)
+STORAGE_DIR = "../Storage_Manager/storage"
+
+
+def copy_file(source: str, destination: str) -> str:
+    """Copy a file as cheaply as the file system allows: reflink, then copy_file_range, then a plain copy."""
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+                return "reflink"
+            except OSError:
+                pass
+        if hasattr(os, "copy_file_range"):
+            try:
+                while os.copy_file_range(source_file.fileno(), destination_file.fileno(), 1 << 30):
+                    pass
+                return "copy_file_range"
+            except OSError:
+                source_file.seek(0)
+                destination_file.seek(0)
+                destination_file.truncate()
+        shutil.copyfileobj(source_file, destination_file)
+        return "copy"
+
+
+class TableSnapshot:
+    """
+    Images of the table files (<storage_dir>/<table>_table.bin) taken at checkpoints, in
+    <snapshot_dir>/<checkpoint LSN>/ with a snapshot_label:
+        CHECKPOINT_LSN=<the checkpoint the images belong to>
+        START_LSN=<first record still needed: the checkpoint, or the first record of a transaction active at it>
+        TABLES=<file>:<how it was imaged>;...
+
+    take() returns at once and a thread writes the images: tables dirtied since the last snapshot
+    are copied from storage (reflink, i.e. copy-on-write, where the file system supports it), the
+    others are hard links to the previous image. The table files only change when the buffer is
+    flushed at the next checkpoint, which wait()s for the images first, so writers never wait.
+    The label is written last, then older snapshots are removed: the latest labelled snapshot is
+    always complete, and WAL before its START_LSN is no longer needed (see truncate_wal).
+    """
+
+    LABEL = "snapshot_label"
+
+    def __init__(self, snapshot_dir: str, storage_dir: str = STORAGE_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.storage_dir = storage_dir
+        self.checkpoint_lsn: Optional[int] = None
+        self.start_lsn: Optional[int] = None
+        self.tables: Dict[str, str] = {}  # image file -> "reflink", "copy_file_range", "copy" or "link"
+        self.error: Optional[Exception] = None
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(snapshot_dir, exist_ok=True)
+        for name in sorted(os.listdir(snapshot_dir), reverse=True):
+            if self._load(name):
+                break
+
+    @property
+    def path(self) -> Optional[str]:
+        """Directory of the latest complete snapshot."""
+        if self.checkpoint_lsn is None:
+            return None
+        return os.path.join(self.snapshot_dir, f"{self.checkpoint_lsn:020d}")
+
+    def _load(self, name: str) -> bool:
+        label_path = os.path.join(self.snapshot_dir, name, self.LABEL)
+        if not os.path.exists(label_path):
+            return False  # interrupted before its label: not a snapshot
+        with open(label_path, "r") as label:
+            fields = dict(line.rstrip("\n").split("=", 1) for line in label if "=" in line)
+        self.checkpoint_lsn = int(fields["CHECKPOINT_LSN"])
+        self.start_lsn = int(fields["START_LSN"])
+        self.tables = dict(entry.split(":", 1) for entry in fields["TABLES"].split(";") if entry)
+        return True
+
+    def take(self, checkpoint_lsn: int, start_lsn: int, dirty_tables: Iterable[str]) -> None:
+        """Start writing the images of the checkpoint at checkpoint_lsn; the previous ones must be done."""
+        self.wait()
+        if self.checkpoint_lsn is not None and checkpoint_lsn <= self.checkpoint_lsn:
+            return
+        files = [f"{table}_table.bin" for table in dirty_tables]
+        self._thread = threading.Thread(target=self._write, args=(checkpoint_lsn, start_lsn, files), daemon=True)
+        self._thread.start()
+
+    def wait(self) -> None:
+        """Wait for the images being written."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _write(self, checkpoint_lsn: int, start_lsn: int, dirty_files: List[str]) -> None:
+        directory = os.path.join(self.snapshot_dir, f"{checkpoint_lsn:020d}")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tables = {}
+            for name in self.tables:
+                if name not in dirty_files:
+                    destination = os.path.join(directory, name)
+                    if os.path.exists(destination):
+                        os.remove(destination)
+                    os.link(os.path.join(self.path, name), destination)
+                    tables[name] = "link"
+            for name in dirty_files:
+                source = os.path.join(self.storage_dir, name)
+                if os.path.exists(source):
+                    tables[name] = copy_file(source, os.path.join(directory, name))
+                    with open(os.path.join(directory, name), "rb") as image:
+                        os.fsync(image.fileno())
+            temporary_label = os.path.join(directory, self.LABEL + ".tmp")
+            with open(temporary_label, "w") as label:
+                label.write(
+                    f"CHECKPOINT_LSN={checkpoint_lsn}\nSTART_LSN={start_lsn}\n"
+                    f"TABLES={';'.join(f'{name}:{method}' for name, method in sorted(tables.items()))}\n"
+                )
+                label.flush()
+                os.fsync(label.fileno())
+            os.replace(temporary_label, os.path.join(directory, self.LABEL))
+            previous = self.path
+            self.checkpoint_lsn, self.start_lsn, self.tables = checkpoint_lsn, start_lsn, tables
+            if previous is not None:
+                shutil.rmtree(previous, ignore_errors=True)
+        except Exception as e:
+            self.error = e
+            print(f"Error writing table snapshot {directory}: {e}")
+
+    def restore(self, storage_dir: Optional[str] = None) -> List[str]:
+        """Copy the images of the latest snapshot into storage_dir (default: the storage they came from)."""
+        self.wait()
+        storage_dir = storage_dir or self.storage_dir
+        os.makedirs(storage_dir, exist_ok=True)
+        for name in self.tables:
+            copy_file(os.path.join(self.path, name), os.path.join(storage_dir, name))
+        return sorted(self.tables)
@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass(slots=True)
+class UndoOperation:
+    """
+    One row-level change that undoes a logged operation, ready for the Storage_Manager to apply.
+
+    kind is the change to apply: "DELETE" undoes an INSERT, "INSERT" undoes a DELETE and
+    "UPDATE" undoes an UPDATE.
+    key identifies the row: its primary key columns, or when the table has no known key every
+    column of the row as it is now ("DELETE", "UPDATE") or None ("INSERT", the row is not there).
+    before_image holds the values to restore: the whole row for "INSERT", the changed columns
+    for a keyed "UPDATE", the whole row for an unkeyed "UPDATE" (None for "DELETE").
+    """
+    transaction_id: Optional[int]
+    table: str
+    kind: str
+    key: Optional[Dict[str, object]]
+    before_image: Optional[Dict[str, object]]
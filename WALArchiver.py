@@ -0,0 +1,131 @@
+import os
+import threading
+from typing import List, Optional
+
+
+class WALArchiver:
+    """
+    Ships the WAL of a FailureRecoveryManager to an archive directory, continuously.
+
+    The archive holds one append-only file (<archive_dir>/wal.log) with every record in LSN order:
+    records of sealed segments and complete lines of the active log, shipped since the last call.
+    Each shipment is fsynced before shipped_lsn moves. The first one starts at the oldest record
+    the manager still has and records its LSN in archive_label (START_LSN=<lsn>), so an archiver
+    started on an existing archive resumes after its last record even when the log did not start
+    at LSN 0 (archives without a label did). The archiver registers with the manager, whose
+    truncate_wal() keeps the records it has not shipped yet. start() ships every `interval`
+    seconds from a thread; a WALStandby can tail the archive meanwhile.
+    """
+
+    LABEL = "archive_label"
+
+    def __init__(self, manager, archive_dir: str, interval: float = 1.0):
+        self.manager = manager
+        self.archive_dir = archive_dir
+        self.archive_file = os.path.join(archive_dir, "wal.log")
+        self.interval = interval
+        os.makedirs(archive_dir, exist_ok=True)
+        self.start_lsn: Optional[int] = None  # LSN of the first archived record
+        label = os.path.join(archive_dir, self.LABEL)
+        if os.path.exists(label):
+            with open(label, "r") as label_file:
+                fields = dict(line.rstrip("\n").split("=", 1) for line in label_file if "=" in line)
+            self.start_lsn = int(fields["START_LSN"])
+        archived = 0
+        if os.path.exists(self.archive_file):
+            with open(self.archive_file, "rb") as archive:
+                archived = sum(1 for _ in archive)
+            if archived and self.start_lsn is None:
+                self.start_lsn = 0
+        self.shipped_lsn = (self.start_lsn or 0) + archived
+        manager.archivers.append(self)  # truncate_wal() then keeps the records not shipped yet
+        self._active_base: Optional[int] = None  # _segment_base of the active log being read
+        self._active_offset = 0  # bytes of the active log shipped
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _segment_lines(self) -> List[str]:
+        lines = []
+        next_lsn = self.shipped_lsn
+        for segment in self.manager.segments:
+            if segment.end_lsn <= next_lsn:
+                continue
+            for lsn, line in segment.lines(next_lsn):
+                if lsn >= next_lsn:  # lines() starts at the block holding next_lsn
+                    lines.append(line)
+                    next_lsn = lsn + 1
+        return lines
+
+    def _active_lines(self, skip: int) -> List[str]:
+        """Complete lines of the active log past _active_offset, after skipping `skip` lines."""
+        with open(self.manager.log_file, "rb") as log_file:
+            log_file.seek(self._active_offset)
+            data = log_file.read()
+        data = data[:data.rfind(b"\n") + 1]  # a line still being written goes next time
+        lines = data.decode().splitlines(keepends=True)
+        self._active_offset += len(data)
+        return lines[skip:]
+
+    def _oldest_lsn(self) -> int:
+        """LSN of the oldest record the manager still has (truncate_wal drops older ones)."""
+        if self.manager.segments:
+            return self.manager.segments[0].first_lsn
+        return self.manager._segment_base
+
+    def _write_label(self, start_lsn: int) -> None:
+        temporary_label = os.path.join(self.archive_dir, self.LABEL + ".tmp")
+        with open(temporary_label, "w") as label:
+            label.write(f"START_LSN={start_lsn}\n")
+            label.flush()
+            os.fsync(label.fileno())
+        os.replace(temporary_label, os.path.join(self.archive_dir, self.LABEL))
+        self.start_lsn = self.shipped_lsn = start_lsn
+
+    def ship(self) -> int:
+        """Append the records logged since the last shipment to the archive; returns how many."""
+        manager = self.manager
+        with manager.lock:  # seal_segment cannot swap the active log meanwhile
+            oldest_lsn = self._oldest_lsn()
+            if self.start_lsn is None:
+                self._write_label(oldest_lsn)
+            elif oldest_lsn > self.shipped_lsn:
+                raise ValueError(
+                    f"records {self.shipped_lsn} to {oldest_lsn - 1} were dropped from the log before being archived"
+                )
+            lines = []
+            skip = 0
+            if manager._segment_base != self._active_base:
+                # First shipment, or the log was sealed since: catch up from the segments
+                lines = self._segment_lines()
+                self._active_base, self._active_offset = manager._segment_base, 0
+                skip = max(0, self.shipped_lsn + len(lines) - manager._segment_base)
+            lines += self._active_lines(skip)
+        if lines:
+            with open(self.archive_file, "a") as archive:
+                archive.writelines(lines)
+                archive.flush()
+                os.fsync(archive.fileno())
+            self.shipped_lsn += len(lines)
+        return len(lines)
+
+    def start(self) -> "WALArchiver":
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.ship()
+            except Exception as e:
+                print(f"Error shipping WAL to {self.archive_dir}: {e}")
+
+    def stop(self) -> None:
+        """Stop the thread after a last shipment."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.ship()
@@ -0,0 +1,187 @@
+import datetime
+import mmap
+import re
+import zlib
+from typing import Callable, Iterator, Optional
+
+HEADER_FIELDS = re.compile(r"(.+?)(?:,LSN: (\d+))?(?:,Table: (\w+))?(?:,Key: ([\w|]+))?$", re.DOTALL)
+CHECKPOINT_LSN = re.compile(rb"LSN: (\d+),")
+BEFORE = b",Before: "
+# Optional per-record checksum, appended to the line: <record>\tCRC:<crc32 of the record, 8 hex digits>
+CHECKSUM = b"\tCRC:"
+CHECKSUM_SIZE = len(CHECKSUM) + 8
+
+
+def with_checksum(record: str) -> str:
+    """The log line of `record` (no newline) followed by its checksum."""
+    return f"{record}\tCRC:{zlib.crc32(record.encode()):08x}\n"
+
+
+def split_checksum(line):
+    """
+    (record, valid) of a log line (str or bytes, without its newline); valid is None for a line
+    written without checksum.
+    """
+    text = isinstance(line, str)
+    if len(line) < CHECKSUM_SIZE or line[-CHECKSUM_SIZE:-8] != ("\tCRC:" if text else CHECKSUM):
+        return line, None
+    record = line[:-CHECKSUM_SIZE]
+    try:
+        expected = int(line[-8:] if text else bytes(line[-8:]), 16)
+    except ValueError:
+        return record, False
+    return record, zlib.crc32(record.encode() if text else record) == expected
+
+
+class WALRecord:
+    """
+    One record of a memory-mapped log. Only its type and transaction id are decoded up front;
+    the header (query, LSN, table, key), the timestamp and the before/after images are decoded
+    from the mapping the first time they are read, so records recovery only counts or redoes
+    never have their images parsed. Duck-types ExecutionResult for the recovery code.
+    """
+
+    __slots__ = ("_reader", "_header_start", "_payload_start", "_end", "type", "transaction_id", "status",
+                 "_lsn", "_header", "_timestamp", "_images")
+
+    def __init__(self, reader: "WALReader", type: str, transaction_id: Optional[int], lsn: int,
+                 header_start: int, payload_start: int, end: int):
+        self._reader = reader
+        self.type = type
+        self.transaction_id = transaction_id
+        self.status = ""
+        self._lsn = lsn
+        self._header_start = header_start
+        self._payload_start = payload_start
+        self._end = end
+        self._header = None
+        self._timestamp = None
+        self._images = None
+
+    def _text(self, start: int, end: int) -> str:
+        return str(self._reader.view[start:end], "utf-8", "replace")
+
+    def _fields(self) -> tuple:
+        if self._header is None:
+            query, lsn, table, key = HEADER_FIELDS.match(self._text(self._header_start, self._payload_start - len(BEFORE))).groups()
+            if table is not None and self._reader.intern_table is not None:
+                table = self._reader.intern_table(table, key.split("|") if key else None)
+            self._header = (None if query == "None" else query, int(lsn) if lsn else self._lsn, table)
+        return self._header
+
+    @property
+    def query(self) -> Optional[str]:
+        return self._fields()[0]
+
+    @property
+    def lsn(self) -> int:
+        return self._fields()[1]
+
+    @property
+    def table(self) -> Optional[str]:
+        return self._fields()[2]
+
+    @table.setter
+    def table(self, table: Optional[str]) -> None:
+        query, lsn, _ = self._fields()
+        self._header = (query, lsn, table)
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        if self._timestamp is None:
+            # TYPE,tid,<timestamp>,...: the timestamp ends at the comma before the header
+            view = self._reader.view
+            start = self._reader.mapping.rfind(b",", 0, self._header_start - 1) + 1
+            self._timestamp = datetime.datetime.fromisoformat(str(view[start:self._header_start - 1], "ascii"))
+        return self._timestamp
+
+    def _decode_images(self) -> tuple:
+        if self._images is None:
+            payload = self._text(self._payload_start, self._end)
+            before, after = payload.split(",After: ", 1)
+            self._images = (self._reader.decode_rows(before), self._reader.decode_rows(after))
+        return self._images
+
+    @property
+    def previous_data(self):
+        return self._decode_images()[0]
+
+    @property
+    def new_data(self):
+        return self._decode_images()[1]
+
+    def __repr__(self):
+        return f"WALRecord({self.type}, {self.transaction_id}, lsn={self._lsn})"
+
+
+class WALReader:
+    """
+    Walks the records of a WAL file through a read-only mmap without copying it: records are
+    found with find() on the mapping and sliced as memoryviews, and only the bytes a caller
+    asks for are decoded (see WALRecord). CHECKPOINT lines are yielded with their raw state
+    (checkpoint_state).
+
+    Records keep the mapping alive and read from it lazily, so they must not outlive changes
+    to the file other than appends (sealing truncates it).
+    """
+
+    def __init__(self, file, decode_rows: Callable[[str], object], intern_table: Optional[Callable] = None):
+        self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mapping)
+        self.decode_rows = decode_rows  # text of a before/after image -> its rows
+        self.intern_table = intern_table  # (table, key columns or None) -> table name to use
+        self.corrupt_lsns = []  # records skipped because their checksum did not match
+
+    def records(self, start_offset: int = 0, start_lsn: int = 0) -> Iterator:
+        """Records from byte `start_offset` on, the first one numbered `start_lsn`; malformed lines are skipped."""
+        mapping, size = self.mapping, len(self.mapping)
+        position, lsn = start_offset, start_lsn
+        while position < size:
+            end = mapping.find(b"\n", position)
+            if end < 0:
+                end = size
+            record_end = end
+            if end - position >= CHECKSUM_SIZE and mapping[end - CHECKSUM_SIZE:end - 8] == CHECKSUM:
+                _, valid = split_checksum(self.view[position:end])
+                record_end = end - CHECKSUM_SIZE
+                if not valid:
+                    self.corrupt_lsns.append(lsn)
+                    position, lsn = end + 1, lsn + 1
+                    continue
+            record = self._record(position, record_end, lsn)
+            if record is not None:
+                yield record
+            position, lsn = end + 1, lsn + 1
+
+    def _record(self, start: int, end: int, lsn: int):
+        mapping = self.mapping
+        first = mapping.find(b",", start, end)
+        if first < 0:
+            return None
+        record_type = str(self.view[start:first], "ascii", "replace")
+        if record_type == "CHECKPOINT":
+            timestamp_end = mapping.find(b",", first + 1, end)
+            if timestamp_end < 0:
+                return None
+            state_start = timestamp_end + 1
+            match = CHECKPOINT_LSN.match(mapping, state_start, end)
+            if match:
+                lsn = int(match.group(1))  # partitioned log: global LSN
+                state_start = match.end()
+            record = WALRecord(self, record_type, None, lsn, timestamp_end + 1, state_start, end)
+            record._header = (None, lsn, None)
+            record._timestamp = datetime.datetime.fromisoformat(str(self.view[first + 1:timestamp_end], "ascii"))
+            return record
+        second = mapping.find(b",", first + 1, end)
+        third = mapping.find(b",", second + 1, end) if second >= 0 else -1
+        before = mapping.find(BEFORE, third + 1, end) if third >= 0 else -1
+        if before < 0:
+            return None
+        try:
+            transaction_id = int(mapping[first + 1:second])
+        except ValueError:
+            return None
+        return WALRecord(self, record_type, transaction_id, lsn, third + 1, before + len(BEFORE), end)
+
+    def checkpoint_state(self, record: WALRecord) -> str:
+        return str(self.view[record._payload_start:record._end], "utf-8", "replace").strip()
@@ -0,0 +1,130 @@
+import bisect
+import datetime
+import lzma
+import os
+import zlib
+from typing import Callable, Iterator, List, Optional, Tuple
+
+COMPRESSORS = {
+    "none": (lambda data: data, lambda data: data),
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+class SegmentBlock:
+    __slots__ = ("first_lsn", "offset", "length", "records", "max_timestamp")
+
+    def __init__(self, first_lsn: int, offset: int, length: int, records: int, max_timestamp: Optional[datetime.datetime]):
+        self.first_lsn = first_lsn
+        self.offset = offset
+        self.length = length
+        self.records = records
+        self.max_timestamp = max_timestamp
+
+
+class WALSegment:
+    """
+    A sealed, read-only piece of the WAL.
+
+    Records are grouped into blocks of about `block_size` bytes and every block is compressed
+    on its own (zlib, lzma or none), so any block can be read without touching the others.
+    The sidecar index (<segment>.idx) holds the compression and one line per block:
+        <first_lsn>,<offset>,<compressed length>,<record count>,<running max timestamp>
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.blocks: List[SegmentBlock] = []
+        with open(self.index_path, "r") as index_file:
+            self.compression = index_file.readline().strip().split("=", 1)[1]
+            for line in index_file:
+                first_lsn, offset, length, records, max_timestamp = line.rstrip("\n").split(",")
+                self.blocks.append(SegmentBlock(
+                    int(first_lsn), int(offset), int(length), int(records),
+                    datetime.datetime.fromisoformat(max_timestamp) if max_timestamp else None,
+                ))
+        self._block_lsns = [block.first_lsn for block in self.blocks]
+        self._decompress = COMPRESSORS[self.compression][1]
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        lines: List[str],
+        first_lsn: int,
+        compression: str = "none",
+        block_size: int = 64 * 1024,
+        timestamp_of: Optional[Callable[[str], Optional[datetime.datetime]]] = None,
+    ) -> "WALSegment":
+        """Write `lines` (one record each) as a segment; the index is written last and marks it complete."""
+        compress = COMPRESSORS[compression][0]
+        index_lines = []
+        offset = 0
+        lsn = first_lsn
+        max_timestamp = None
+        with open(path, "wb") as segment_file:
+            start = 0
+            while start < len(lines):
+                end, size = start, 0
+                while end < len(lines) and (end == start or size + len(lines[end]) <= block_size):
+                    size += len(lines[end])
+                    end += 1
+                block_lines = lines[start:end]
+                if timestamp_of is not None:
+                    for line in block_lines:
+                        timestamp = timestamp_of(line)
+                        if timestamp is not None and (max_timestamp is None or timestamp > max_timestamp):
+                            max_timestamp = timestamp
+                data = compress("".join(block_lines).encode())
+                segment_file.write(data)
+                index_lines.append(
+                    f"{lsn},{offset},{len(data)},{len(block_lines)},"
+                    f"{max_timestamp.isoformat() if max_timestamp else ''}\n"
+                )
+                offset += len(data)
+                lsn += len(block_lines)
+                start = end
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+        temporary_index = path + ".idx.tmp"
+        with open(temporary_index, "w") as index_file:
+            index_file.write(f"compression={compression}\n")
+            index_file.writelines(index_lines)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(temporary_index, path + ".idx")
+        return cls(path)
+
+    @property
+    def first_lsn(self) -> int:
+        return self.blocks[0].first_lsn if self.blocks else 0
+
+    @property
+    def end_lsn(self) -> int:
+        """LSN following the last record of the segment."""
+        if not self.blocks:
+            return 0
+        return self.blocks[-1].first_lsn + self.blocks[-1].records
+
+    def block_for_lsn(self, lsn: int) -> int:
+        return max(bisect.bisect_right(self._block_lsns, lsn) - 1, 0)
+
+    def read_block(self, index: int) -> List[str]:
+        block = self.blocks[index]
+        with open(self.path, "rb") as segment_file:
+            segment_file.seek(block.offset)
+            data = segment_file.read(block.length)
+        return self._decompress(data).decode().splitlines(keepends=True)
+
+    def lines(self, from_lsn: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """(lsn, line) pairs in log order, starting at the block holding `from_lsn`."""
+        start = self.block_for_lsn(from_lsn) if from_lsn is not None else 0
+        for index in range(start, len(self.blocks)):
+            yield from enumerate(self.read_block(index), self.blocks[index].first_lsn)
+
+    def blocks_reversed(self) -> Iterator[Tuple[int, List[str]]]:
+        """(first_lsn, lines) of every block, newest block first."""
+        for index in range(len(self.blocks) - 1, -1, -1):
+            yield self.blocks[index].first_lsn, self.read_block(index)
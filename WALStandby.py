@@ -0,0 +1,114 @@
+import io
+import os
+import threading
+from typing import Dict, List, Optional
+
+from ActiveTransactionTable import ActiveTransactionTable
+from CheckpointScheduler import CheckpointScheduler
+from FailureRecoveryManager import ExecutionResult, FailureRecoveryManager
+
+
+class WALStandby:
+    """
+    A standby kept current from a WAL archive (see WALArchiver): replay() passes the REDO item
+    ([transaction_id, query]) of every new data record to apply(), in LSN order, and remembers the
+    records of the transactions still in flight. On an ABORT it passes the undo of that transaction's
+    records to apply(), newest first. start() replays every `interval` seconds.
+
+    Failover is promote(): replay what is left, undo the in-flight transactions (newest first,
+    through apply() too), log their ABORT and return a FailureRecoveryManager writing to the
+    archived log, which becomes the primary. Stop the archiver of the old primary first.
+    """
+
+    def __init__(self, archive_dir: str, apply, interval: float = 1.0, structured: bool = False):
+        self.archive_file = os.path.join(archive_dir, "wal.log")
+        self.apply = apply
+        self.interval = interval
+        self.structured = structured
+        # No checkpoints into the archive while standing by: the scheduler starts on promote()
+        self.manager = FailureRecoveryManager(log_file=self.archive_file, checkpoint_scheduler=CheckpointScheduler())
+        self.applied_lsn = 0  # LSN of the next record to replay
+        self.promoted = False
+        self._offset = 0  # bytes of the archive replayed
+        self._in_flight: Dict[int, List[ExecutionResult]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def in_flight(self) -> List[int]:
+        """Transactions started but neither committed nor aborted in the replayed log."""
+        return list(self._in_flight)
+
+    def replay(self) -> int:
+        """Apply the REDO of the records archived since the last call; returns how many lines were read."""
+        with self._lock:
+            with open(self.archive_file, "rb") as archive:
+                archive.seek(self._offset)
+                data = archive.read()
+            data = data[:data.rfind(b"\n") + 1]  # a shipment still being written goes next time
+            if not data:
+                return 0
+            records, _ = self.manager._parse_lines(enumerate(io.TextIOWrapper(io.BytesIO(data)), self.applied_lsn))
+            for record in records:
+                if record.type == "COMMIT":
+                    self._in_flight.pop(record.transaction_id, None)
+                elif record.type == "ABORT":
+                    aborted = self._in_flight.pop(record.transaction_id, [])
+                    for item in self.manager._undo_queries_for(aborted[::-1], self.structured):
+                        self.apply(item)
+                elif record.type == "CHECKPOINT":
+                    continue
+                else:
+                    in_flight = self._in_flight.setdefault(record.transaction_id, [])
+                    if record.type in ("INSERT", "UPDATE", "DELETE"):
+                        self.apply([record.transaction_id, record.query])
+                        in_flight.append(record)
+            lines = data.count(b"\n")
+            self._offset += len(data)
+            self.applied_lsn += lines
+            return lines
+
+    def start(self) -> "WALStandby":
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.replay()
+            except Exception as e:
+                print(f"Error replaying {self.archive_file}: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def promote(self) -> FailureRecoveryManager:
+        """Finish the replay, roll back the in-flight transactions and become the primary."""
+        self.stop()
+        self.replay()
+        with self._lock:
+            manager = self.manager
+            losers = sorted(
+                (record for records in self._in_flight.values() for record in records),
+                key=lambda record: record.lsn, reverse=True,
+            )
+            for item in manager._undo_queries_for(losers, self.structured):
+                self.apply(item)
+            # The manager was opened on a shorter archive: continue the log after the replayed records
+            manager.next_lsn = manager._checkpoint_lsn = self.applied_lsn
+            manager.log_bytes = self._offset
+            manager._ts_index_ready = False
+            manager.transaction_table = ActiveTransactionTable(self._in_flight)
+            for transaction_id in list(self._in_flight):
+                manager.log_abort(transaction_id)
+            self._in_flight.clear()
+            manager.checkpoint_scheduler.start()
+            self.promoted = True
+            return manager
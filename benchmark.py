@@ -0,0 +1,359 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import FailureRecoveryManager
+from AsyncFailureRecoveryManager import AsyncFailureRecoveryManager
+from RecoverCriteria import RecoverCriteria
+
+
+def new_manager(**kwargs):
+    fd, path = tempfile.mkstemp(suffix=".log")
+    os.close(fd)
+    return FailureRecoveryManager.FailureRecoveryManager(log_file=path, **kwargs), path
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_undo(total_rows=100_000, records=100):
+    """Undo of one transaction that updated `total_rows` rows: SQL strings vs structured UndoOperations."""
+    manager, path = new_manager(log_size=records + 2)
+    manager.register_table_keys("accounts", ["id"])
+    now = datetime.now()
+    manager.write_log(FailureRecoveryManager.ExecutionResult(
+        transaction_id=1, timestamp=now, type="START", status="", query=None, previous_data=None, new_data=None
+    ))
+    rows_per_record = total_rows // records
+    for record in range(records):
+        ids = range(record * rows_per_record, (record + 1) * rows_per_record)
+        manager.write_log(FailureRecoveryManager.ExecutionResult(
+            transaction_id=1, timestamp=now, type="UPDATE", status="",
+            query="UPDATE accounts SET balance=balance+1;",
+            previous_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': i} for i in ids], rows_per_record),
+            new_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': i + 1} for i in ids], rows_per_record),
+        ))
+
+    criteria = RecoverCriteria(transaction_id=[1])
+    queries, sql_seconds = timed(manager.recover, criteria)
+    manager.undo_list = [1]
+    operations, structured_seconds = timed(manager.recover, criteria, structured=True)
+    sql_text = sum(len(query) for _, query in queries)
+
+    print(f"undo of {total_rows} updated rows in {records} records")
+    print(f"  SQL strings     : {sql_seconds * 1000:8.1f} ms, {len(queries)} statements, "
+          f"{sql_text} characters for the query processor to parse again")
+    print(f"  UndoOperations  : {structured_seconds * 1000:8.1f} ms, {len(operations)} operations, "
+          f"0 characters to parse (applied directly by the Storage_Manager)")
+    os.remove(path)
+
+
+def bench_log_memory(records=10_000):
+    """Memory held by the parsed log (ExecutionResult + Rows objects) for `records` UPDATE records."""
+    manager, path = new_manager(log_size=1000)
+    now = datetime.now()
+    for i in range(records):
+        manager.write_log(FailureRecoveryManager.ExecutionResult(
+            transaction_id=i, timestamp=now, type="UPDATE", status="",
+            query=f"UPDATE accounts SET balance={i + 1} WHERE id={i};",
+            previous_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': i}], 1),
+            new_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': i + 1}], 1),
+        ))
+    manager.save_checkpoint()
+
+    tracemalloc.start()
+    (logs, _), seconds = timed(manager.parse_log_file, path)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"parsed {len(logs)} log records in {seconds * 1000:.1f} ms (traced), {held / 1e6:.1f} MB held")
+    os.remove(path)
+
+
+def bench_mapped_recovery(transactions=20_000, active=100, rows=5):
+    """recoverSystem over a log of committed transactions and a few active ones: text parse vs memory-mapped reader."""
+    manager, path = new_manager(log_size=1000)
+    now = datetime.now()
+    for tid in range(transactions + active):
+        manager.write_log(FailureRecoveryManager.ExecutionResult(
+            transaction_id=tid, timestamp=now, type="UPDATE", status="",
+            query=f"UPDATE accounts SET balance=balance+1 WHERE id<{rows};",
+            previous_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': tid} for i in range(rows)], rows),
+            new_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': tid + 1} for i in range(rows)], rows),
+        ))
+        if tid < transactions:
+            manager.write_log(FailureRecoveryManager.ExecutionResult(
+                transaction_id=tid, timestamp=now, type="COMMIT", status="", query=None, previous_data=None, new_data=None
+            ))
+    manager.close()
+
+    restarted = FailureRecoveryManager.FailureRecoveryManager(log_file=path)
+    eager_read = restarted.read_log
+    restarted.read_log = lambda lazy=False: eager_read()  # the text parser, as before
+    eager, eager_seconds = timed(restarted.recoverSystem)
+    del restarted.read_log
+    mapped, mapped_seconds = timed(restarted.recoverSystem)
+    assert eager == mapped
+    print(f"recoverSystem over {transactions + active} transactions ({active} to undo): "
+          f"text parse {eager_seconds * 1000:.1f} ms, memory-mapped {mapped_seconds * 1000:.1f} ms")
+    os.remove(path)
+
+
+def bench_parallel_parse(records=100_000, workers=os.cpu_count() or 1):
+    """parse_log_file on one core vs parse_workers processes (pool start-up excluded)."""
+    manager, path = new_manager(log_size=1000)
+    now = datetime.now()
+    for i in range(records):
+        manager.write_log(FailureRecoveryManager.ExecutionResult(
+            transaction_id=i, timestamp=now, type="UPDATE", status="",
+            query=f"UPDATE accounts SET balance={i + 1} WHERE id={i};",
+            previous_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': i}], 1),
+            new_data=FailureRecoveryManager.Rows([{'id': i, 'owner': f'user{i}', 'balance': i + 1}], 1),
+        ))
+    manager.close()
+
+    (sequential, _), sequential_seconds = timed(manager.parse_log_file, path)
+    parallel = FailureRecoveryManager.FailureRecoveryManager(log_file=path, parse_workers=workers)
+    parallel.parallel_parse_min_bytes = 0
+    parallel.parse_log_file(path)  # start the pool
+    (merged, _), parallel_seconds = timed(parallel.parse_log_file, path)
+    parallel.close()
+    assert merged == sequential
+    print(f"parsed {records} records ({os.path.getsize(path) / 1e6:.1f} MB): one process {sequential_seconds * 1000:.1f} ms, "
+          f"{workers} workers {parallel_seconds * 1000:.1f} ms")
+    os.remove(path)
+
+
+def bench_tail_repair(records=100_000):
+    """Opening a checksummed log with a torn tail (tail repair only) vs validating every record."""
+    manager, path = new_manager(log_size=1000, checksums=True)
+    now = datetime.now()
+    for i in range(records):
+        manager.write_log(FailureRecoveryManager.ExecutionResult(
+            transaction_id=i, timestamp=now, type="UPDATE", status="",
+            query=f"UPDATE accounts SET balance={i + 1} WHERE id={i};",
+            previous_data=FailureRecoveryManager.Rows([{'id': i, 'balance': i}], 1),
+            new_data=FailureRecoveryManager.Rows([{'id': i, 'balance': i + 1}], 1),
+        ))
+    manager.close()
+    with open(path, "a") as log_file:
+        log_file.write("UPDATE,1,2024-12-01T10:00:00,UPDATE acc")  # torn write
+
+    restarted, open_seconds = timed(FailureRecoveryManager.FailureRecoveryManager, log_file=path, checksums=True)
+    _, scan_seconds = timed(restarted.parse_log_file, path, lazy=True)
+    print(f"open with tail repair of a {os.path.getsize(path) / 1e6:.1f} MB log: {open_seconds * 1000:.1f} ms "
+          f"({restarted.repaired_bytes} bytes cut), full checksum scan {scan_seconds * 1000:.1f} ms")
+    os.remove(path)
+
+
+def bench_update_bytes(width=30):
+    """Bytes written for a one-column UPDATE of a `width`-column row: full images vs delta-encoded."""
+    manager, path = new_manager()
+    row = {'id': 1, **{f'column_{i}': f'value number {i}' for i in range(width - 1)}}
+    entry = FailureRecoveryManager.ExecutionResult(
+        transaction_id=1, timestamp=datetime.now(), type="UPDATE", status="", table="wide",
+        query="UPDATE wide SET column_0='changed' WHERE id=1;",
+        previous_data=FailureRecoveryManager.Rows([row], 1),
+        new_data=FailureRecoveryManager.Rows([dict(row, column_0='changed')], 1),
+    )
+    full = len(manager._format_log_entry(entry).encode())
+    manager.register_table_keys("wide", ["id"])
+    delta = len(manager._format_log_entry(entry).encode())
+    print(f"one-column UPDATE of a {width}-column row: {full} bytes full images, {delta} bytes delta-encoded")
+    os.remove(path)
+
+
+def bench_write_log_threads(threads=8, transactions=200, updates=5):
+    """write_log throughput with concurrent producers: memory_wal under the global lock, swapped buffers, byte ring."""
+    def run(**kwargs):
+        manager, path = new_manager(**kwargs)
+        now = datetime.now()
+        latencies = []  # of non-COMMIT appends
+
+        def producer(first_tid):
+            for tid in range(first_tid, first_tid + transactions):
+                manager.write_log(FailureRecoveryManager.ExecutionResult(
+                    transaction_id=tid, timestamp=now, type="START", status="", query=None, previous_data=None, new_data=None
+                ))
+                for i in range(updates):
+                    entry = FailureRecoveryManager.ExecutionResult(
+                        transaction_id=tid, timestamp=now, type="UPDATE", status="",
+                        query=f"UPDATE accounts SET balance={i + 1} WHERE id={i};",
+                        previous_data=FailureRecoveryManager.Rows([{'id': i, 'balance': i}], 1),
+                        new_data=FailureRecoveryManager.Rows([{'id': i, 'balance': i + 1}], 1),
+                    )
+                    start = time.perf_counter()
+                    manager.write_log(entry)
+                    latencies.append(time.perf_counter() - start)
+                manager.write_log(FailureRecoveryManager.ExecutionResult(
+                    transaction_id=tid, timestamp=now, type="COMMIT", status="", query=None, previous_data=None, new_data=None
+                ))
+
+        workers = [threading.Thread(target=producer, args=(n * transactions,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - start
+        manager.close()
+        os.remove(path)
+        latencies.sort()
+        return seconds, latencies[int(len(latencies) * 0.99)]
+
+    records = threads * transactions * (updates + 2)
+    print(f"{records} records from {threads} threads (p99 is of the non-COMMIT appends)")
+    for label, kwargs in (
+        ("memory_wal + global lock", {}),
+        ("4 swapped WAL buffers   ", {"wal_buffers": 4}),
+        ("byte ring + flusher     ", {"log_buffer_size": 1 << 20}),
+    ):
+        seconds, p99 = run(**kwargs)
+        print(f"  {label} : {seconds * 1000:8.1f} ms ({records / seconds:,.0f} records/s), p99 append {p99 * 1e6:7.1f} us")
+
+def bench_async_commits(transactions=5000):
+    """Transactions kept in flight by one event loop: each awaits its commit, flushed in groups."""
+    def records(tid, now):
+        return [
+            FailureRecoveryManager.ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="", query=None, previous_data=None, new_data=None
+            ),
+            FailureRecoveryManager.ExecutionResult(
+                transaction_id=tid, timestamp=now, type="UPDATE", status="",
+                query=f"UPDATE accounts SET balance=1 WHERE id={tid};",
+                previous_data=FailureRecoveryManager.Rows([{'id': tid, 'balance': 0}], 1),
+                new_data=FailureRecoveryManager.Rows([{'id': tid, 'balance': 1}], 1),
+            ),
+        ]
+
+    manager, path = new_manager()
+    now = datetime.now()
+    start = time.perf_counter()
+    for tid in range(transactions):
+        for record in records(tid, now):
+            manager.write_log(record)
+        manager.write_log(FailureRecoveryManager.ExecutionResult(
+            transaction_id=tid, timestamp=now, type="COMMIT", status="", query=None, previous_data=None, new_data=None
+        ))
+    blocking = time.perf_counter() - start
+    os.remove(path)
+
+    async def run():
+        frm = AsyncFailureRecoveryManager(manager)
+
+        async def transaction(tid):
+            for record in records(tid, now):
+                await frm.write_log(record)
+            await frm.commit(tid, now)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(transaction(tid) for tid in range(transactions)))
+        seconds = time.perf_counter() - start
+        await frm.close()
+        return seconds, frm.group_flushes
+
+    manager, path = new_manager()
+    concurrent, flushes = asyncio.run(run())
+    os.remove(path)
+    print(f"{transactions} transactions, commit durable on return")
+    print(f"  blocking write_log, one at a time : {blocking * 1000:8.1f} ms, {transactions} flushes")
+    print(f"  asyncio, all in flight            : {concurrent * 1000:8.1f} ms, {flushes} group flushes")
+
+
+def _commit_transactions(path, first_tid, transactions, updates, multiprocess):
+    manager = FailureRecoveryManager.FailureRecoveryManager(log_file=path, multiprocess=multiprocess)
+    now = datetime.now()
+    for tid in range(first_tid, first_tid + transactions):
+        for i in range(updates):
+            manager.write_log(FailureRecoveryManager.ExecutionResult(
+                transaction_id=tid, timestamp=now, type="UPDATE", status="",
+                query=f"UPDATE accounts SET balance={i + 1} WHERE id={i};",
+                previous_data=FailureRecoveryManager.Rows([{'id': i, 'balance': i}], 1),
+                new_data=FailureRecoveryManager.Rows([{'id': i, 'balance': i + 1}], 1),
+            ))
+        manager.write_log(FailureRecoveryManager.ExecutionResult(
+            transaction_id=tid, timestamp=now, type="COMMIT", status="", query=None, previous_data=None, new_data=None
+        ))
+
+
+def bench_multiprocess_appends(processes=4, transactions=500, updates=5):
+    """Committed transactions per second: one process, vs N processes sharing the log (fcntl lock + O_APPEND)."""
+    def run(workers, multiprocess):
+        fd, path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        jobs = [
+            multiprocessing.Process(target=_commit_transactions, args=(path, n * transactions, transactions, updates, multiprocess))
+            for n in range(workers)
+        ]
+        start = time.perf_counter()
+        for job in jobs:
+            job.start()
+        for job in jobs:
+            job.join()
+        seconds = time.perf_counter() - start
+        with open(path) as log_file:
+            lines = sum(1 for _ in log_file)
+        os.remove(path)
+        assert lines == workers * transactions * (updates + 1)
+        return seconds
+
+    print(f"{transactions} transactions of {updates} updates per process")
+    for label, workers, multiprocess in (
+        ("1 process, plain append", 1, False),
+        ("1 process, locked append", 1, True),
+        (f"{processes} processes, locked append", processes, True),
+    ):
+        seconds = run(workers, multiprocess)
+        print(f"  {label:28} : {seconds * 1000:8.1f} ms ({workers * transactions / seconds:,.0f} commits/s)")
+
+
+def bench_snapshot_checkpoint(tables=4, table_mb=64, transactions=20_000):
+    """Snapshot checkpoint: time save_checkpoint blocks vs time the table images take, and WAL dropped by truncate_wal."""
+    storage_dir, snapshot_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    manager, path = new_manager(log_size=1000, snapshot_dir=snapshot_dir, storage_dir=storage_dir)
+    block = os.urandom(1 << 20)
+    for table in range(tables):
+        with open(os.path.join(storage_dir, f"table{table}_table.bin"), "wb") as table_file:
+            for _ in range(table_mb):
+                table_file.write(block)
+    now = datetime.now()
+    for i in range(transactions):
+        for record_type in ("START", "UPDATE", "COMMIT"):
+            manager.write_log(FailureRecoveryManager.ExecutionResult(
+                transaction_id=i, timestamp=now, type=record_type, status="",
+                query=f"UPDATE table{i % tables} SET balance={i} WHERE id={i};" if record_type == "UPDATE" else None,
+                previous_data=FailureRecoveryManager.Rows([{'id': i, 'balance': 0}], 1) if record_type == "UPDATE" else None,
+                new_data=FailureRecoveryManager.Rows([{'id': i, 'balance': i}], 1) if record_type == "UPDATE" else None,
+            ))
+    log_bytes = os.path.getsize(path)
+    _, checkpoint_seconds = timed(manager.save_checkpoint)
+    _, image_seconds = timed(manager.snapshots.wait)
+    dropped = manager.truncate_wal()
+    methods = sorted(set(manager.snapshots.tables.values()))
+    print(f"snapshot checkpoint of {tables} x {table_mb} MB tables: save_checkpoint {checkpoint_seconds * 1000:.1f} ms, "
+          f"images {(checkpoint_seconds + image_seconds) * 1000:.1f} ms ({', '.join(methods)}); "
+          f"truncate_wal dropped {dropped} records ({log_bytes / 1e6:.1f} MB)")
+    manager.close()
+    for directory in (storage_dir, snapshot_dir, path + ".segments"):
+        shutil.rmtree(directory, ignore_errors=True)
+    os.remove(path)
+
+if __name__ == "__main__":
+    bench_undo()
+    bench_log_memory()
+    bench_mapped_recovery()
+    bench_parallel_parse()
+    bench_tail_repair()
+    bench_update_bytes()
+    bench_write_log_threads()
+    bench_async_commits()
+    bench_multiprocess_appends()
+    bench_snapshot_checkpoint()
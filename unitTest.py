@@ -1,4 +1,9 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
 import sys
+import tempfile
 import time
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
@@ -7,6 +12,42 @@ from FailureRecoveryManager import FailureRecoveryManager, ExecutionResult, Rows
 import threading
 
 from RecoverCriteria import RecoverCriteria
+from UndoOperation import UndoOperation
+from FlushPolicy import FlushPolicy
+from AsyncFailureRecoveryManager import AsyncFailureRecoveryManager
+from CheckpointScheduler import CheckpointScheduler
+from PartitionedFailureRecoveryManager import PartitionedFailureRecoveryManager
+from WALArchiver import WALArchiver
+from BaseBackup import BaseBackup
+from LockedAppend import LockedAppend
+from TableSnapshot import TableSnapshot
+import BaseBackup as base_backup_module
+from WALStandby import WALStandby
+
+def _append_transactions(log_file, worker, count):
+    """Worker process of test_multiprocess_appends_do_not_interleave."""
+    manager = FailureRecoveryManager(log_file=log_file, multiprocess=True, checkpoint_scheduler=CheckpointScheduler())
+    for index in range(count):
+        tid = worker * 1000 + index
+        for record_type in ("START", "UPDATE", "COMMIT"):
+            manager.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=datetime.now(), type=record_type, status="",
+                query=f"UPDATE accounts SET balance={index} WHERE id={tid};" if record_type == "UPDATE" else None,
+                previous_data=Rows([{'id': tid, 'balance': 0}], 1) if record_type == "UPDATE" else None,
+                new_data=Rows([{'id': tid, 'balance': index}], 1) if record_type == "UPDATE" else None
+            ))
+
+def _log_uncommitted_update(log_file, tid):
+    """Worker process of test_multiprocess_checkpoint_lists_other_processes_transactions: logs and exits without committing."""
+    manager = FailureRecoveryManager(log_file=log_file, multiprocess=True, checkpoint_scheduler=CheckpointScheduler())
+    for record_type in ("START", "UPDATE"):
+        manager.write_log(ExecutionResult(
+            transaction_id=tid, timestamp=datetime(2024, 12, 1, 10, 0, 0), type=record_type, status="",
+            query="UPDATE accounts SET balance=5 WHERE id=1;" if record_type == "UPDATE" else None,
+            previous_data=Rows([{'id': 1, 'balance': 0}], 1) if record_type == "UPDATE" else None,
+            new_data=Rows([{'id': 1, 'balance': 5}], 1) if record_type == "UPDATE" else None
+        ))
+    manager._flush_memory_wal()
 
 class ColoredTextTestResult(unittest.TextTestResult):
     GREEN = "\033[92m"
@@ -35,10 +76,10 @@ class ColoredTextTestRunner(unittest.TextTestRunner):
 class TestFailureRecoveryManager(unittest.TestCase):
 
     def setUp(self):
-        # Reset class-level variables before each test
-        FailureRecoveryManager._checkpoint_thread_started = False
+        # A scheduler of its own (never started), so no background checkpoint runs during a test
+        self.scheduler = CheckpointScheduler()
         self.mock_file = "test.log"
-        self.manager = FailureRecoveryManager(log_file=self.mock_file)
+        self.manager = FailureRecoveryManager(log_file=self.mock_file, checkpoint_scheduler=self.scheduler)
 
 
     @patch("builtins.open", new_callable=mock_open)
@@ -278,7 +319,7 @@ class TestFailureRecoveryManager(unittest.TestCase):
                     "ACTIVE,1,2024-12-10T10:00:00,UPDATE table_name SET name='new_value' WHERE id=1,"
                     "Before: [{'id': 1, 'name': 'old_value'}],After: [{'id': 1, 'name': 'new_value'}]\n"
                 )
-                handle.write.assert_any_call('CHECKPOINT,2024-12-10T10:00:00,[]\n')
+                handle.write.assert_any_call('CHECKPOINT,2024-12-10T10:00:00,ATT=\n')
     def test_parse_log_file_with_valid_logs(self):
         # Arrange
         log_content = (
@@ -294,6 +335,36 @@ class TestFailureRecoveryManager(unittest.TestCase):
             self.assertEqual(len(results), 2)
             self.assertEqual(results[0].transaction_id, 1)
             self.assertEqual(results[1].type, "CHECKPOINT")
+            self.assertEqual(list(undo_list), [1, 2, 3])
+
+    def test_parse_log_file_with_transaction_table_checkpoint(self):
+        # Arrange
+        log_content = "CHECKPOINT,2024-12-10T11:00:00,ATT=7:ACTIVE:3:9:1733828400.0;8:ACTIVE:5:5:\n"
+        with patch("builtins.open", mock_open(read_data=log_content)):
+            # Act
+            results, transaction_table = self.manager.parse_log_file(self.mock_file)
+
+        # Assert
+        self.assertEqual(results[0].type, "CHECKPOINT")
+        self.assertEqual(list(transaction_table), [7, 8])
+        self.assertEqual(transaction_table.get(7).first_lsn, 3)
+        self.assertEqual(transaction_table.get(7).last_lsn, 9)
+        self.assertEqual(transaction_table.get(7).start_time, datetime.fromtimestamp(1733828400.0))
+        self.assertIsNone(transaction_table.get(8).start_time)
+
+    @patch("builtins.open", new_callable=mock_open)
+    def test_write_log_tracks_transaction_lsns(self, mocked_file):
+        """Test the transaction table keeps the first and last LSN of each active transaction."""
+        for type in ("START", "INSERT", "UPDATE"):
+            self.manager.write_log(ExecutionResult(
+                transaction_id=9, timestamp=datetime(2024, 12, 10, 10, 0, 0), type=type, status="",
+                query=None, previous_data=None, new_data=None
+            ))
+
+        entry = self.manager.transaction_table.get(9)
+        self.assertEqual(entry.first_lsn, self.manager.next_lsn - 3)
+        self.assertEqual(entry.last_lsn, self.manager.next_lsn - 1)
+        self.assertEqual(entry.start_time, datetime(2024, 12, 10, 10, 0, 0))
 
 
 
@@ -324,7 +395,7 @@ class TestFailureRecoveryManager(unittest.TestCase):
         handle.write.assert_any_call(
             f"ACTIVE,1,{fixed_time.isoformat()},UPDATE table_name SET value='new_value' WHERE id=1,Before: {repr(log_entry.previous_data.data)},After: {repr(log_entry.new_data.data)}\n"
         )
-        handle.write.assert_any_call(f"CHECKPOINT,{fixed_time.isoformat()},[]\n")
+        handle.write.assert_any_call(f"CHECKPOINT,{fixed_time.isoformat()},ATT=\n")
         self.assertEqual(len(self.manager.memory_wal), 0)  # Ensure memory WAL is cleared
 
 
@@ -343,7 +414,7 @@ class TestFailureRecoveryManager(unittest.TestCase):
         # Assert
         self.assertEqual(mocked_file.call_count, 1)  # Only checkpoint log is written
         handle = mocked_file()
-        handle.write.assert_called_once_with(f"CHECKPOINT,{fixed_time.isoformat()},[]\n")
+        handle.write.assert_called_once_with(f"CHECKPOINT,{fixed_time.isoformat()},ATT=\n")
 
     @patch("builtins.open", new_callable=mock_open)
     @patch("datetime.datetime")
@@ -360,8 +431,24 @@ class TestFailureRecoveryManager(unittest.TestCase):
         # Assert
         self.assertEqual(mocked_file.call_count, 1)  # Only checkpoint log is written
         handle = mocked_file()
-        handle.write.assert_called_once_with(f"CHECKPOINT,{fixed_time.isoformat()},[1, 2, 3]\n")
+        handle.write.assert_called_once_with(
+            f"CHECKPOINT,{fixed_time.isoformat()},ATT=1:ACTIVE:::;2:ACTIVE:::;3:ACTIVE:::\n"
+        )
+
 
+    def test_rows_store_columns_once_and_values_as_tuples(self):
+        # Arrange
+        rows = Rows([{"id": 1, "name": "a"}, {"id": 2, "name": "b"}], 2)
+        other = Rows([{"id": 3, "name": "c"}], 1)
+
+        # Assert
+        self.assertEqual(rows.column_names, ("id", "name"))
+        self.assertIs(rows.column_names, other.column_names)
+        self.assertEqual(rows.values, [(1, "a"), (2, "b")])
+        self.assertEqual(rows.data, [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}])
+        self.assertEqual(Rows([{"id": 1}, {"name": "x"}], 2).data, [{"id": 1}, {"name": "x"}])
+        self.assertFalse(hasattr(rows, "__dict__"))
+        self.assertFalse(hasattr(ExecutionResult(1, datetime.now(), "START", "", None, None, None), "__dict__"))
 
     def test_build_update_query(self):
         # Arrange
@@ -401,6 +488,51 @@ class TestFailureRecoveryManager(unittest.TestCase):
         expected_query = "INSERT INTO users (id, name) VALUES (1, 'old_value');"
         self.assertEqual(queries[0], expected_query)
 
+    def test_build_delete_query_multiple_rows(self):
+        # Arrange
+        table_name = "users"
+        after = Rows([{"id": 1, "name": "a"}, {"id": 2, "name": "b"}], 2)
+
+        # Act
+        queries = self.manager.build_delete_query(table_name, after)
+
+        # Assert
+        expected_query = "DELETE FROM users WHERE (id=1 AND name='a') OR (id=2 AND name='b');"
+        self.assertEqual(queries, [expected_query])
+
+    def test_build_update_query_with_primary_key(self):
+        # Arrange
+        columns = {"id": "INTEGER PRIMARY KEY", "name": "TEXT", "qty": "INTEGER"}
+        before = Rows([{"id": 1, "name": "a", "qty": 1}, {"id": 2, "name": "b", "qty": 2}], 2, columns=columns)
+        after = Rows([{"id": 1, "name": "x", "qty": 1}, {"id": 2, "name": "y", "qty": 5}], 2)
+
+        # Act
+        queries = self.manager.build_update_query("items", before, after)
+
+        # Assert
+        expected_query = (
+            "UPDATE items SET name=CASE id WHEN 1 THEN 'a' WHEN 2 THEN 'b' END, "
+            "qty=CASE id WHEN 2 THEN 2 ELSE qty END WHERE id IN (1, 2);"
+        )
+        self.assertEqual(queries, [expected_query])
+        self.assertEqual(self.manager.table_keys["items"], ["id"])
+
+    def test_build_delete_query_with_primary_key_batches(self):
+        # Arrange
+        self.manager.register_table_keys("items", ["id"])
+        self.manager.undo_batch_size = 2
+        after = Rows([{"id": i, "name": f"n{i}"} for i in range(1, 6)], 5)
+
+        # Act
+        queries = self.manager.build_delete_query("items", after)
+
+        # Assert
+        self.assertEqual(queries, [
+            "DELETE FROM items WHERE id IN (1, 2);",
+            "DELETE FROM items WHERE id IN (3, 4);",
+            "DELETE FROM items WHERE id=5;",
+        ])
+
     @patch("builtins.print")
     def test_recover_no_criteria(self, mock_print):
         """Test recover with no transaction IDs provided."""
@@ -982,5 +1114,1393 @@ class TestFailureRecoveryManager(unittest.TestCase):
         self.assertIn("UPDATE table2 SET id=2, age=25 WHERE id=2 AND age=30;", undo_query[0][1])
         self.assertIn("INSERT INTO table1 (id, name) VALUES (1, 'Bob');", undo_query[1][1])
 
+    def _temp_manager(self):
+        fd, path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.addCleanup(shutil.rmtree, path + ".segments", True)
+        return FailureRecoveryManager(log_file=path)
+
+    def _write_committed_update(self, manager, tid, minute, old, new):
+        base = datetime(2024, 12, 1, 10, 0, 0)
+        manager.write_log(ExecutionResult(
+            transaction_id=tid, timestamp=base + timedelta(minutes=minute), type="START",
+            status="", query=None, previous_data=None, new_data=None
+        ))
+        manager.write_log(ExecutionResult(
+            transaction_id=tid, timestamp=base + timedelta(minutes=minute, seconds=1), type="UPDATE",
+            status="", query=f"UPDATE accounts SET balance={new} WHERE id=1;",
+            previous_data=Rows([{'id': 1, 'balance': old}], 1),
+            new_data=Rows([{'id': 1, 'balance': new}], 1)
+        ))
+        manager.write_log(ExecutionResult(
+            transaction_id=tid, timestamp=base + timedelta(minutes=minute, seconds=2), type="COMMIT",
+            status="", query=None, previous_data=None, new_data=None
+        ))
+
+    def test_recover_point_in_time_rollback(self):
+        """Test rolling back to a timestamp undoes only transactions committed after it."""
+        manager = self._temp_manager()
+        self._write_committed_update(manager, 1, 0, 100, 200)
+        self._write_committed_update(manager, 2, 10, 200, 300)
+        self._write_committed_update(manager, 3, 20, 300, 400)
+
+        criteria = RecoverCriteria(timestamp=datetime(2024, 12, 1, 10, 5, 0))
+        undo_queries = manager.recover(criteria)
+
+        self.assertEqual(undo_queries, [
+            [3, "UPDATE accounts SET id=1, balance=300 WHERE id=1 AND balance=400;"],
+            [2, "UPDATE accounts SET id=1, balance=200 WHERE id=1 AND balance=300;"],
+        ])
+
+    def test_recover_with_timestamp_only_rolls_back(self):
+        """Test recover() with only a timestamp returns just the undo, also for a timestamp past the end of the log."""
+        manager = self._temp_manager()
+        self._write_committed_update(manager, 1, 0, 100, 200)
+        self._write_committed_update(manager, 2, 10, 200, 300)
+        applied = []
+
+        undo_queries = manager.recover(RecoverCriteria(timestamp=datetime(2024, 12, 1, 10, 5, 0)), apply=applied.append)
+        later = manager.recover(RecoverCriteria(timestamp=datetime(2024, 12, 1, 11, 0, 0)))
+
+        self.assertEqual(undo_queries, manager.recover_point_in_time(datetime(2024, 12, 1, 10, 5, 0))[1])
+        self.assertEqual(undo_queries, [[2, "UPDATE accounts SET id=1, balance=200 WHERE id=1 AND balance=300;"]])
+        self.assertEqual(applied, undo_queries)
+        self.assertEqual(later, [])
+        logs, _ = manager.read_log()
+        self.assertNotIn("ABORT", [log.type for log in logs])
+
+    def test_recover_point_in_time_rollforward(self):
+        """Test rolling forward between two timestamps redoes the transactions committed in between."""
+        manager = self._temp_manager()
+        self._write_committed_update(manager, 1, 0, 100, 200)
+        self._write_committed_update(manager, 2, 10, 200, 300)
+        self._write_committed_update(manager, 3, 20, 300, 400)
+
+        redo_queries, undo_queries = manager.recover_point_in_time(
+            datetime(2024, 12, 1, 10, 15, 0), current=datetime(2024, 12, 1, 10, 5, 0)
+        )
+
+        self.assertEqual(redo_queries, [[2, "UPDATE accounts SET balance=300 WHERE id=1;"]])
+        self.assertEqual(undo_queries, [])
+
+    @patch("FailureRecoveryManager.FailureRecoveryManager.parse_log_file")
+    def test_abort_transactions_groups_by_table(self, mock_parse_log_file):
+        """Test batched abort undoes many transactions with one bulk statement per table."""
+        # Arrange
+        self.manager.undo_list = [1, 2, 3]
+        now = datetime(2024, 11, 22, 10, 0, 0)
+        for tid in (1, 2):
+            self.manager.memory_wal.append(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+        for tid in (1, 2):
+            self.manager.memory_wal.append(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="INSERT", status="",
+                query=f"INSERT INTO orders (id) VALUES ({tid});",
+                previous_data=Rows([], 0), new_data=Rows([{'id': tid}], 1)
+            ))
+            self.manager.memory_wal.append(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="DELETE", status="",
+                query=f"DELETE FROM stock WHERE id={tid};",
+                previous_data=Rows([{'id': tid, 'qty': tid * 10}], 1), new_data=Rows([], 0)
+            ))
+
+        # Act
+        undo_queries = self.manager.abort_transactions([1, 2])
+
+        # Assert
+        self.assertEqual(undo_queries, [
+            [[1, 2], "INSERT INTO stock (id, qty) VALUES (2, 20), (1, 10);"],
+            [[1, 2], "DELETE FROM orders WHERE (id=2) OR (id=1);"],
+        ])
+        self.assertEqual(self.manager.undo_list, [3])
+        mock_parse_log_file.assert_not_called()
+
+    @patch("FailureRecoveryManager.FailureRecoveryManager.parse_log_file")
+    def test_abort_transactions_bulk_insert_respects_column_order(self, mock_parse_log_file):
+        """Test rows re-inserted together keep their values under the right columns when column sets differ."""
+        # Arrange
+        self.manager.undo_list = [1, 2, 3]
+        now = datetime(2024, 11, 22, 10, 0, 0)
+        for tid in (1, 2, 3):
+            self.manager.memory_wal.append(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+        for tid, row in ((1, {'id': 1, 'qty': 10}), (2, {'qty': 20, 'id': 2}), (3, {'id': 3, 'qty': 30, 'note': 'x'})):
+            self.manager.memory_wal.append(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="DELETE", status="",
+                query=f"DELETE FROM stock WHERE id={tid};",
+                previous_data=Rows([row], 1), new_data=Rows([], 0)
+            ))
+
+        # Act
+        undo_queries = self.manager.abort_transactions([1, 2, 3])
+
+        # Assert
+        self.assertEqual(undo_queries, [
+            [[1, 2, 3], "INSERT INTO stock (id, qty, note) VALUES (3, 30, 'x');"],
+            [[1, 2, 3], "INSERT INTO stock (qty, id) VALUES (20, 2), (10, 1);"],
+        ])
+
+    def test_abort_transactions_merges_keyed_updates(self):
+        """Test repeated updates of a keyed table collapse into one statement restoring the oldest image."""
+        # Arrange
+        self.manager.register_table_keys("stock", ["id"])
+        now = datetime(2024, 11, 22, 10, 0, 0)
+        self.manager.write_log(ExecutionResult(
+            transaction_id=1, timestamp=now, type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        for old, new in ((10, 9), (9, 8)):
+            self.manager.write_log(ExecutionResult(
+                transaction_id=1, timestamp=now, type="UPDATE", status="",
+                query=f"UPDATE stock SET qty={new} WHERE id IN (1, 2);",
+                previous_data=Rows([{'id': 1, 'qty': old}, {'id': 2, 'qty': old}], 2),
+                new_data=Rows([{'id': 1, 'qty': new}, {'id': 2, 'qty': new}], 2)
+            ))
+
+        # Act
+        undo_queries = self.manager.abort_transactions([1])
+
+        # Assert
+        self.assertEqual(undo_queries, [
+            [[1], "UPDATE stock SET qty=10 WHERE id IN (1, 2);"],
+        ])
+
+    def test_recover_structured_returns_undo_operations(self):
+        """Test recover can return typed undo operations instead of SQL strings."""
+        # Arrange
+        self.manager.register_table_keys("test", ["id"])
+        now = datetime(2024, 11, 22, 10, 0, 0)
+        for entry in (
+            ExecutionResult(transaction_id=5, timestamp=now, type="START", status="",
+                            query=None, previous_data=None, new_data=None),
+            ExecutionResult(transaction_id=5, timestamp=now, type="INSERT", status="",
+                            query="INSERT INTO test (id, name) VALUES (3, 'Charlie');",
+                            previous_data=Rows([], 0), new_data=Rows([{"id": 3, "name": "Charlie"}], 1)),
+            ExecutionResult(transaction_id=5, timestamp=now, type="UPDATE", status="",
+                            query="UPDATE test SET name='Charles' WHERE id=3;",
+                            previous_data=Rows([{"id": 3, "name": "Charlie"}], 1),
+                            new_data=Rows([{"id": 3, "name": "Charles"}], 1)),
+            ExecutionResult(transaction_id=5, timestamp=now, type="DELETE", status="",
+                            query="DELETE FROM test WHERE id=2;",
+                            previous_data=Rows([{"id": 2, "name": "Bob"}], 1), new_data=Rows([], 0)),
+        ):
+            self.manager.write_log(entry)
+
+        # Act
+        operations = self.manager.recover(RecoverCriteria(transaction_id=[5]), structured=True)
+
+        # Assert
+        self.assertEqual(operations, [
+            UndoOperation(5, "test", "INSERT", {"id": 2}, {"id": 2, "name": "Bob"}),
+            UndoOperation(5, "test", "UPDATE", {"id": 3}, {"name": "Charlie"}),
+            UndoOperation(5, "test", "DELETE", {"id": 3}, None),
+        ])
+        self.assertEqual(self.manager.render_undo_sql(operations), [
+            "INSERT INTO test (id, name) VALUES (2, 'Bob');",
+            "UPDATE test SET name='Charlie' WHERE id=3;",
+            "DELETE FROM test WHERE id=3;",
+        ])
+
+    def test_write_log_stores_table_and_recovery_skips_sql_scan(self):
+        """Test the table is resolved once at write time, logged, and reused by recovery."""
+        manager = self._temp_manager()
+        now = datetime(2024, 11, 22, 10, 0, 0)
+        manager.write_log(ExecutionResult(
+            transaction_id=1, timestamp=now, type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        insert = ExecutionResult(
+            transaction_id=1, timestamp=now, type="INSERT", status="",
+            query="INSERT INTO Orders (id) VALUES (1);",
+            previous_data=Rows([], 0), new_data=Rows([{'id': 1}], 1)
+        )
+        manager.write_log(insert)
+        manager.save_checkpoint()
+
+        self.assertEqual(insert.table, "Orders")
+        with open(manager.log_file) as log_file:
+            self.assertIn(",Table: Orders,Before: [],After: [{'id': 1}]", log_file.read())
+
+        with patch.object(manager, "get_table_name", side_effect=AssertionError("SQL text scanned")):
+            logs, _ = manager.parse_log_file(manager.log_file)
+            undo_queries = manager.recover(RecoverCriteria(transaction_id=[1]))
+
+        self.assertIs(logs[1].table, manager.table_names["Orders"])
+        self.assertEqual(undo_queries, [[1, "DELETE FROM Orders WHERE id=1;"]])
+
+    def test_write_log_delta_encodes_keyed_updates(self):
+        """Test UPDATE records of keyed tables log only the key and changed columns, and still undo."""
+        manager = self._temp_manager()
+        manager.register_table_keys("wide", ["id"])
+        now = datetime(2024, 11, 22, 10, 0, 0)
+        before = {"id": 7, **{f"c{i}": i for i in range(10)}}
+        after = dict(before, c3=99)
+        manager.write_log(ExecutionResult(
+            transaction_id=1, timestamp=now, type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        manager.write_log(ExecutionResult(
+            transaction_id=1, timestamp=now, type="UPDATE", status="",
+            query="UPDATE wide SET c3=99 WHERE id=7;",
+            previous_data=Rows([before], 1), new_data=Rows([after], 1)
+        ))
+        manager.save_checkpoint()
+
+        with open(manager.log_file) as log_file:
+            self.assertIn(
+                "Table: wide,Key: id,Before: [{'id': 7, 'c3': 3}],After: [{'id': 7, 'c3': 99}]", log_file.read()
+            )
+
+        restarted = FailureRecoveryManager(log_file=manager.log_file)
+        restarted.undo_list = [1]
+        undo_queries = restarted.recover(RecoverCriteria(transaction_id=[1]))
+        self.assertEqual(restarted.table_keys["wide"], ["id"])
+        self.assertEqual(undo_queries, [[1, "UPDATE wide SET c3=3 WHERE id=7;"]])
+
+    def test_seal_segment_compresses_and_recover_reads_through(self):
+        """Test sealed segments are compressed per block and recover/recoverSystem read them transparently."""
+        for compression in ("zlib", "lzma"):
+            with self.subTest(compression=compression):
+                # Arrange
+                manager = self._temp_manager()
+                self._write_committed_update(manager, 1, 0, 100, 200)
+                manager.write_log(ExecutionResult(
+                    transaction_id=5, timestamp=datetime(2024, 12, 1, 11, 0, 0), type="START",
+                    status="", query=None, previous_data=None, new_data=None
+                ))
+                manager.write_log(ExecutionResult(
+                    transaction_id=5, timestamp=datetime(2024, 12, 1, 11, 0, 1), type="INSERT",
+                    status="", query="INSERT INTO accounts VALUES (2, 50);",
+                    previous_data=Rows([], 0), new_data=Rows([{'id': 2, 'balance': 50}], 1)
+                ))
+                manager.save_checkpoint()
+
+                # Act
+                segment = manager.seal_segment(compression)
+                manager.write_log(ExecutionResult(
+                    transaction_id=5, timestamp=datetime(2024, 12, 1, 11, 0, 2), type="DELETE",
+                    status="", query="DELETE FROM accounts WHERE id=1;",
+                    previous_data=Rows([{'id': 1, 'balance': 200}], 1), new_data=Rows([], 0)
+                ))
+                manager.save_checkpoint()
+
+                # Assert
+                self.assertEqual(segment.compression, compression)
+                with open(segment.path, "rb") as segment_file:
+                    self.assertNotIn(b"INSERT INTO accounts", segment_file.read())
+                self.assertGreater(os.path.getsize(manager.log_file), 0)
+
+                restarted = FailureRecoveryManager(log_file=manager.log_file)
+                self.assertEqual(restarted.next_lsn, manager.next_lsn)
+                redo_queries, undo_queries = restarted.recoverSystem()
+                self.assertEqual(undo_queries, [
+                    [5, "INSERT INTO accounts (id, balance) VALUES (1, 200);"],
+                    [5, "DELETE FROM accounts WHERE id=2 AND balance=50;"],
+                ])
+
+                undo_queries = manager.recover(RecoverCriteria(transaction_id=[5]))
+                self.assertEqual(undo_queries, [
+                    [5, "INSERT INTO accounts (id, balance) VALUES (1, 200);"],
+                    [5, "DELETE FROM accounts WHERE id=2 AND balance=50;"],
+                ])
+
+    def test_recover_point_in_time_seeks_into_segments(self):
+        """Test point-in-time recovery finds its cut point inside a sealed segment."""
+        # Arrange
+        manager = self._temp_manager()
+        self._write_committed_update(manager, 1, 0, 100, 200)
+        self._write_committed_update(manager, 2, 10, 200, 300)
+        manager.seal_segment("zlib")
+        self._write_committed_update(manager, 3, 20, 300, 400)
+
+        # Act
+        undo_queries = manager.recover(RecoverCriteria(timestamp=datetime(2024, 12, 1, 10, 5, 0)))
+
+        # Assert
+        self.assertEqual(undo_queries, [
+            [3, "UPDATE accounts SET id=1, balance=300 WHERE id=1 AND balance=400;"],
+            [2, "UPDATE accounts SET id=1, balance=200 WHERE id=1 AND balance=300;"],
+        ])
+
+    def test_log_buffer_concurrent_appends_keep_lsn_order(self):
+        """Test the byte ring: concurrent appends land in the file in LSN order and COMMIT is durable on return."""
+        # Arrange
+        fd, path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        manager = FailureRecoveryManager(log_file=path, log_buffer_size=512)  # small ring: wraps and grows
+        self.addCleanup(manager.close)
+        now = datetime(2024, 12, 1, 10, 0, 0)
+
+        def run_transaction(tid):
+            manager.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+            for i in range(5):
+                manager.write_log(ExecutionResult(
+                    transaction_id=tid, timestamp=now, type="INSERT", status="",
+                    query=f"INSERT INTO t{tid} VALUES ({i}, '{'x' * 150 * i}');",
+                    previous_data=Rows([], 0), new_data=Rows([{'id': i, 'pad': 'x' * 150 * i}], 1)
+                ))
+            manager.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="COMMIT", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+            with open(path) as log_file:
+                committed.append(f"COMMIT,{tid}," in log_file.read())
+
+        # Act
+        committed = []
+        threads = [threading.Thread(target=run_transaction, args=(tid,)) for tid in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        manager.write_log(ExecutionResult(
+            transaction_id=99, timestamp=now, type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        redo_queries, undo_queries = manager.recoverSystem()
+
+        # Assert
+        self.assertEqual(committed, [True] * 8)
+        logs, _ = manager.parse_log_file(path)
+        self.assertEqual([log.lsn for log in logs], list(range(manager.next_lsn)))
+        self.assertEqual(len(redo_queries), 40)
+        self.assertEqual(undo_queries, [])
+        self.assertEqual(manager.memory_wal, [])
+        self.assertGreater(manager.log_buffer.capacity, 512)
+
+    def test_double_buffered_wal_swaps_and_signals_backpressure(self):
+        """Test a full memory_wal is handed to the writer, and appenders wait only when every buffer is full."""
+        # Arrange
+        manager = FailureRecoveryManager(log_file=self._temp_manager().log_file, log_size=2, wal_buffers=2)
+        self.addCleanup(manager.close)
+        disk = threading.Event()
+        write_entries = manager._write_entries
+
+        def slow_write_entries(log_file, entries):
+            disk.wait(5)
+            write_entries(log_file, entries)
+
+        manager._write_entries = slow_write_entries
+        now = datetime(2024, 12, 1, 10, 0, 0)
+
+        def update(tid, i):
+            manager.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="UPDATE", status="",
+                query=f"UPDATE accounts SET balance={i} WHERE id={tid};",
+                previous_data=Rows([{'id': tid, 'balance': i - 1}], 1), new_data=Rows([{'id': tid, 'balance': i}], 1)
+            ))
+
+        # Act
+        update(1, 1)
+        update(1, 2)  # fills the first buffer, the writer is stuck on the disk
+        swapped = (len(manager.memory_wal), len(manager._sealed_wal))
+        update(2, 1)
+        blocked = threading.Thread(target=update, args=(2, 2))  # fills the second buffer
+        blocked.start()
+        signalled = manager.wal_backpressure.wait(5)
+        disk.set()
+        blocked.join()
+        recovered = manager.recover(RecoverCriteria(transaction_id=[1]))
+
+        # Assert
+        self.assertEqual(swapped, (0, 1))
+        self.assertTrue(signalled)
+        self.assertFalse(manager.wal_backpressure.is_set())
+        self.assertEqual(manager.backpressure_count, 1)
+        with open(manager.log_file) as log_file:
+            self.assertEqual(len(log_file.readlines()), 4)
+        self.assertEqual([tid for tid, _ in recovered], [1, 1])
+
+    def test_flush_policy_triggers_and_tunes(self):
+        """Test the adaptive flush policy triggers on bytes, count or age and tunes itself from observations."""
+        # Arrange
+        policy = FlushPolicy(max_records=100, max_bytes=1000, max_age=1.0, target_commit_latency=0.01,
+                             min_records=4, min_bytes=100)
+
+        # Act
+        policy.observe_flush(records=10, size=1000, now=100.0)  # 100 bytes per record
+        by_bytes = (policy.should_flush(9, 0.0), policy.should_flush(10, 0.0))
+        by_age = (policy.should_flush(0, 5.0), policy.should_flush(1, 1.0))
+        policy.observe_flush(records=50, size=5000, now=100.5)  # 100 records/s
+        policy.observe_commit(0.05)
+        slow_bytes = policy.max_bytes
+        for _ in range(20):
+            policy.observe_commit(0.0001)
+
+        # Assert
+        self.assertEqual(by_bytes, (False, True))
+        self.assertEqual(by_age, (False, True))
+        self.assertEqual(policy.max_records, 100)  # throughput * max_age
+        self.assertEqual(slow_bytes, 500)  # halved while commits are slow
+        self.assertGreater(policy.max_bytes, slow_bytes)  # grows back once they are fast
+        self.assertEqual(set(policy.settings()), {
+            "max_records", "max_bytes", "max_age", "record_bytes", "commit_latency", "throughput"
+        })
+
+    def test_flush_policy_flushes_aged_records(self):
+        """Test records older than max_age are flushed by the timer although no new record arrives."""
+        # Arrange
+        manager = FailureRecoveryManager(log_file=self._temp_manager().log_file, flush_policy=FlushPolicy(max_age=0.05))
+        self.addCleanup(manager.close)
+
+        # Act
+        manager.write_log(ExecutionResult(
+            transaction_id=1, timestamp=datetime.now(), type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        deadline = time.monotonic() + 2
+        while manager.memory_wal and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Assert
+        self.assertEqual(manager.memory_wal, [])
+        with open(manager.log_file) as log_file:
+            self.assertTrue(log_file.read().startswith("START,1,"))
+        self.assertEqual(manager.flush_settings["max_age"], 0.05)
+        self.assertEqual(FailureRecoveryManager(log_file=manager.log_file).flush_settings, {"max_records": 50})
+
+    def test_async_front_end_groups_commits(self):
+        """Test concurrent async transactions commit in shared group flushes and are all durable."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        now = datetime(2024, 12, 1, 10, 0, 0)
+
+        async def transaction(frm, tid):
+            await frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+            await frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="INSERT", status="",
+                query=f"INSERT INTO accounts VALUES ({tid}, 0);",
+                previous_data=Rows([], 0), new_data=Rows([{'id': tid, 'balance': 0}], 1)
+            ))
+            if tid % 2:
+                await frm.commit(tid, now)
+
+        async def run():
+            frm = AsyncFailureRecoveryManager(log_file=log_file)
+            await asyncio.gather(*(transaction(frm, tid) for tid in range(1, 201)))
+            with open(log_file) as f:
+                committed = sum(1 for line in f if line.startswith("COMMIT,"))
+            undo_queries = await frm.abort_transactions([2, 4])
+            await frm.close()
+            return frm, committed, undo_queries
+
+        # Act
+        frm, committed, undo_queries = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(committed, 100)  # every awaited commit is in the file
+        self.assertLess(frm.group_flushes, 10)
+        self.assertEqual(undo_queries, [[[2, 4], "DELETE FROM accounts WHERE (id=4 AND balance=0) OR (id=2 AND balance=0);"]])
+        self.assertEqual(sorted(frm.manager.undo_list), list(range(6, 201, 2)))
+
+    @patch("builtins.print")
+    def test_async_commit_fails_when_group_flush_fails(self, mock_print):
+        """Test every commit awaiting a group flush is rejected when writing the group fails."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        now = datetime(2024, 12, 1, 10, 0, 0)
+
+        async def transaction(frm, tid):
+            await frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+            await frm.commit(tid, now)
+
+        async def run():
+            frm = AsyncFailureRecoveryManager(log_file=log_file, checkpoint_scheduler=self.scheduler)
+            with patch.object(frm.manager, "_open_log", side_effect=OSError("disk full")):
+                results = await asyncio.gather(*(transaction(frm, tid) for tid in range(1, 4)), return_exceptions=True)
+            await frm.close()
+            return results
+
+        # Act
+        results = asyncio.run(run())
+
+        # Assert
+        self.assertEqual([type(result) for result in results], [OSError] * 3)
+        self.assertEqual(os.path.getsize(log_file), 0)
+        mock_print.assert_any_call("Error in write_log_batch: disk full")
+
+    @patch("builtins.print")
+    def test_async_commit_failed_by_group_flush_stays_abortable(self, mock_print):
+        """Test a commit rejected by a failed group flush leaves its transaction active, abortable and never logged as committed."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        now = datetime(2024, 12, 1, 10, 0, 0)
+
+        async def run():
+            frm = AsyncFailureRecoveryManager(log_file=log_file, checkpoint_scheduler=self.scheduler)
+            frm.manager.register_table_keys("accounts", ["id"])
+            await frm.write_log(ExecutionResult(
+                transaction_id=1, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+            await frm.write_log(ExecutionResult(
+                transaction_id=1, timestamp=now, type="INSERT", status="",
+                query="INSERT INTO accounts (id, balance) VALUES (1, 10);",
+                previous_data=Rows([], 0),
+                new_data=Rows([{'id': 1, 'balance': 10}], 1)
+            ))
+            with patch.object(frm.manager, "_open_log", side_effect=OSError("disk full")):
+                try:
+                    await frm.commit(1, now)
+                except OSError as e:
+                    error = e
+            state = (list(frm.manager.undo_list), [log.type for log in frm.manager.memory_wal])
+            undo_queries = await frm.abort_transactions([1])
+            await frm.save_checkpoint()
+            await frm.close()
+            return error, state, undo_queries
+
+        # Act
+        error, state, undo_queries = asyncio.run(run())
+
+        # Assert
+        self.assertIsInstance(error, OSError)
+        self.assertEqual(state, ([1], ["START", "INSERT"]))
+        self.assertEqual(undo_queries, [[[1], "DELETE FROM accounts WHERE id=1;"]])
+        logs, _ = FailureRecoveryManager(log_file=log_file, checkpoint_scheduler=self.scheduler).read_log()
+        self.assertEqual([log.type for log in logs], ["START", "INSERT", "CHECKPOINT"])
+        self.assertEqual([log.lsn for log in logs], [0, 1, 2])
+
+    def test_checkpoint_scheduler_time_bytes_and_stagger(self):
+        """Test the scheduler checkpoints every instance on time or WAL bytes, most overdue first and staggered."""
+        # Arrange
+        scheduler = CheckpointScheduler(min_gap=60)
+        by_time = FailureRecoveryManager(log_file=self._temp_manager().log_file, checkpoint_scheduler=scheduler)
+        by_bytes = FailureRecoveryManager(log_file=self._temp_manager().log_file, checkpoint_scheduler=scheduler,
+                                          checkpoint_wal_bytes=100)
+        idle = FailureRecoveryManager(log_file=self._temp_manager().log_file, checkpoint_scheduler=scheduler)
+        now = datetime.now()
+        by_time.last_checkpoint_time = now - timedelta(minutes=6)
+        self._write_committed_update(by_bytes, 1, 0, 100, 200)
+
+        # Act
+        first = scheduler.run_pending(now)
+        second = scheduler.run_pending(now)  # inside min_gap: nothing runs
+        scheduler._next_allowed = 0
+        third = scheduler.run_pending(now)
+
+        # Assert
+        self.assertEqual(first, [by_bytes])  # several times over its byte budget
+        self.assertEqual(second, [])
+        self.assertEqual(third, [by_time])
+        self.assertEqual(by_bytes.wal_bytes_since_checkpoint(), 0)
+        self.assertGreater(by_time.last_checkpoint_time, now - timedelta(minutes=1))
+        self.assertEqual(scheduler.run_pending(now), [])
+        with open(by_bytes.log_file) as log_file:
+            self.assertIn("CHECKPOINT,", log_file.read())
+        self.assertNotIn(idle, first + third)
+
+    def test_checkpoint_scheduler_stops(self):
+        """Test a started scheduler checkpoints in the background and stop() ends its thread."""
+        # Arrange
+        scheduler = CheckpointScheduler(poll_interval=0.01, min_gap=0)
+        manager = FailureRecoveryManager(log_file=self._temp_manager().log_file, checkpoint_scheduler=scheduler)
+        manager.checkpoint_interval = timedelta(milliseconds=20)
+
+        # Act
+        scheduler.start()
+        deadline = time.monotonic() + 2
+        while manager.next_lsn == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        scheduler.stop()
+        checkpoints = manager.next_lsn
+        time.sleep(0.05)
+
+        # Assert
+        self.assertGreater(checkpoints, 0)
+        self.assertEqual(manager.next_lsn, checkpoints)
+        self.assertIsNone(scheduler._thread)
+
+    def test_target_recovery_time_triggers_checkpoint(self):
+        """Test the estimated restart time, from measured replay throughput, triggers a checkpoint before the target."""
+        # Arrange
+        scheduler = CheckpointScheduler(min_gap=0)
+        manager = FailureRecoveryManager(log_file=self._temp_manager().log_file, checkpoint_scheduler=scheduler,
+                                         target_recovery_time=1.0)
+        for tid in range(40):
+            self._write_committed_update(manager, tid, tid, 100, 200)  # 120 records
+        replayed = FailureRecoveryManager(log_file=self._temp_manager().log_file, checkpoint_scheduler=CheckpointScheduler())
+        for tid in range(100):
+            self._write_committed_update(replayed, tid, tid, 100, 200)
+        replayed.recoverSystem(apply=lambda item: time.sleep(0.0001))  # measures replay throughput on 100 REDO records
+        measured = replayed.replay_records_per_second
+        manager.replay_records_per_second = 150.0  # a slow replay: 120 records take 0.8 s
+        before_flush = scheduler._wake.is_set()
+
+        # Act
+        self._write_committed_update(manager, 40, 40, 200, 300)  # the flush notices 123 records > 80% of 1 s
+        woken = scheduler._wake.is_set()
+        estimate = manager.estimated_recovery_time()
+        checkpointed = scheduler.run_pending()
+
+        # Assert
+        self.assertLess(measured, 50_000.0)  # moved towards the ~10,000 redo records/s applied
+        self.assertFalse(before_flush)
+        self.assertTrue(woken)
+        self.assertAlmostEqual(estimate, 123 / 150)
+        self.assertEqual(checkpointed, [manager])
+        self.assertEqual(manager.estimated_recovery_time(), 0)
+
+    def test_partitioned_log_merges_partitions_on_restart(self):
+        """Test transactions are spread over partitions and recoverSystem merges them back in global LSN order."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        for index in range(3):
+            self.addCleanup(lambda path=f"{log_file}.p{index}": os.path.exists(path) and os.remove(path))
+        scheduler = CheckpointScheduler()
+        frm = PartitionedFailureRecoveryManager(log_file, partitions=3, checkpoint_scheduler=scheduler)
+        now = datetime(2024, 12, 1, 10, 0, 0)
+        for tid in range(1, 5):
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+        for step in range(2):
+            for tid in range(1, 5):
+                frm.write_log(ExecutionResult(
+                    transaction_id=tid, timestamp=now, type="UPDATE", status="",
+                    query=f"UPDATE accounts SET balance={step + 1} WHERE id={tid};",
+                    previous_data=Rows([{'id': tid, 'balance': step}], 1),
+                    new_data=Rows([{'id': tid, 'balance': step + 1}], 1)
+                ))
+        for tid in (3, 1, 2):
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="COMMIT", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+        frm.partition_of(4).save_checkpoint()  # leaves transaction 4 on disk, uncommitted
+
+        # Act
+        restarted = PartitionedFailureRecoveryManager(log_file, partitions=3, checkpoint_scheduler=scheduler)
+        redo_queries, undo_queries = restarted.recoverSystem()
+
+        # Assert
+        with open(f"{log_file}.p1") as partition_file:
+            lines = partition_file.read().splitlines()
+        self.assertTrue(all(line.split(",")[1] in ("1", "4") for line in lines if not line.startswith("CHECKPOINT")))
+        self.assertIn(",LSN: 0,", lines[0])
+        self.assertEqual(next(restarted.lsn_counter), 16)  # 15 records and a checkpoint before the restart
+        self.assertEqual([tid for tid, _ in redo_queries], [2, 3, 2, 3])  # partition 1 redoes from its checkpoint
+        self.assertEqual(undo_queries, [
+            [4, "UPDATE accounts SET id=4, balance=1 WHERE id=4 AND balance=2;"],
+            [4, "UPDATE accounts SET id=4, balance=0 WHERE id=4 AND balance=1;"],
+        ])
+        self.assertEqual(restarted.undo_list, [4])
+
+    def test_partitioned_log_restart_after_long_record(self):
+        """Test the LSN counter resumes past a last record longer than the tail window and each partition estimates its own redo."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        for index in range(2):
+            self.addCleanup(lambda path=f"{log_file}.p{index}": os.path.exists(path) and os.remove(path))
+        scheduler = CheckpointScheduler()
+        frm = PartitionedFailureRecoveryManager(log_file, partitions=2, log_size=1, checkpoint_scheduler=scheduler)
+        now = datetime(2024, 12, 1, 10, 0, 0)
+        for tid in (1, 2):
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+        for step in range(3):
+            frm.write_log(ExecutionResult(
+                transaction_id=1, timestamp=now, type="UPDATE", status="",
+                query=f"UPDATE accounts SET balance={step + 1} WHERE id=1;",
+                previous_data=Rows([{'id': 1, 'balance': step}], 1),
+                new_data=Rows([{'id': 1, 'balance': step + 1}], 1)
+            ))
+        frm.write_log(ExecutionResult(
+            transaction_id=1, timestamp=now, type="COMMIT", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        note = "x" * (100 * 1024)  # the last record of its partition, and of the log, is longer than 64 KiB
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=now, type="UPDATE", status="",
+            query=f"UPDATE accounts SET note='{note}' WHERE id=2;",
+            previous_data=Rows([{'id': 2, 'note': ''}], 1),
+            new_data=Rows([{'id': 2, 'note': note}], 1)
+        ))
+        records = [partition._records_since_checkpoint() for partition in frm.partitions]
+        applied = []
+
+        # Act
+        restarted = PartitionedFailureRecoveryManager(log_file, partitions=2, checkpoint_scheduler=scheduler)
+        redo_queries, undo_queries = restarted.recoverSystem(apply=applied.append)
+
+        # Assert
+        self.assertEqual(sorted(records), [2, 5])  # its own records, not the 7 LSNs taken in all
+        self.assertEqual(next(restarted.lsn_counter), 7)
+        self.assertEqual([tid for tid, _ in redo_queries], [1, 1, 1, 2])
+        self.assertEqual([tid for tid, _ in undo_queries], [2])
+        self.assertTrue(applied == redo_queries + undo_queries)
+        with self.assertRaises(TypeError):
+            restarted.recoverSystem(apply=applied.append, online=True)
+
+    def test_multiprocess_appends_do_not_interleave(self):
+        """Test several processes appending to one log keep their records whole and the LSNs consecutive."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        frm = FailureRecoveryManager(log_file=log_file, multiprocess=True, checkpoint_scheduler=self.scheduler)
+        workers = [
+            multiprocessing.Process(target=_append_transactions, args=(log_file, worker, 50))
+            for worker in range(1, 4)
+        ]
+
+        # Act
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        _append_transactions(log_file, 0, 1)
+        frm.write_log(ExecutionResult(
+            transaction_id=9, timestamp=datetime.now(), type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        frm.write_log(ExecutionResult(
+            transaction_id=9, timestamp=datetime.now(), type="COMMIT", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+
+        # Assert
+        self.assertTrue(all(worker.exitcode == 0 for worker in workers))
+        logs, _ = frm.read_log()
+        self.assertEqual(len(logs), 3 * 50 * 3 + 3 + 2)
+        self.assertEqual([log.lsn for log in logs], list(range(len(logs))))
+        self.assertEqual(frm.next_lsn, len(logs))
+        for index in range(0, 3 * 50 * 3 + 3, 3):
+            # Every transaction was flushed in one locked write: START, UPDATE, COMMIT side by side
+            self.assertEqual([log.type for log in logs[index:index + 3]], ["START", "UPDATE", "COMMIT"])
+            self.assertEqual(len({log.transaction_id for log in logs[index:index + 3]}), 1)
+
+    def test_multiprocess_checkpoint_lists_other_processes_transactions(self):
+        """Test a multiprocess checkpoint lists the active transactions of another process, so restart still undoes them."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        frm = FailureRecoveryManager(log_file=log_file, multiprocess=True, checkpoint_scheduler=self.scheduler)
+        frm.register_table_keys("accounts", ["id"])
+        worker = multiprocessing.Process(target=_log_uncommitted_update, args=(log_file, 7))
+        self._write_committed_update(frm, 1, 0, 100, 150)
+
+        # Act
+        worker.start()
+        worker.join()
+        frm.save_checkpoint()
+        self._write_committed_update(frm, 2, 5, 150, 175)
+        frm.save_checkpoint()
+        restarted = FailureRecoveryManager(log_file=log_file, multiprocess=True, checkpoint_scheduler=self.scheduler)
+        restarted.register_table_keys("accounts", ["id"])
+        _, undo_queries = restarted.recoverSystem()
+
+        # Assert
+        self.assertEqual(worker.exitcode, 0)
+        logs, transaction_table = restarted.read_log()
+        checkpoints = [log.lsn for log in logs if log.type == "CHECKPOINT"]
+        self.assertEqual(checkpoints, [5, 9])
+        entry = transaction_table.get(7)
+        self.assertEqual((entry.first_lsn, entry.last_lsn), (3, 4))
+        self.assertNotIn(1, transaction_table)
+        self.assertEqual(undo_queries, [[7, "UPDATE accounts SET balance=0 WHERE id=1;"]])
+
+    def test_multiprocess_flush_records_lsns_in_transaction_table(self):
+        """Test a multiprocess flush gives the transaction table the LSNs it assigns, and a failed locked append writes nothing."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        frm = FailureRecoveryManager(log_file=log_file, multiprocess=True, log_size=1, checkpoint_scheduler=self.scheduler)
+        now = datetime(2024, 12, 1, 10, 0, 0)
+
+        # Act
+        for tid, record_type in ((1, "START"), (2, "START"), (1, "UPDATE")):
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now, type=record_type, status="",
+                query="UPDATE accounts SET balance=1 WHERE id=1;" if record_type == "UPDATE" else None,
+                previous_data=Rows([{'id': 1, 'balance': 0}], 1) if record_type == "UPDATE" else None,
+                new_data=Rows([{'id': 1, 'balance': 1}], 1) if record_type == "UPDATE" else None
+            ))
+        size = os.path.getsize(log_file)
+        with self.assertRaises(ValueError):
+            with LockedAppend(log_file) as locked:
+                locked.write("UPDATE,3,2024-12-01T10:00:00,partial\n")
+                raise ValueError("batch failed")
+
+        # Assert
+        entries = frm.transaction_table.entries
+        self.assertEqual((entries[1].first_lsn, entries[1].last_lsn), (0, 2))
+        self.assertEqual((entries[2].first_lsn, entries[2].last_lsn), (1, 1))
+        self.assertEqual(os.path.getsize(log_file), size)
+
+    @patch("builtins.print")
+    def test_multiprocess_failed_append_leaves_lsns_and_counts(self, mock_print):
+        """Test a failed multiprocess append puts its LSNs, byte counts and index back, and others' records are not counted as own."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        frm = FailureRecoveryManager(log_file=log_file, multiprocess=True, checkpoint_scheduler=self.scheduler)
+        other = FailureRecoveryManager(log_file=log_file, multiprocess=True, checkpoint_scheduler=self.scheduler)
+        frm._ensure_timestamp_index()
+        now = datetime(2024, 12, 1, 10, 0, 0)
+
+        def write(manager, tid, record_type, second):
+            manager.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=now + timedelta(seconds=second), type=record_type, status="",
+                query=None, previous_data=None, new_data=None
+            ))
+
+        write(frm, 2, "START", 0)
+        frm._flush_memory_wal()
+        write(other, 1, "START", 1)
+        write(other, 1, "COMMIT", 2)
+        write(frm, 2, "INSERT", 3)
+        before = (frm.next_lsn, frm.records_logged, frm.log_bytes, frm.bytes_logged, list(frm._ts_index_lsns))
+
+        # Act
+        with patch("LockedAppend.os.write", side_effect=OSError("disk full")):
+            write(frm, 2, "COMMIT", 4)
+        failed = (frm.next_lsn, frm.records_logged, frm.log_bytes, frm.bytes_logged, list(frm._ts_index_lsns))
+        lsns = [entry.lsn for entry in frm.memory_wal]
+        positions = (frm.transaction_table.get(2).first_lsn, frm.transaction_table.get(2).last_lsn)
+        frm._flush_memory_wal()
+
+        # Assert
+        self.assertEqual(before[:2], (1, 1))
+        self.assertEqual(before[4], [0])
+        self.assertEqual(failed, before)
+        self.assertEqual(lsns, [None, None])
+        self.assertEqual(positions, (0, 0))
+        self.assertEqual(frm.records_logged, 3)  # the START and COMMIT of transaction 1 are not its own
+        self.assertEqual(frm.next_lsn, 5)
+        self.assertEqual(frm._ts_index_lsns, [0, 1, 2, 3, 4])
+        logs, _ = frm.read_log()
+        self.assertEqual([(log.lsn, log.transaction_id, log.type) for log in logs],
+                         [(0, 2, "START"), (1, 1, "START"), (2, 1, "COMMIT"), (3, 2, "INSERT"), (4, 2, "COMMIT")])
+
+    def test_mapped_reader_decodes_only_records_to_undo(self):
+        """Test recoverSystem reads the log memory-mapped and never decodes the images of committed transactions."""
+        # Arrange
+        frm = self._temp_manager()
+        frm.register_table_keys("accounts", ["id"])
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=datetime(2024, 12, 1, 10, 5, 0), type="UPDATE", status="",
+            query="UPDATE accounts SET balance=10 WHERE id=2;",
+            previous_data=Rows([{'id': 2, 'balance': 5, 'owner': 'x'}], 1),
+            new_data=Rows([{'id': 2, 'balance': 10, 'owner': 'x'}], 1)
+        ))
+        frm.save_checkpoint()
+        eager_logs, eager_table = frm.parse_log_file(frm.log_file)
+
+        # Act
+        with patch.object(FailureRecoveryManager, "_decode_rows", autospec=True,
+                          side_effect=FailureRecoveryManager._decode_rows) as decode_rows:
+            lazy_logs, lazy_table = frm.parse_log_file(frm.log_file, lazy=True)
+            fields = [(log.type, log.transaction_id, log.lsn, log.timestamp, log.query, log.table) for log in lazy_logs]
+            decoded_by_fields = decode_rows.call_count
+            redo_queries, undo_queries = frm.recoverSystem()
+
+        # Assert
+        self.assertEqual(fields, [(log.type, log.transaction_id, log.lsn, log.timestamp, log.query, log.table) for log in eager_logs])
+        self.assertEqual(list(lazy_table), list(eager_table))
+        self.assertEqual(decoded_by_fields, 0)
+        self.assertEqual(decode_rows.call_count, 2)  # before and after image of transaction 2 only
+        self.assertEqual(redo_queries, [])
+        self.assertEqual(undo_queries, [[2, "UPDATE accounts SET balance=5 WHERE id=2;"]])
+
+    def test_mapped_reader_resolves_table_of_old_records(self):
+        """Test recoverSystem undoes records written before the table was logged (no Table field)."""
+        # Arrange
+        frm = self._temp_manager()
+        with open(frm.log_file, "w") as log_file:
+            log_file.write(
+                "START,1,2024-12-10T10:00:00,None,Before: [],After: []\n"
+                "UPDATE,1,2024-12-10T10:00:00,UPDATE accounts SET name='new' WHERE id=1,"
+                "Before: [{'id': 1, 'name': 'old'}],After: [{'id': 1, 'name': 'new'}]\n"
+            )
+
+        # Act
+        _, undo_queries = frm.recoverSystem()
+
+        # Assert
+        self.assertEqual(undo_queries, [[1, "UPDATE accounts SET id=1, name='old' WHERE id=1 AND name='new';"]])
+
+    def test_parallel_parse_matches_sequential_parse(self):
+        """Test parse_workers splits the log into record-aligned chunks and merges them back in LSN order."""
+        # Arrange
+        frm = self._temp_manager()
+        frm.register_table_keys("accounts", ["id"])
+        for tid in range(1, 21):
+            self._write_committed_update(frm, tid, tid, tid, tid + 1)
+            if tid == 12:
+                frm.write_log(ExecutionResult(
+                    transaction_id=99, timestamp=datetime(2024, 12, 1, 11, 0, 0), type="UPDATE", status="",
+                    query="UPDATE accounts SET balance=7 WHERE id=9;",
+                    previous_data=Rows([{'id': 9, 'balance': 6, 'owner': 'x'}], 1),
+                    new_data=Rows([{'id': 9, 'balance': 7, 'owner': 'x'}], 1)
+                ))
+                frm.save_checkpoint()
+        sequential_logs, sequential_table = frm.parse_log_file(frm.log_file)
+        parallel = FailureRecoveryManager(log_file=frm.log_file, parse_workers=2, checkpoint_scheduler=self.scheduler)
+        parallel.parallel_parse_min_bytes = 0
+        self.addCleanup(parallel.close)
+
+        # Act
+        parallel_logs, parallel_table = parallel.parse_log_file(parallel.log_file)
+
+        # Assert
+        self.assertEqual(parallel_logs, sequential_logs)
+        self.assertEqual([log.lsn for log in parallel_logs], list(range(len(sequential_logs))))
+        self.assertEqual(list(parallel_table), list(sequential_table))
+        self.assertEqual(list(parallel_table), [99])
+        self.assertEqual(parallel.table_keys, {"accounts": ["id"]})
+        self.assertIs(parallel_logs[1].table, parallel_logs[4].table)  # interned again after unpickling
+
+    @patch("builtins.print")
+    def test_checksums_repair_torn_tail_and_report_corruption(self, mock_print):
+        """Test a torn last record is truncated on open while a bad checksum mid-log is reported as corruption."""
+        # Arrange
+        log_file = self._temp_manager().log_file
+        frm = FailureRecoveryManager(log_file=log_file, checksums=True, checkpoint_scheduler=self.scheduler)
+        for tid in range(1, 4):
+            self._write_committed_update(frm, tid, tid, tid, tid + 1)
+        with open(log_file, "rb") as file:
+            lines = file.read().splitlines(keepends=True)
+        lines[4] = lines[4].replace(b"balance': 3", b"balance': 9")  # corrupt transaction 2's UPDATE
+        with open(log_file, "wb") as file:
+            file.write(b"".join(lines) + lines[1][:40])  # and a torn write at the end
+
+        # Act
+        restarted = FailureRecoveryManager(log_file=log_file, checksums=True, checkpoint_scheduler=self.scheduler)
+        logs, _ = restarted.parse_log_file(log_file)
+        mapped_logs, _ = restarted.parse_log_file(log_file, lazy=True)
+
+        # Assert
+        self.assertEqual(restarted.repaired_bytes, 40)
+        self.assertEqual(os.path.getsize(log_file), sum(len(line) for line in lines))
+        self.assertEqual(restarted.next_lsn, 9)
+        self.assertTrue(lines[0].rstrip(b"\n")[-13:].startswith(b"\tCRC:"))
+        self.assertEqual([log.lsn for log in logs], [0, 1, 2, 3, 5, 6, 7, 8])
+        self.assertEqual([log.lsn for log in mapped_logs], [0, 1, 2, 3, 5, 6, 7, 8])
+        self.assertEqual(logs[1].previous_data, Rows([{'id': 1, 'balance': 1}], 1))
+        mock_print.assert_any_call(f"Truncated 40 bytes of torn log tail in {log_file}")
+        mock_print.assert_any_call("Error: checksum mismatch in log record 4, the log is corrupt")
+
+    def test_recoverSystem_resumes_from_progress_marker(self):
+        """Test a recovery interrupted while applying resumes from its marker and applies every item once."""
+        # Arrange
+        frm = self._temp_manager()
+        for tid in range(1, 4):
+            self._write_committed_update(frm, tid, tid, tid, tid + 1)
+            if tid == 1:
+                frm.save_checkpoint()
+        for tid, balance in ((4, 0), (5, 0), (4, 1)):
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=datetime(2024, 12, 1, 11, tid, balance), type="UPDATE", status="",
+                query=f"UPDATE accounts SET balance={balance} WHERE id={tid};",
+                previous_data=Rows([{'id': tid, 'balance': tid if balance == 0 else 0}], 1),
+                new_data=Rows([{'id': tid, 'balance': balance}], 1)
+            ))
+        frm.save_checkpoint()
+        expected_redo, expected_undo = frm.recoverSystem()
+        applied, reports = [], []
+
+        def crash_during_undo(item):
+            if len(applied) == len(expected_redo) + 1:
+                raise RuntimeError("crash")
+            applied.append(item)
+
+        # Act
+        with patch("builtins.print") as mock_print:
+            frm.recoverSystem(apply=crash_during_undo, progress_interval=1)
+        with open(frm.log_file + ".recovery") as marker_file:
+            marker = marker_file.read()
+        restarted = FailureRecoveryManager(log_file=frm.log_file, checkpoint_scheduler=self.scheduler)
+        redo_query, undo_queries = restarted.recoverSystem(
+            apply=applied.append, progress=lambda progress: reports.append((progress.phase, progress.done, progress.eta_seconds)),
+            progress_interval=1
+        )
+
+        # Assert
+        mock_print.assert_called_once_with("Error during system recovery: crash")
+        self.assertEqual(len(expected_redo), 5)  # after the first checkpoint: 2, 3 and the three uncommitted updates
+        self.assertEqual(marker, "LOG=14,REDO=12,UNDO=12\n")  # last redone and last undone record
+        self.assertEqual(applied, expected_redo + expected_undo)
+        self.assertEqual(redo_query, [])
+        self.assertEqual(undo_queries, expected_undo[1:])
+        self.assertEqual([(phase, done) for phase, done, _ in reports], [("UNDO", 6), ("UNDO", 7), ("UNDO", 8), ("DONE", 8)])
+        self.assertEqual(reports[-1][2], 0)  # nothing left
+        self.assertFalse(os.path.exists(frm.log_file + ".recovery"))
+
+    def test_recoverSystem_online_resumes_after_log_grew(self):
+        """Test sync runs before every marker save and an online recovery resumes although ABORTs and new transactions were logged."""
+        # Arrange
+        frm = self._temp_manager()
+        frm.register_table_keys("accounts", ["id"])
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        for tid in (2, 3):
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=datetime(2024, 12, 1, 11, tid, 0), type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=datetime(2024, 12, 1, 11, tid, 0), type="UPDATE", status="",
+                query=f"UPDATE accounts SET balance=0 WHERE id={tid};",
+                previous_data=Rows([{'id': tid, 'balance': tid}], 1),
+                new_data=Rows([{'id': tid, 'balance': 0}], 1)
+            ))
+        frm._flush_memory_wal()
+        events = []
+
+        def crash_on_second_undo(item):
+            if sum(1 for event in events if event[0] == "apply") == 4:
+                raise RuntimeError("crash")
+            events.append(("apply", item[0]))
+
+        # Act
+        with patch("builtins.print"):
+            frm.recoverSystem(apply=crash_on_second_undo, progress_interval=1, online=True,
+                              sync=lambda: events.append(("sync",)))
+            frm.online_undo.join()
+        self._write_committed_update(frm, 4, 20, 150, 175)  # a new transaction while undo ran
+        restarted = FailureRecoveryManager(log_file=frm.log_file, checkpoint_scheduler=self.scheduler)
+        resumed = []
+        redo_query, online_undo = restarted.recoverSystem(apply=resumed.append, online=True)
+        online_undo.join()
+
+        # Assert
+        self.assertEqual(events[:6], [("apply", 1), ("sync",), ("apply", 2), ("sync",), ("apply", 3), ("sync",)])
+        self.assertEqual(redo_query, [[4, "UPDATE accounts SET balance=175 WHERE id=1;"]])
+        self.assertEqual(resumed, [
+            [4, "UPDATE accounts SET balance=175 WHERE id=1;"],
+            [2, "UPDATE accounts SET balance=2 WHERE id=2;"],
+        ])
+        self.assertFalse(os.path.exists(frm.log_file + ".recovery"))
+
+    def test_recoverSystem_online_undo_accepts_new_transactions(self):
+        """Test online recovery returns after REDO and rolls losers back in the background, holding their rows."""
+        # Arrange
+        frm = self._temp_manager()
+        frm.register_table_keys("accounts", ["id"])
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        for tid in (4, 5):
+            frm.write_log(ExecutionResult(
+                transaction_id=tid, timestamp=datetime(2024, 12, 1, 11, 0, tid), type="START", status="",
+                query=None, previous_data=None, new_data=None
+            ))
+        frm.write_log(ExecutionResult(
+            transaction_id=4, timestamp=datetime(2024, 12, 1, 11, 1, 0), type="UPDATE", status="",
+            query="UPDATE accounts SET balance=0 WHERE id=4;",
+            previous_data=Rows([{'id': 4, 'balance': 40}], 1),
+            new_data=Rows([{'id': 4, 'balance': 0}], 1)
+        ))
+        frm.save_checkpoint()
+        restarted = FailureRecoveryManager(log_file=frm.log_file, checkpoint_scheduler=self.scheduler)
+        release = threading.Event()
+        applied = []
+
+        def apply(item):
+            if item[1].startswith("UPDATE accounts SET balance=40"):
+                release.wait(5)  # undo of transaction 4 runs slowly
+            applied.append(item)
+
+        # Act
+        redo_query, online_undo = restarted.recoverSystem(apply=apply, online=True)
+        locked_during_undo = online_undo.row_locked("accounts", {'id': 4, 'balance': 0})
+        self._write_committed_update(restarted, 7, 30, 150, 160)  # a new transaction during the rollback
+        release.set()
+        finished = online_undo.join(5)
+
+        # Assert
+        self.assertIs(online_undo, restarted.online_undo)
+        self.assertEqual(redo_query, [])  # everything was logged before the checkpoint
+        self.assertTrue(locked_during_undo)
+        self.assertFalse(online_undo.row_locked("accounts", {'id': 1, 'balance': 150}))
+        self.assertTrue(finished)
+        self.assertIsNone(online_undo.error)
+        self.assertTrue(online_undo.wait_for_rows("accounts", [{'id': 4, 'balance': 0}], timeout=0))
+        self.assertEqual(online_undo.losers, [])
+        self.assertEqual(online_undo.undo_queries, [[4, "UPDATE accounts SET balance=40 WHERE id=4;"]])
+        self.assertEqual(restarted.undo_list, [])
+        logs, _ = restarted.read_log()
+        self.assertEqual(sorted(log.transaction_id for log in logs if log.type == "ABORT"), [4, 5])
+        self.assertEqual(restarted.recoverSystem()[1], [])  # nothing left to undo after another restart
+
+    def test_log_shipping_standby_promotes(self):
+        """Test the WAL is shipped to an archive across a seal, a standby replays it and promote() undoes in-flight work."""
+        # Arrange
+        frm = self._temp_manager()
+        frm.register_table_keys("accounts", ["id"])
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, True)
+        archiver = WALArchiver(frm, archive_dir)
+        applied = []
+        standby = WALStandby(archive_dir, applied.append)
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        frm.seal_segment()
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=datetime(2024, 12, 1, 11, 0, 0), type="UPDATE", status="",
+            query="UPDATE accounts SET balance=0 WHERE id=2;",
+            previous_data=Rows([{'id': 2, 'balance': 20}], 1),
+            new_data=Rows([{'id': 2, 'balance': 0}], 1)
+        ))
+        self._write_committed_update(frm, 3, 5, 150, 175)
+
+        # Act
+        shipped = archiver.ship()
+        replayed = standby.replay()
+        in_flight = standby.in_flight
+        archiver.stop()
+        promoted = standby.promote()
+        self._write_committed_update(promoted, 4, 10, 175, 180)
+
+        # Assert
+        self.assertEqual((shipped, replayed), (7, 7))
+        self.assertEqual(archiver.shipped_lsn, 7)
+        self.assertEqual(in_flight, [2])
+        self.assertEqual(applied, [
+            [1, "UPDATE accounts SET balance=150 WHERE id=1;"],
+            [2, "UPDATE accounts SET balance=0 WHERE id=2;"],
+            [3, "UPDATE accounts SET balance=175 WHERE id=1;"],
+            [2, "UPDATE accounts SET balance=20 WHERE id=2;"],
+        ])
+        self.assertTrue(standby.promoted)
+        logs, _ = promoted.read_log()
+        self.assertEqual([log.lsn for log in logs], list(range(11)))
+        self.assertEqual([log.type for log in logs[7:]], ["ABORT", "START", "UPDATE", "COMMIT"])
+        self.assertEqual(promoted.recoverSystem()[1], [])
+        promoted.checkpoint_scheduler.stop()
+
+    def test_log_shipping_standby_undoes_transaction_aborted_on_primary(self):
+        """Test a transaction aborted on the primary after shipping is undone on the standby when its ABORT arrives."""
+        # Arrange
+        frm = self._temp_manager()
+        frm.register_table_keys("accounts", ["id"])
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, True)
+        archiver = WALArchiver(frm, archive_dir)
+        applied, undone = [], []
+        standby = WALStandby(archive_dir, applied.append)
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=datetime(2024, 12, 1, 11, 0, 0), type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=datetime(2024, 12, 1, 11, 0, 1), type="INSERT", status="",
+            query="INSERT INTO accounts (id, balance) VALUES (2, 20);",
+            previous_data=Rows([], 0),
+            new_data=Rows([{'id': 2, 'balance': 20}], 1)
+        ))
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=datetime(2024, 12, 1, 11, 0, 2), type="UPDATE", status="",
+            query="UPDATE accounts SET balance=25 WHERE id=2;",
+            previous_data=Rows([{'id': 2, 'balance': 20}], 1),
+            new_data=Rows([{'id': 2, 'balance': 25}], 1)
+        ))
+        frm._flush_memory_wal()
+        archiver.ship()
+        standby.replay()
+        in_flight = standby.in_flight
+
+        # Act
+        undo_queries = frm.abort_transactions([2], apply=undone.append)
+        archiver.ship()
+        standby.replay()
+        archiver.stop()
+
+        # Assert
+        self.assertEqual(in_flight, [2])
+        self.assertEqual(undone, undo_queries)
+        logs, _ = frm.read_log()
+        self.assertEqual(logs[-1].type, "ABORT")
+        self.assertEqual(standby.in_flight, [])
+        self.assertEqual(applied, [
+            [2, "INSERT INTO accounts (id, balance) VALUES (2, 20);"],
+            [2, "UPDATE accounts SET balance=25 WHERE id=2;"],
+            [2, "UPDATE accounts SET balance=20 WHERE id=2;"],
+            [2, "DELETE FROM accounts WHERE id=2;"],
+        ])
+
+    def test_wal_archiver_resumes_at_lsn_of_log_started_after_truncation(self):
+        """Test an archive begun after truncate_wal labels its first LSN, and a new archiver on it resumes at the right record."""
+        # Arrange
+        storage_dir, snapshot_dir, archive_dir = (tempfile.mkdtemp() for _ in range(3))
+        for directory in (storage_dir, snapshot_dir, archive_dir):
+            self.addCleanup(shutil.rmtree, directory, True)
+        frm = FailureRecoveryManager(
+            log_file=self._temp_manager().log_file, snapshot_dir=snapshot_dir, storage_dir=storage_dir,
+            checkpoint_scheduler=CheckpointScheduler(),
+        )
+        with open(os.path.join(storage_dir, "accounts_table.bin"), "wb") as table_file:
+            table_file.write(b"A" * 4096)
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        frm.save_checkpoint()
+        frm.truncate_wal()
+        self._write_committed_update(frm, 2, 5, 150, 175)
+
+        # Act
+        first = WALArchiver(frm, archive_dir)
+        shipped = first.ship()
+        self._write_committed_update(frm, 3, 10, 175, 180)
+        resumed = WALArchiver(frm, archive_dir)
+        resumed_at = resumed.shipped_lsn
+        shipped_again = resumed.ship()
+
+        # Assert
+        self.assertEqual((first.start_lsn, shipped), (3, 4))
+        with open(os.path.join(archive_dir, WALArchiver.LABEL), "r") as label:
+            self.assertEqual(label.read(), "START_LSN=3\n")
+        self.assertEqual((resumed.start_lsn, resumed_at), (3, 7))
+        self.assertEqual(shipped_again, 3)
+        self.assertEqual(resumed.shipped_lsn, frm.next_lsn)
+        with open(os.path.join(archive_dir, "wal.log"), "r") as archive:
+            archived = [line.split(",", 2)[:2] for line in archive]
+        self.assertEqual(archived, [
+            ["CHECKPOINT", archived[0][1]], ["START", "2"], ["UPDATE", "2"], ["COMMIT", "2"],
+            ["START", "3"], ["UPDATE", "3"], ["COMMIT", "3"],
+        ])
+
+    def test_truncate_wal_keeps_records_not_archived_yet(self):
+        """Test truncate_wal stops at the records a WALArchiver has not shipped, so the archive has no gap."""
+        # Arrange
+        storage_dir, snapshot_dir, archive_dir = (tempfile.mkdtemp() for _ in range(3))
+        for directory in (storage_dir, snapshot_dir, archive_dir):
+            self.addCleanup(shutil.rmtree, directory, True)
+        frm = FailureRecoveryManager(
+            log_file=self._temp_manager().log_file, snapshot_dir=snapshot_dir, storage_dir=storage_dir,
+            checkpoint_scheduler=CheckpointScheduler(),
+        )
+        with open(os.path.join(storage_dir, "accounts_table.bin"), "wb") as table_file:
+            table_file.write(b"A" * 4096)
+        archiver = WALArchiver(frm, archive_dir)
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        archiver.ship()
+        self._write_committed_update(frm, 2, 5, 150, 175)
+        frm.save_checkpoint()
+
+        # Act
+        dropped = frm.truncate_wal()
+        shipped = archiver.ship()
+
+        # Assert
+        self.assertEqual(frm.snapshots.start_lsn, 6)
+        self.assertEqual(dropped, 3)  # records 3 to 5 were not shipped yet
+        logs, _ = frm.read_log()
+        self.assertEqual(logs[0].lsn, 3)
+        self.assertEqual(shipped, 4)
+        self.assertEqual(archiver.shipped_lsn, frm.next_lsn)
+        with open(os.path.join(archive_dir, "wal.log"), "r") as archive:
+            self.assertEqual(sum(1 for _ in archive), 7)
+
+    def test_base_backup_restores_with_redo_over_recorded_range(self):
+        """Test a hot base backup keeps the WAL range that makes its copy consistent and restore replays it."""
+        # Arrange
+        frm = self._temp_manager()
+        frm.register_table_keys("accounts", ["id"])
+        storage_dir, backup_dir, restore_dir = tempfile.mkdtemp(), tempfile.mkdtemp(), tempfile.mkdtemp()
+        for directory in (storage_dir, backup_dir, restore_dir):
+            self.addCleanup(shutil.rmtree, directory, True)
+        with open(os.path.join(storage_dir, "accounts_table.bin"), "wb") as table_file:
+            table_file.write(b"\x01" * 4096)
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=datetime(2024, 12, 1, 11, 0, 0), type="START", status="",
+            query=None, previous_data=None, new_data=None
+        ))
+        frm.write_log(ExecutionResult(
+            transaction_id=2, timestamp=datetime(2024, 12, 1, 11, 0, 1), type="UPDATE", status="",
+            query="UPDATE accounts SET balance=0 WHERE id=2;",
+            previous_data=Rows([{'id': 2, 'balance': 20}], 1),
+            new_data=Rows([{'id': 2, 'balance': 0}], 1)
+        ))
+        copy_file = base_backup_module.copy_file
+
+        def copy_while_writing(source, destination):
+            self._write_committed_update(frm, 3, 5, 150, 175)  # commits during the copy
+            return copy_file(source, destination)
+
+        # Act
+        with patch.object(base_backup_module, "copy_file", side_effect=copy_while_writing):
+            backup = BaseBackup.take(frm, backup_dir, storage_dir)
+        self._write_committed_update(frm, 4, 10, 175, 180)  # after the backup
+        applied = []
+        redo, undo = backup.restore(applied.append, restore_dir)
+
+        # Assert
+        self.assertEqual((backup.start_lsn, backup.checkpoint_lsn, backup.end_lsn), (3, 5, 9))
+        self.assertEqual(list(backup.files), ["accounts_table.bin"])
+        self.assertIn(backup.files["accounts_table.bin"], ("reflink", "copy_file_range", "copy"))
+        self.assertTrue(os.path.exists(os.path.join(backup_dir, BaseBackup.LABEL)))
+        with open(os.path.join(restore_dir, "accounts_table.bin"), "rb") as table_file:
+            self.assertEqual(table_file.read(), b"\x01" * 4096)
+        self.assertEqual(redo, [[3, "UPDATE accounts SET balance=175 WHERE id=1;"]])
+        self.assertEqual(undo, [[2, "UPDATE accounts SET balance=20 WHERE id=2;"]])
+        self.assertEqual(applied, redo + undo)
+
+    def test_snapshot_checkpoints_image_dirty_tables_and_truncate_wal(self):
+        """Test checkpoints image dirty tables in the background and the snapshot lets old WAL be dropped."""
+        # Arrange
+        storage_dir, snapshot_dir, backup_dir, restore_dir = (tempfile.mkdtemp() for _ in range(4))
+        for directory in (storage_dir, snapshot_dir, backup_dir, restore_dir):
+            self.addCleanup(shutil.rmtree, directory, True)
+        fd, path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.addCleanup(shutil.rmtree, path + ".segments", True)
+        frm = FailureRecoveryManager(
+            log_file=path, snapshot_dir=snapshot_dir, storage_dir=storage_dir,
+            checkpoint_scheduler=CheckpointScheduler(),
+        )
+        for table, content in (("accounts", b"A"), ("orders", b"O")):
+            with open(os.path.join(storage_dir, f"{table}_table.bin"), "wb") as table_file:
+                table_file.write(content * 4096)
+        self._write_committed_update(frm, 1, 0, 100, 150)
+        for record_type in ("START", "UPDATE", "COMMIT"):
+            frm.write_log(ExecutionResult(
+                transaction_id=2, timestamp=datetime(2024, 12, 1, 10, 1, 0), type=record_type, status="",
+                query="UPDATE orders SET total=5 WHERE id=1;" if record_type == "UPDATE" else None,
+                previous_data=Rows([{'id': 1, 'total': 0}], 1) if record_type == "UPDATE" else None,
+                new_data=Rows([{'id': 1, 'total': 5}], 1) if record_type == "UPDATE" else None
+            ))
+
+        # Act
+        frm.save_checkpoint()
+        frm.snapshots.wait()
+        first = (frm.snapshots.checkpoint_lsn, frm.snapshots.start_lsn, dict(frm.snapshots.tables))
+        with open(os.path.join(storage_dir, "accounts_table.bin"), "wb") as table_file:
+            table_file.write(b"B" * 4096)
+        self._write_committed_update(frm, 3, 5, 150, 175)
+        frm.save_checkpoint()
+        dropped = frm.truncate_wal()
+        restarted = FailureRecoveryManager(log_file=path, checkpoint_scheduler=CheckpointScheduler())
+        reopened = TableSnapshot(snapshot_dir, storage_dir)
+        backup = BaseBackup.from_snapshot(frm, backup_dir)
+        backup.restore(lambda item: None, restore_dir)
+
+        # Assert
+        self.assertEqual(first[:2], (6, 6))
+        self.assertEqual(sorted(first[2]), ["accounts_table.bin", "orders_table.bin"])
+        self.assertEqual((reopened.checkpoint_lsn, reopened.start_lsn), (10, 10))
+        self.assertEqual(reopened.tables["orders_table.bin"], "link")
+        self.assertEqual(os.listdir(snapshot_dir), [f"{10:020d}"])
+        self.assertEqual(dropped, 10)
+        logs, _ = frm.read_log()
+        self.assertEqual([log.lsn for log in logs], [10])
+        self.assertEqual(restarted.next_lsn, 11)
+        self.assertEqual(frm.recoverSystem(), ([], []))
+        with open(os.path.join(restore_dir, "accounts_table.bin"), "rb") as table_file:
+            self.assertEqual(table_file.read(), b"B" * 4096)
+        with open(os.path.join(restore_dir, "orders_table.bin"), "rb") as table_file:
+            self.assertEqual(table_file.read(), b"O" * 4096)
+
 if __name__ == "__main__":
     unittest.main(testRunner=ColoredTextTestRunner())